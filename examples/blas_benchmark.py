@@ -0,0 +1,70 @@
+import sys
+import time
+
+import numpy as np
+
+import parakeet
+
+from parakeet import compile_cache, config
+
+# Compare Parakeet with and without calls into BLAS (and NumPy) on matrix
+# products, matrix-vector products and dot products. Pass the sizes of the
+# matrices as arguments to override the default sizes,
+# i.e. "python blas_benchmark.py 500 1000"
+
+def dot(x, y):
+  return parakeet.sum(x * y)
+
+def matmult(X, Y):
+  return parakeet.allpairs(dot, X, Y)
+
+def matvec(X, v):
+  return parakeet.each(lambda x: dot(x, v), X)
+
+def best_time(fn, args, repeat = 3):
+  times = []
+  for _ in xrange(repeat):
+    start = time.time()
+    fn(*args)
+    times.append(time.time() - start)
+  return min(times)
+
+def parakeet_time(fn, args, use_blas):
+  config.opt_blas = use_blas
+  # drop the code compiled with the other setting
+  compile_cache.clear()
+  jit_fn = parakeet.jit(fn)
+  result = jit_fn(*args)
+  return result, best_time(jit_fn, args)
+
+def compare(name, fn, numpy_fn, args):
+  numpy_time = best_time(numpy_fn, args)
+  expected = numpy_fn(*args)
+  loop_result, loop_time = parakeet_time(fn, args, False)
+  blas_result, blas_time = parakeet_time(fn, args, True)
+  assert np.allclose(loop_result, expected, rtol = 1e-3)
+  assert np.allclose(blas_result, expected, rtol = 1e-3)
+  print "  %-8s NumPy %8.4fs, compiled loops %8.4fs, " \
+        "BLAS %8.4fs (%.2fX faster than loops)" % \
+        (name, numpy_time, loop_time, blas_time, loop_time / blas_time)
+
+def run(n):
+  saved = config.opt_blas
+  print "n = %d" % n
+  for dtype in ('float32', 'float64'):
+    print " %s" % dtype
+    X = np.random.randn(n, n).astype(dtype)
+    Y = np.random.randn(n, n).astype(dtype)
+    v = np.random.randn(n).astype(dtype)
+    compare("matmult", matmult, lambda X, Y: np.dot(X, Y.T), [X, Y])
+    compare("matvec", matvec, np.dot, [X, v])
+    compare("dot", dot, np.dot, [X[0], v])
+  config.opt_blas = saved
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    sizes = [int(arg) for arg in sys.argv[1:]]
+  else:
+    sizes = [100, 500, 1000]
+  for n in sizes:
+    run(n)
@@ -0,0 +1,53 @@
+import time
+
+import numpy as np
+
+import parakeet
+from parakeet import jit
+
+# Measure how long it takes to get in and out of compiled code for kernels
+# which do almost no work, so that the per-call overhead of Parakeet's
+# dispatch (type conversion, specialization lookups, argument marshalling)
+# dominates the timing.
+
+def add_scalars(x, y):
+  return x + y
+
+def first_elt(x):
+  return x[0]
+
+def add_arrays(x, y):
+  return x + y
+
+def time_calls(fn, args, n_calls = 100000):
+  # first call compiles the function, don't count it
+  fn(*args)
+  start = time.time()
+  for _ in xrange(n_calls):
+    fn(*args)
+  return (time.time() - start) / n_calls
+
+def compare_overhead(name, python_fn, args, n_calls = 100000):
+  parakeet_fn = jit(python_fn)
+
+  parakeet.config.dispatch_cache = False
+  uncached = time_calls(parakeet_fn, args, n_calls / 10)
+
+  parakeet.config.dispatch_cache = True
+  cached = time_calls(parakeet_fn, args, n_calls)
+
+  python = time_calls(python_fn, args, n_calls)
+
+  print "%s:" % name
+  print "  Parakeet (no dispatch cache) : %8.2fus / call" % (uncached * 10**6)
+  print "  Parakeet (dispatch cache)    : %8.2fus / call" % (cached * 10**6)
+  print "  Python                       : %8.2fus / call" % (python * 10**6)
+
+if __name__ == '__main__':
+  compare_overhead("scalar add", add_scalars, [1, 2])
+  compare_overhead("scalar add (float)", add_scalars, [1.0, 2.0])
+  small_vec = np.arange(10, dtype = 'float64')
+  compare_overhead("index small vector", first_elt, [small_vec])
+  compare_overhead("add small vectors", add_arrays, [small_vec, small_vec])
+  small_mat = np.ones((4,4), dtype = 'int32')
+  compare_overhead("add small matrices", add_arrays, [small_mat, small_mat])
@@ -0,0 +1,52 @@
+import sys
+import time
+
+import numpy as np
+
+import parakeet
+
+# Compare Parakeet's cumsum, with and without the parallel blocked scan,
+# against NumPy. Pass the number of elements as arguments to override the
+# default sizes, i.e. "python cumsum_benchmark.py 1000000 10000000"
+
+def parakeet_cumsum(x):
+  return parakeet.cumsum(x)
+
+def best_time(fn, x, repeat = 3):
+  times = []
+  for _ in xrange(repeat):
+    start = time.time()
+    fn(x)
+    times.append(time.time() - start)
+  return min(times)
+
+def compare(n):
+  x = np.random.randn(n)
+  numpy_time = best_time(np.cumsum, x)
+
+  parakeet.config.parallel_outer_adverbs = False
+  serial_fn = parakeet.jit(parakeet_cumsum)
+  assert np.allclose(serial_fn(x), np.cumsum(x))
+  serial_time = best_time(serial_fn, x)
+
+  parakeet.config.parallel_outer_adverbs = True
+  parallel_fn = parakeet.jit(parakeet_cumsum)
+  assert np.allclose(parallel_fn(x), np.cumsum(x))
+  parallel_time = best_time(parallel_fn, x)
+  parakeet.config.parallel_outer_adverbs = False
+
+  print "n = %d" % n
+  print "  NumPy             : %8.4fs" % numpy_time
+  print "  Parakeet serial   : %8.4fs (%.2fX)" % \
+        (serial_time, numpy_time / serial_time)
+  print "  Parakeet parallel : %8.4fs (%.2fX), %d threads" % \
+        (parallel_time, numpy_time / parallel_time,
+         parakeet.parallel_runtime.num_threads())
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    sizes = [int(arg) for arg in sys.argv[1:]]
+  else:
+    sizes = [10**6, 10**7, 10**8]
+  for n in sizes:
+    compare(n)
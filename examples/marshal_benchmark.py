@@ -0,0 +1,53 @@
+import time
+
+import numpy as np
+
+from parakeet import jit, run_function, type_conv
+
+# Measure how many array arguments per second get converted into the ctypes
+# structs passed to compiled code, comparing freshly built structs with the
+# per-thread structs that compiled functions reuse between calls, and how
+# long a whole call takes for a kernel which does no real work.
+
+def first_elt(x):
+  return x[0]
+
+def sum_first_elts(a, b, c, d):
+  return a[0] + b[0] + c[0] + d[0]
+
+def time_per_call(fn, n_calls):
+  start = time.time()
+  for _ in xrange(n_calls):
+    fn()
+  return (time.time() - start) / n_calls
+
+def compare_conversion(name, x, n_calls = 100000):
+  t = type_conv.typeof(x)
+  fresh = run_function.input_converter(t, reuse_structs = False)
+  reused = run_function.input_converter(t)
+  fresh_time = time_per_call(lambda: fresh(x), n_calls)
+  reused_time = time_per_call(lambda: reused(x), n_calls)
+  print "%s:" % name
+  print "  fresh structs  : %8.2fus / arg  (%10.0f args/s)" % \
+        (fresh_time * 10**6, 1.0 / fresh_time)
+  print "  reused structs : %8.2fus / arg  (%10.0f args/s)" % \
+        (reused_time * 10**6, 1.0 / reused_time)
+
+def time_calls(name, python_fn, args, n_calls = 100000):
+  parakeet_fn = jit(python_fn)
+  # first call compiles the function, don't count it
+  parakeet_fn(*args)
+  elapsed = time_per_call(lambda: parakeet_fn(*args), n_calls)
+  print "%s: %8.2fus / call" % (name, elapsed * 10**6)
+
+if __name__ == '__main__':
+  vec = np.arange(10, dtype = 'float64')
+  mat = np.ones((4,4), dtype = 'int32')
+  cube = np.ones((2,3,4), dtype = 'float32')
+  compare_conversion("1D array", vec)
+  compare_conversion("2D array", mat)
+  compare_conversion("3D array", cube)
+  compare_conversion("strided 2D view", mat[::2, 1:])
+  compare_conversion("list", range(10), n_calls = 10000)
+  time_calls("call with 1 array arg", first_elt, [vec])
+  time_calls("call with 4 array args", sum_first_elts, [vec, vec, vec, vec])
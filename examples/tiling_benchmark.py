@@ -0,0 +1,81 @@
+import sys
+import time
+
+import numpy as np
+
+import parakeet
+
+from parakeet import compile_cache, config
+
+# Compare Parakeet with and without cache-blocked tiling of all-pairs
+# adverbs (and NumPy) on matrix multiplication and all-pairs distances.
+# Pass the number of rows as arguments to override the default sizes,
+# i.e. "python tiling_benchmark.py 500 2000"
+
+def dot(x, y):
+  return parakeet.sum(x * y)
+
+def matmult(X, Y):
+  return parakeet.allpairs(dot, X, Y)
+
+def nested_matmult(X, Y):
+  return parakeet.each(lambda x: parakeet.each(lambda y: dot(x, y), Y), X)
+
+def sqr_dist(x, y):
+  return parakeet.sum((x - y) ** 2)
+
+def dists(X, Y):
+  return parakeet.allpairs(sqr_dist, X, Y)
+
+def np_matmult(X, Y):
+  return np.dot(X, Y.T)
+
+def np_dists(X, Y):
+  return (X ** 2).sum(axis = 1)[:, np.newaxis] - 2 * np.dot(X, Y.T) + \
+         (Y ** 2).sum(axis = 1)[np.newaxis, :]
+
+def best_time(fn, args, repeat = 3):
+  times = []
+  for _ in xrange(repeat):
+    start = time.time()
+    fn(*args)
+    times.append(time.time() - start)
+  return min(times)
+
+def parakeet_time(fn, args, tiling):
+  config.opt_tiling = tiling
+  # drop the code compiled with the other setting
+  compile_cache.clear()
+  jit_fn = parakeet.jit(fn)
+  result = jit_fn(*args)
+  return result, best_time(jit_fn, args)
+
+def compare(name, fn, numpy_fn, args):
+  numpy_time = best_time(numpy_fn, args)
+  expected = numpy_fn(*args)
+  untiled_result, untiled_time = parakeet_time(fn, args, False)
+  tiled_result, tiled_time = parakeet_time(fn, args, True)
+  assert np.allclose(untiled_result, expected)
+  assert np.allclose(tiled_result, expected)
+  print "  %-14s NumPy %8.4fs, untiled %8.4fs, " \
+        "tiled %8.4fs (%.2fX faster than untiled)" % \
+        (name, numpy_time, untiled_time, tiled_time,
+         untiled_time / tiled_time)
+
+def run(n, d = 256):
+  saved = config.opt_tiling
+  print "%d x %d rows of %d elements" % (n, n, d)
+  X = np.random.randn(n, d)
+  Y = np.random.randn(n, d)
+  compare("matmult", matmult, np_matmult, [X, Y])
+  compare("nested maps", nested_matmult, np_matmult, [X, Y])
+  compare("distances", dists, np_dists, [X, Y])
+  config.opt_tiling = saved
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    sizes = [int(arg) for arg in sys.argv[1:]]
+  else:
+    sizes = [250, 1000, 2000]
+  for n in sizes:
+    run(n)
@@ -0,0 +1,71 @@
+import sys
+import time
+
+import numpy as np
+
+import parakeet
+
+from parakeet import compile_cache, config
+
+# Compare Parakeet with and without the SIMD Vectorize transform (and NumPy)
+# on sums, dot products and an elementwise map. Pass the number of elements
+# as arguments to override the default sizes,
+# i.e. "python vectorize_benchmark.py 1000000 10000000"
+
+def sum_fn(x):
+  return parakeet.sum(x)
+
+def dot_fn(x, y):
+  return parakeet.sum(x * y)
+
+def saxpy_fn(a, x, y):
+  return a * x + y
+
+def best_time(fn, args, repeat = 5):
+  times = []
+  for _ in xrange(repeat):
+    start = time.time()
+    fn(*args)
+    times.append(time.time() - start)
+  return min(times)
+
+def parakeet_time(fn, args, vectorize):
+  config.opt_vectorize = vectorize
+  # drop the code compiled with the other setting
+  compile_cache.clear()
+  jit_fn = parakeet.jit(fn)
+  result = jit_fn(*args)
+  return result, best_time(jit_fn, args)
+
+def compare(name, fn, numpy_fn, args):
+  numpy_time = best_time(numpy_fn, args)
+  expected = numpy_fn(*args)
+  scalar_result, scalar_time = parakeet_time(fn, args, False)
+  vector_result, vector_time = parakeet_time(fn, args, True)
+  assert np.allclose(scalar_result, expected)
+  assert np.allclose(vector_result, expected)
+  print "  %-8s NumPy %8.4fs, scalar loops %8.4fs, " \
+        "vectorized %8.4fs (%.2fX faster than scalar)" % \
+        (name, numpy_time, scalar_time, vector_time,
+         scalar_time / vector_time)
+
+def run(n):
+  saved = config.opt_vectorize
+  print "n = %d" % n
+  for dtype in ('float32', 'float64', 'int32', 'int64'):
+    print " %s" % dtype
+    x = (np.random.randn(n) * 10).astype(dtype)
+    y = (np.random.randn(n) * 10).astype(dtype)
+    a = x.dtype.type(3)
+    compare("sum", sum_fn, np.sum, [x])
+    compare("dot", dot_fn, np.dot, [x, y])
+    compare("saxpy", saxpy_fn, lambda a, x, y: a * x + y, [a, x, y])
+  config.opt_vectorize = saved
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    sizes = [int(arg) for arg in sys.argv[1:]]
+  else:
+    sizes = [10**5, 10**6, 10**7]
+  for n in sizes:
+    run(n)
@@ -4,22 +4,31 @@ from lib import *
 
 modules = [
   "adverb_helpers",
+  "adverb_patterns",
   "adverb_semantics",
   "adverb_wrapper",
   "adverbs",
   "args",
+  "aot",
   "array_type",
   "ast_conversion",
+  "autotune",
+  "background",
+  "blas",
+  "blas_dispatch",
   "c_function",
   "clone_function",
   "closure_type",
   "codegen",
   "collect_vars",
   "common",
+  "compile_cache",
+  "compile_profiler",
   "config",
   "copy_elimination",
   "core_types",
   "dead_code_elim",
+  "disk_cache",
   "dtypes",
   "flow_analysis",
   "function_registry",
@@ -34,6 +43,8 @@ modules = [
   "llvm_helpers",
   "llvm_prims",
   "llvm_types",
+  "loop_fusion",
+  "loop_profiler",
   "lower_adverbs",
   "lower_indexing",
   "lower_structs",
@@ -46,12 +57,15 @@ modules = [
   "nested_blocks",
   "node",
   "optimize",
+  "parallel_adverbs",
+  "parallel_runtime",
   "prims",
   "python_ref",
   "rewrite_typed",
   "run_function",
   "scoped_dict",
   "scoped_set",
+  "serialization",
   "shape_codegen",
   "shape_eval",
   "shape_from_type",
@@ -71,5 +85,6 @@ modules = [
   "type_conv_decls",
   "type_inference",
   "use_analysis",
+  "vectorize",
   "verify"
 ]
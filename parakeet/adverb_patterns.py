@@ -0,0 +1,189 @@
+"""
+Recognizers for a few common shapes of adverb code which some transforms
+replace wholesale: maps of maps which are really all-pairs computations and
+functions which compute a dot product.
+"""
+
+import prims
+import syntax_helpers
+
+from syntax import Assign, Call, Cast, Closure, Comment, Const, Index, Map
+from syntax import PrimCall, Reduce, Return, TypedFn, Var
+from transform import Transform
+
+def fn_and_closure_args(fn):
+  if fn.__class__ is Closure:
+    return fn.fn, tuple(fn.args)
+  return fn, ()
+
+def straight_line_env(fn):
+  """
+  Expressions bound to each variable of a function without any control flow
+  and the expression it returns, or (None, None) if it has branches or loops
+  """
+
+  env = {}
+  for stmt in fn.body:
+    c = stmt.__class__
+    if c is Assign and stmt.lhs.__class__ is Var:
+      env[stmt.lhs.name] = stmt.rhs
+    elif c is Return:
+      return env, stmt.value
+    elif c is not Comment:
+      break
+  return None, None
+
+def resolve(expr, env):
+  """Follow variables back to the expressions which computed them"""
+
+  while expr.__class__ is Var and expr.name in env:
+    expr = env[expr.name]
+  return expr
+
+def prim_call(expr, env):
+  """
+  The primitive applied by a PrimCall (or a call to a function which just
+  wraps a primitive) along with its resolved arguments
+  """
+
+  expr = resolve(expr, env)
+  if expr.__class__ is PrimCall:
+    prim = expr.prim
+  elif expr.__class__ is Call and expr.fn.__class__ is TypedFn:
+    prim = prim_fn(expr.fn)
+  else:
+    prim = None
+  if prim is None:
+    return None, None
+  return prim, [resolve(arg, env) for arg in expr.args]
+
+def prim_fn(fn):
+  """The primitive a function applies to its arguments, i.e. add for a sum"""
+
+  if fn.__class__ is not TypedFn:
+    return None
+  env, result = straight_line_env(fn)
+  if result is None:
+    return None
+  prim, args = prim_call(result, env)
+  if prim is None or len(args) != len(fn.arg_names) or \
+     any(arg.__class__ is not Var for arg in args) or \
+     sorted(arg.name for arg in args) != sorted(fn.arg_names):
+    return None
+  return prim
+
+def is_identity_fn(fn):
+  if fn.__class__ is not TypedFn or len(fn.arg_names) != 1:
+    return False
+  env, result = straight_line_env(fn)
+  if result is None:
+    return False
+  result = resolve(result, env)
+  return result.__class__ is Var and result.name == fn.arg_names[0]
+
+def is_zero(expr):
+  while expr.__class__ is Cast:
+    expr = expr.value
+  return expr is None or syntax_helpers.is_none(expr) or \
+      (expr.__class__ is Const and expr.value == 0)
+
+def dot_product_operands(expr, env):
+  """
+  If the expression is a Reduce computing sum(x * y), the expressions for x
+  and y, otherwise None
+  """
+
+  expr = resolve(expr, env)
+  if expr.__class__ is not Reduce or prim_fn(expr.combine) != prims.add or \
+     not is_zero(expr.init):
+    return None
+  if len(expr.args) == 2 and prim_fn(expr.fn) == prims.multiply:
+    operands = expr.args
+  elif len(expr.args) == 1 and is_identity_fn(expr.fn):
+    products = resolve(expr.args[0], env)
+    if products.__class__ is not Map or len(products.args) != 2 or \
+       prim_fn(products.fn) != prims.multiply:
+      return None
+    operands = products.args
+  else:
+    return None
+  return tuple(resolve(arg, env) for arg in operands)
+
+def dot_product_args(fn):
+  """
+  Names of the two (distinct) arguments x and y of a function which returns
+  sum(x * y), or None if it computes something else
+  """
+
+  if fn.__class__ is not TypedFn:
+    return None
+  env, result = straight_line_env(fn)
+  if result is None:
+    return None
+  operands = dot_product_operands(result, env)
+  if operands is None:
+    return None
+  x, y = operands
+  if x.__class__ is not Var or y.__class__ is not Var or x.name == y.name or \
+     x.name not in fn.arg_names or y.name not in fn.arg_names:
+    return None
+  return x.name, y.name
+
+def nested_map(expr):
+  """
+  If the Map is of the form map(lambda x: map(lambda y: f(x, y), Y), X),
+  return f, the values it closes over (other than x), and Y, so that it can
+  be evaluated as allpairs(f, X, Y)
+  """
+
+  if expr.__class__ is not Map or len(expr.args) != 1 or \
+     syntax_helpers.unwrap_constant(expr.axis) != 0:
+    return None
+  outer_fn, outer_elts = fn_and_closure_args(expr.fn)
+  if outer_fn.__class__ is not TypedFn:
+    return None
+  n_outer = len(outer_elts)
+  if len(outer_fn.arg_names) != n_outer + 1:
+    return None
+  x_name = outer_fn.arg_names[-1]
+  outer_values = dict(zip(outer_fn.arg_names[:n_outer], outer_elts))
+
+  env, result = straight_line_env(outer_fn)
+  if result is None:
+    return None
+  inner = resolve(result, env)
+  if inner.__class__ is not Map or len(inner.args) != 1 or \
+     syntax_helpers.unwrap_constant(inner.axis) != 0:
+    return None
+  y = inner.args[0]
+  if y.__class__ is not Var or y.name not in outer_values:
+    return None
+
+  # the inner function may only close over constants, values
+  # from outside the outer map and (last) the outer element
+  if inner.fn.__class__ is not Closure or len(inner.fn.args) == 0:
+    return None
+  last = inner.fn.args[-1]
+  if last.__class__ is not Var or last.name != x_name:
+    return None
+  elts = []
+  for elt in inner.fn.args[:-1]:
+    if elt.__class__ is Const:
+      elts.append(elt)
+    elif elt.__class__ is Var and elt.name in outer_values:
+      elts.append(outer_values[elt.name])
+    else:
+      return None
+  return inner.fn.fn, elts, outer_values[y.name]
+
+class WholeArrayAdverbs(object):
+  """
+  Mixin for transforms which replace adverbs computing entire arrays, it
+  leaves alone adverbs writing into part of another array since those are
+  already a piece of some larger computation
+  """
+
+  def transform_Assign(self, stmt):
+    if stmt.lhs.__class__ is Index:
+      return stmt
+    return Transform.transform_Assign(self, stmt)
@@ -55,15 +55,16 @@ class AdverbSemantics(object):
     axis_sizes = self.sizes_along_axis(xs, axis)
     return axis_sizes[0], self.delay_list(xs, axis)
 
-  def acc_prelude(self, init, combine, delayed_map_result):
-    zero = self.int(0)
+  def acc_prelude(self, init, combine, delayed_map_result, first_idx = None):
+    if first_idx is None:
+      first_idx = self.int(0)
     if init is None or self.is_none(init):
-      return delayed_map_result(zero)
+      return delayed_map_result(first_idx)
     else:
       # combine the provided initializer with
       # transformed first value of the data
       # in case we need to coerce up
-      return self.invoke(combine, [init, delayed_map_result(zero)])
+      return self.invoke(combine, [init, delayed_map_result(first_idx)])
 
   def create_result(self, elt_type, inner_shape, outer_shape):
     if not self.is_tuple(outer_shape):
@@ -99,30 +100,41 @@ class AdverbSemantics(object):
       output_indices = self.tuple([output_idx])
     return self.index(output, output_indices)
 
-  def eval_map(self, f, values, axis, output = None):
+  def eval_map(self, f, values, axis, output = None, start = None, stop = None):
     niters, delayed_elts = self.map_prelude(f, values, axis)
     zero = self.int(0)
-    first_elts = self.force_list(delayed_elts, zero)
     if output is None:
+      first_elts = self.force_list(delayed_elts, zero)
       output = self.create_output_array(f, first_elts, niters)
+    if start is None:
+      start = zero
+    if stop is None:
+      stop = niters
     def loop_body(idx):
       output_indices = self.build_slice_indices(self.rank(output), 0, idx)
       elt_result = self.invoke(f, [elt(idx) for elt in delayed_elts])
       self.setidx(output, output_indices, elt_result)
-    self.loop(zero, niters, loop_body)
+    self.loop(start, stop, loop_body)
     return output
 
-  def eval_reduce(self, map_fn, combine, init, values, axis):
-    zero = self.int(0)
-    one = self.int(1)
-    
+  def eval_reduce(self, map_fn, combine, init, values, axis,
+                  start = None, stop = None):
+    """
+    If given, 'start' and 'stop' restrict the reduction to a range of indices
+    along the axis, leaving the parallel runtime to combine the partial results
+    """
+
     if axis is  None or self.is_none(axis):
       assert len(values) == 1
       values = [self.ravel(values[0])]
       axis = 0
     
     niters, delayed_elts = self.map_prelude(map_fn, values, axis)
-    first_acc_value = self.invoke(map_fn, [elt(zero) for elt in delayed_elts])
+    if start is None:
+      start = self.int(0)
+    if stop is None:
+      stop = niters
+    first_acc_value = self.invoke(map_fn, [elt(start) for elt in delayed_elts])
     if init is None or self.is_none(init):
       init = first_acc_value
     else:
@@ -131,37 +143,50 @@ class AdverbSemantics(object):
       elt = self.invoke(map_fn, [elt(idx) for elt in delayed_elts])
       new_acc_value = self.invoke(combine, [acc.get(), elt])
       acc.update(new_acc_value)
-    return self.accumulate_loop(one, niters, loop_body, init)
+    return self.accumulate_loop(self.add(start, self.int(1)), stop, loop_body,
+                                init)
 
-  def eval_scan(self, map_fn, combine, emit, init, values, axis):
+  def eval_scan(self, map_fn, combine, emit, init, values, axis,
+                output = None, start = None, stop = None):
+    """
+    To let the parallel runtime rescan a block of the input, 'start' and 'stop'
+    can restrict the scan to a range of indices, with 'init' standing in for
+    the accumulated value of all the elements before 'start'
+    """
 
     niters, delayed_elts = self.map_prelude(map_fn, values, axis)
+    if start is None:
+      start = self.int(0)
+    if stop is None:
+      stop = niters
     def delayed_map_result(idx):
       return self.invoke(map_fn, self.force_list(delayed_elts, idx))
-    init = self.acc_prelude(init, combine, delayed_map_result)
-    output = self.create_output_array(emit, [init], niters)
-    self.setidx(output, self.int(0), self.invoke(emit, [init]))
+    init = self.acc_prelude(init, combine, delayed_map_result, start)
+    if output is None:
+      output = self.create_output_array(emit, [init], niters)
+    self.setidx(output, start, self.invoke(emit, [init]))
     def loop_body(acc, idx):
       output_indices = self.build_slice_indices(self.rank(output), 0, idx)
       new_acc_value = self.invoke(combine, [acc.get(), delayed_map_result(idx)])
       acc.update(new_acc_value)
       output_value = self.invoke(emit, [new_acc_value])
       self.setidx(output, output_indices, output_value)
-    self.accumulate_loop(self.int(1), niters, loop_body, init)
+    self.accumulate_loop(self.add(start, self.int(1)), stop, loop_body, init)
     return output
 
-  def eval_allpairs(self, fn, x, y, axis):
+  def eval_allpairs(self, fn, x, y, axis, output = None):
     if axis is None: 
       x = self.ravel(x)
       y = self.ravel(y)
       axis = 0
     nx = self.size_along_axis(x, axis)
     ny = self.size_along_axis(y, axis)
-    outer_shape = self.tuple( [nx, ny] )
     zero = self.int(0)
-    first_x = self.slice_along_axis(x, axis, zero)
-    first_y = self.slice_along_axis(y, axis, zero)
-    output =  self.create_output_array(fn, [first_x, first_y], outer_shape)
+    if output is None:
+      outer_shape = self.tuple( [nx, ny] )
+      first_x = self.slice_along_axis(x, axis, zero)
+      first_y = self.slice_along_axis(y, axis, zero)
+      output =  self.create_output_array(fn, [first_x, first_y], outer_shape)
     def outer_loop_body(i):
       xi = self.slice_along_axis(x, axis, i)
       def inner_loop_body(j):
@@ -172,13 +197,17 @@ class AdverbSemantics(object):
     self.loop(zero, nx, outer_loop_body)
     return output
   
-  def eval_index_map(self, fn, shape, output = None): 
+  def eval_index_map(self, fn, shape, output = None, start = None, stop = None):
     dims = self.tuple_elts(shape)
     if len(dims) == 1:
       shape = dims[0]
       
     if output is None:
       output = self.create_output_array(fn, [shape], shape)
+    if start is None:
+      start = self.int(0)
+    if stop is None:
+      stop = dims[0]
 
     n_loops = len(dims)
     def build_loops(index_vars = ()):
@@ -193,7 +222,10 @@ class AdverbSemantics(object):
       else:
         def loop_body(idx):
           build_loops(index_vars + (idx,))
-        self.loop(self.int(0), dims[n_indices], loop_body)
+        if n_indices == 0:
+          self.loop(start, stop, loop_body)
+        else:
+          self.loop(self.int(0), dims[n_indices], loop_body)
     build_loops()
     return output 
     
@@ -205,41 +237,76 @@ class AdverbSemantics(object):
     self.loop(zero, niters, loop_body)
     return output
     """
-  def eval_index_reduce(self, fn, combine, shape, init = None):
+  def eval_parfor(self, fn, shape, start = None, stop = None):
+    """
+    Evaluate the function at every index of the shape for its side effects.
+    If given, 'start' and 'stop' restrict the range of the outermost index,
+    which lets the parallel runtime split a ParFor into chunks.
+    """
 
     dims = self.tuple_elts(shape)
     n_loops = len(dims)
-    
-    zero = self.int(0)
-    
-    if init is not None or not self.is_none(init):
-      if n_loops > 1:
-        zeros = self.tuple([zero for _ in xrange(n_loops)])
-        init = self.invoke(fn, [zeros])
-      else:
-        init = self.invoke(fn, [zero])
-        
-    def build_loops(index_vars, acc):
-    
+    if start is None:
+      start = self.int(0)
+    if stop is None:
+      stop = dims[0]
+    def build_loops(index_vars = ()):
       n_indices = len(index_vars)
-      if n_indices > 0:
-        acc_value = acc.get()
+      if n_indices == n_loops:
+        if n_indices > 1:
+          idx_tuple = self.tuple(index_vars)
+        else:
+          idx_tuple = index_vars[0]
+        self.invoke(fn, (idx_tuple,))
       else:
-        acc_value = acc 
+        def loop_body(idx):
+          build_loops(index_vars + (idx,))
+        if n_indices == 0:
+          self.loop(start, stop, loop_body)
+        else:
+          self.loop(self.int(0), dims[n_indices], loop_body)
+    build_loops()
+    return self.none
+
+  def eval_index_reduce(self, fn, combine, shape, init = None,
+                        start = None, stop = None):
+    dims = self.tuple_elts(shape)
+    n_loops = len(dims)
+    zero = self.int(0)
+    one = self.int(1)
+    if start is None:
+      start = zero
+    if stop is None:
+      stop = dims[0]
+
+    def elt_at(index_vars):
+      idx_tuple = self.tuple(index_vars) if n_loops > 1 else index_vars[0]
+      return self.invoke(fn, (idx_tuple,))
+
+    def reduce_loops(index_vars, acc_value, lo = None, hi = None):
+      """
+      Combine the accumulator with the function's value at every index which
+      extends the given prefix, the next index running from 'lo' to 'hi'
+      """
+
+      n_indices = len(index_vars)
       if n_indices == n_loops:
-        
-        idx_tuple = self.tuple(index_vars) if n_indices > 1 else index_vars[0] 
-        elt_result =  self.invoke(fn, (idx_tuple,))
-        acc.update(self.invoke(combine, (acc_value, elt_result)))
-        return acc.get()
-      
+        return self.invoke(combine, (acc_value, elt_at(index_vars)))
+      if lo is None:
+        lo = zero
+      if hi is None:
+        hi = dims[n_indices]
       def loop_body(acc, idx):
-        new_value = build_loops(index_vars + (idx,), acc = acc)
-        acc.update(new_value)
-        return new_value
-      return self.accumulate_loop(self.int(0), dims[n_indices], loop_body, acc_value)
-    return build_loops(index_vars = (), acc = init)
-   
-    
-    
-    
\ No newline at end of file
+        acc.update(reduce_loops(index_vars + (idx,), acc.get()))
+      return self.accumulate_loop(lo, hi, loop_body, acc_value)
+
+    # peel off the first index to get a starting accumulator...
+    first_index = (start,) + (zero,) * (n_loops - 1)
+    acc = elt_at(first_index)
+    if init is not None and not self.is_none(init):
+      acc = self.invoke(combine, (init, acc))
+    # ...then visit the rest of the range in order, first the remainder of
+    # each dimension along the peeled index and then all the later rows
+    for d in reversed(xrange(1, n_loops)):
+      acc = reduce_loops(first_index[:d], acc, one, dims[d])
+    return reduce_loops((), acc, self.add(start, one), stop)
@@ -0,0 +1,166 @@
+"""
+Ahead-of-time compilation for signatures which are known before the first
+call, so production traffic never waits for the compiler:
+
+  @jit(signatures = [(float64_array, Float64)])
+  def f(x, alpha): ...
+
+  parakeet.precompile(g, [(Int64,), (float64_array,)], processes = 4)
+
+Each signature is a sequence with either a Parakeet type or an example value
+for every positional argument. Arrays given by type are assumed contiguous.
+
+Specializations are compiled into the in-memory caches (and the dispatch table
+of a jit function) and, when config.disk_cache is on, stored on disk as well.
+
+compile_many spreads a batch of (function, signature) pairs across a pool of
+processes, linking the bitcode they send back into this process. Only jit
+functions keep code linked that way, plain functions get it from the disk
+cache on their next call (or compile it again without one).
+"""
+
+import multiprocessing
+import numpy as np
+
+import background
+import config
+import disk_cache
+import llvm_context
+import parallel_runtime
+
+from array_type import ArrayT
+from core_types import Bool, Float64, Int64, NoneT, ScalarT, Type
+from decorators import jit
+from tuple_type import TupleT
+
+# the Python values which calls usually pass for these types,
+# so that they match the same entries of a dispatch table
+_python_scalars = {Bool : False, Int64 : 0, Float64 : 0.0}
+
+def example_value(spec):
+  """Argument with the given Parakeet type, values are passed through as is"""
+
+  if not isinstance(spec, Type):
+    return spec
+  elif isinstance(spec, ArrayT):
+    # at least two elements along each axis so only
+    # the innermost stride is a unit stride
+    return np.zeros((2,) * spec.rank, dtype = spec.elt_type.dtype)
+  elif isinstance(spec, ScalarT):
+    if spec in _python_scalars:
+      return _python_scalars[spec]
+    return spec.dtype.type(0)
+  elif isinstance(spec, NoneT):
+    return None
+  elif isinstance(spec, TupleT):
+    return tuple(example_value(elt_t) for elt_t in spec.elt_types)
+  else:
+    assert False, "Can't precompile for arguments of type %s" % spec
+
+def dispatch_table(fn):
+  import run_function
+  if fn.dispatch_table is None:
+    fn.dispatch_table = run_function.DispatchTable(fn.f)
+  return fn.dispatch_table
+
+def compile_signature(fn, args):
+  import run_function
+  if isinstance(fn, jit):
+    compiled, _, _ = dispatch_table(fn).compile(args, {})
+  else:
+    _, compiled, _ = run_function.compile_for_call(fn, args)
+  return compiled
+
+# jobs for the worker processes, which inherit them when forked
+_jobs = []
+
+def _compile_in_worker(i):
+  """
+  Compile one job, sending back its serialized bitcode or None if it can't be
+  serialized (i.e. it got split up for the parallel runtime)
+  """
+
+  import run_function
+  fn, args = _jobs[i]
+  compiled = compile_signature(fn, args)
+  if compiled.__class__ is not run_function.CompiledFn:
+    return None
+  return disk_cache.serialize(compiled.llvm_fn, compiled.parakeet_fn, fn)
+
+def _compile_in_pool(jobs, processes):
+  global _jobs
+  _jobs = jobs
+  # the workers get forked with just a copy of this thread, so make sure
+  # the background compiler isn't holding the lock in the middle of a
+  # compilation which would never finish in the copies
+  with background.compiler_lock:
+    pool = multiprocessing.Pool(min(processes, len(jobs)))
+  try:
+    return pool.map(_compile_in_worker, range(len(jobs)), chunksize = 1)
+  finally:
+    pool.close()
+    pool.join()
+    _jobs = []
+
+# number of functions linked in from worker processes, to keep their names apart
+_n_linked = 0
+
+def _link(fn, args, serialized):
+  """
+  Load bitcode from a worker and add it to the dispatch table of a jit
+  function. Plain Python functions have no table to keep it in, the only copy
+  a later call can find is the one the worker stored in the disk cache.
+  """
+
+  global _n_linked
+  import run_function
+  meta, bitcode = serialized
+  # the LLVM context and execution engine are shared with the compiler
+  with background.compiler_lock:
+    _n_linked += 1
+    llvm_cxt = llvm_context.module_context(meta['name'])
+    prefix = "linked%d_" % _n_linked
+    llvm_fn, signature, exec_engine = \
+        disk_cache.link(meta, bitcode, prefix, llvm_cxt)
+    compiled = run_function.CompiledFn(llvm_fn, signature, exec_engine)
+    if isinstance(fn, jit):
+      table = dispatch_table(fn)
+      table.install(table.translate(), compiled, args, {})
+  return compiled
+
+def compile_many(jobs, processes = None):
+  """
+  Compile a batch of (function, signature) pairs across a pool of processes
+  (by default one per core). Each worker sends back the bitcode of what it
+  compiled, which gets linked into this process and added to the dispatch
+  tables of jit functions. Returns the compiled functions in the same order.
+  Once the parallel runtime has started its threads, everything gets
+  compiled in this process instead.
+  """
+
+  all_args = [(fn, tuple(example_value(spec) for spec in sig))
+              for (fn, sig) in jobs]
+  if processes is None:
+    processes = multiprocessing.cpu_count()
+  # once the parallel runtime's worker threads are running, forked
+  # processes would be missing them along with whatever locks they held
+  if processes > 1 and len(all_args) > 1 and \
+     not parallel_runtime.pool_started():
+    serialized = _compile_in_pool(all_args, processes)
+  else:
+    serialized = [None] * len(all_args)
+  results = []
+  for ((fn, args), s) in zip(all_args, serialized):
+    if s is None:
+      results.append(compile_signature(fn, args))
+    else:
+      results.append(_link(fn, args, s))
+  return results
+
+def precompile(fn, signatures, processes = None):
+  """
+  Compile fn for each of the given signatures, returning the compiled
+  functions. By default everything gets compiled in this process.
+  """
+
+  return compile_many([(fn, sig) for sig in signatures], processes or 1)
@@ -24,6 +24,11 @@ ctypes.pythonapi.PyBuffer_New.restype = ctypes.py_object
 PyBuffer_New = ctypes.pythonapi.PyBuffer_New
 PyBuffer_FromReadWriteMemory = ctypes.pythonapi.PyBuffer_FromReadWriteMemory
 
+def data_address(x):
+  """Address of the first element of a NumPy array"""
+
+  return x.__array_interface__['data'][0]
+
 class SliceT(StructT):
   _members = ['start_type', 'stop_type', 'step_type']
 
@@ -63,7 +68,7 @@ class SliceT(StructT):
     step = self.step_type.from_python(py_slice.step)
     return self.ctypes_repr(start, stop, step)
 
-  def to_python(self, obj):
+  def to_python(self, obj, memory = None):
     start = self.start_type.to_python(obj.start)
     stop = self.stop_type.to_python(obj.stop)
     step = self.step_type.to_python(obj.step)
@@ -171,48 +176,30 @@ class ArrayT(StructT):
     else:
       return self.elt_type
 
-  # WARNING:
-  # until we have garbage collection figured out, we'll
-  # leak memory from arrays we allocate in the conversion routine
-  _store_forever = []
-  _seen_ptr = set([])
   def from_python(self, x):
     if not isinstance(x, np.ndarray):
-      print "Warning: Copying %s into Parakeet, will never get deleted" % \
-          (type(x))
       x = np.asarray(x)
-      self._store_forever.append(x)
 
-    
-    nelts = reduce(lambda x,y: x*y, x.shape)
     elt_size = x.dtype.itemsize
-    # total_bytes = nelts * elt_size
-    if x.base is not None:
-      if isinstance(x.base, np.ndarray):
-        ptr = x.base.ctypes.data_as(self.ptr_t.ctypes_repr)
-        offset_bytes = x.ctypes.data  - x.base.ctypes.data 
-      else:
-        assert isinstance(x.base, buffer)
-        ptr, _ = buffer_info(x.base, self.ptr_t.ctypes_repr)
-        offset_bytes = x.ctypes.data - ctypes.addressof(ptr.contents) 
-      offset = offset_bytes / elt_size
-    else:
-      ptr = x.ctypes.data_as(self.ptr_t.ctypes_repr)
-      offset = 0
-   
-    ctypes_shape = self.shape_t.from_python(x.shape)
-    strides_in_elts = tuple([s / elt_size for s in x.strides])
-    ctypes_strides = self.strides_t.from_python(strides_in_elts)
-    return self.ctypes_repr(ptr, 
-                            ctypes.pointer(ctypes_shape),
-                            ctypes.pointer(ctypes_strides), 
-                            offset, 
-                            nelts)
+    ptr = ctypes.cast(data_address(x), self.ptr_t.ctypes_repr)
+    ctypes_shape = self.shape_t.ctypes_repr(*x.shape)
+    strides_in_elts = [s / elt_size for s in x.strides]
+    ctypes_strides = self.strides_t.ctypes_repr(*strides_in_elts)
+    result = self.ctypes_repr(ptr,
+                              ctypes.pointer(ctypes_shape),
+                              ctypes.pointer(ctypes_strides),
+                              0,
+                              x.size)
+    # the struct only holds a raw pointer to the data, so keep the array
+    # alive for as long as the struct is (i.e. if we just copied a list)
+    result._keep_alive = x
+    return result
     
-  def to_python(self, obj):
+  def to_python(self, obj, memory = None):
     """
-    For now, to avoid to dealing with the messiness of ownership, we just always
-    copy data on the way out of Parakeet
+    Given a ResultMemory describing the buffers of the call which produced
+    this array, wrap the data without copying. Otherwise, not knowing who
+    owns the data, just copy it on the way out of Parakeet.
     """
 
     shape = self.shape_t.to_python(obj.shape.contents)
@@ -221,19 +208,37 @@ class ArrayT(StructT):
     strides_in_elts = self.strides_t.to_python(obj.strides.contents)
     strides_in_bytes = tuple([s * elt_size for s in strides_in_elts])
 
-    base_ptr = obj.data
-
-    nbytes = obj.size * elt_size
-
-    dest_buf = PyBuffer_New(nbytes)
-    dest_ptr, _ = buffer_info(dest_buf, self.ptr_t.ctypes_repr)
-    ctypes.memmove(dest_ptr, base_ptr, nbytes)
+    offset_bytes = obj.offset * elt_size
+    address = ctypes.cast(obj.data, ctypes.c_void_p).value
+    if memory is not None and memory.complete and address is not None:
+      # range of elements reachable from the data pointer, which
+      # might extend below it if some strides are negative
+      lo = hi = obj.offset
+      for (d, s) in zip(shape, strides_in_elts):
+        if d == 0:
+          lo = hi = -1
+          break
+        elif s > 0:
+          hi += (d - 1) * s
+        else:
+          lo += (d - 1) * s
+      if hi < 0:
+        buf = memory.wrap(address, 0, 0)
+        offset_bytes = 0
+      else:
+        buf = memory.wrap(address, lo * elt_size, (hi - lo + 1) * elt_size)
+        offset_bytes = (obj.offset - lo) * elt_size
+    else:
+      base_ptr = obj.data
+      nbytes = obj.size * elt_size
+      buf = PyBuffer_New(nbytes)
+      dest_ptr, _ = buffer_info(buf, self.ptr_t.ctypes_repr)
+      ctypes.memmove(dest_ptr, base_ptr, nbytes)
 
-    
     return np.ndarray(shape, dtype = self.elt_type.dtype,
-                      buffer = dest_buf,
+                      buffer = buf,
                       strides = strides_in_bytes,
-                      offset = obj.offset * elt_size)
+                      offset = offset_bytes)
 
 _array_types = {}
 def make_array_type(elt_t, rank):
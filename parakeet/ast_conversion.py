@@ -1,10 +1,13 @@
 import __builtin__
 import ast
 import inspect
+import os
 import types
 
 import numpy as np
 
+import background
+import compile_profiler
 import config
 import core_types 
 import lib 
@@ -19,6 +22,7 @@ from args import FormalArgs, ActualArgs
 from collections import OrderedDict
 from function_registry import already_registered_python_fn
 from function_registry import register_python_fn, lookup_python_fn
+from function_registry import register_python_code, lookup_python_code
 from decorators import macro, jit 
 from names import NameNotFound
 from prims import Prim, prim_wrapper
@@ -739,12 +743,23 @@ class AST_Translator(ast.NodeVisitor):
       body = [Assign(var, syntax.Index(seq_var, loop_var))] + body
       return ForLoop(loop_var, start, n, step, body, merge)
     
+  def source_info(self, node):
+    lineno = getattr(node, 'lineno', None)
+    if lineno is None:
+      return None
+    return syntax.SourceInfo(self.filename, lineno, self.function_name)
+
   def visit_block(self, stmts):
     self.push()
     curr_block = self.current_block()
     for stmt in stmts:
+      n_before = len(curr_block)
       parakeet_stmt = self.visit(stmt)
       curr_block.append(parakeet_stmt)
+      source_info = self.source_info(stmt)
+      for new_stmt in curr_block[n_before:]:
+        if isinstance(new_stmt, syntax.Stmt) and new_stmt.source_info is None:
+          new_stmt.source_info = source_info
     return self.pop()
 
   def visit_FunctionDef(self, node):
@@ -819,9 +834,12 @@ def translate_function_source(source,
                               globals_dict, 
                               closure_vars = [],
                               closure_cells = [],
-                              filename = None):
+                              filename = None,
+                              first_line = 1):
   assert len(closure_vars) == len(closure_cells)
   syntax = ast.parse(strip_leading_whitespace(source))
+  # line numbers relative to the file rather than the function
+  ast.increment_lineno(syntax, first_line - 1)
 
   if isinstance(syntax, (ast.Module, ast.Interactive)):
     assert len(syntax.body) == 1
@@ -839,7 +857,73 @@ def translate_function_source(source,
                                 closure_cells, 
                                 filename = filename)
 
-def translate_function_value(fn, _currently_processing = set([])):
+# FunctionDef nodes of every parsed source file, keyed on the file name
+# and then on the line each function starts on
+_parsed_files = {}
+
+def function_syntax(fn):
+  """
+  Python syntax tree of a function, or None if it can't be found in its
+  source file. Each file only gets parsed once for all its functions.
+  """
+
+  filename = inspect.getsourcefile(fn)
+  if filename is None:
+    return None
+  try:
+    mtime = os.path.getmtime(filename)
+  except OSError:
+    return None
+  if filename not in _parsed_files or _parsed_files[filename][0] != mtime:
+    with open(filename) as f:
+      source = f.read()
+    try:
+      tree = ast.parse(source, filename)
+    except SyntaxError:
+      return None
+    defs = {}
+    for node in ast.walk(tree):
+      if isinstance(node, ast.FunctionDef):
+        defs.setdefault(node.lineno, node)
+    _parsed_files[filename] = (mtime, defs)
+  node = _parsed_files[filename][1].get(fn.func_code.co_firstlineno)
+  if node is None or node.name != fn.func_code.co_name:
+    return None
+  return node
+
+def translate_python_fn(fn):
+  filename = inspect.getsourcefile(fn)
+  globals_dict = fn.func_globals
+  free_vars = fn.func_code.co_freevars
+  closure_cells = fn.func_closure
+  if closure_cells is None: closure_cells = ()
+  with compile_profiler.stage("translate", fn.__name__) as s:
+    node = function_syntax(fn)
+    if node is None:
+      # fall back on finding the source some other way
+      source = inspect.getsource(fn)
+      first_line = fn.func_code.co_firstlineno
+      return s.result(translate_function_source(source,
+                                                globals_dict,
+                                                free_vars,
+                                                closure_cells,
+                                                filename = filename,
+                                                first_line = first_line))
+    return s.result(translate_function_ast(node.name,
+                                           node.args,
+                                           node.body,
+                                           globals_dict,
+                                           free_vars,
+                                           closure_cells,
+                                           filename = filename))
+
+def translate_function_value(fn):
+  # translations get registered in caches which the background compiler
+  # and the interpreter (running calls while that compiles) both use
+  with background.compiler_lock:
+    return _translate_function_value(fn)
+
+def _translate_function_value(fn, _currently_processing = set([])):
   if fn in function_mappings:
     fn = function_mappings[fn]
   
@@ -855,6 +939,7 @@ def translate_function_value(fn, _currently_processing = set([])):
     "Unsupported primitive: %s" % (fn,) 
 
   if already_registered_python_fn(fn):
+    compile_profiler.cache_hit("translate", getattr(fn, '__name__', fn))
     return lookup_python_fn(fn)
   
   assert is_hashable(fn), "Can't convert unhashable value: %s" % (fn,)
@@ -879,18 +964,12 @@ def translate_function_value(fn, _currently_processing = set([])):
     assert hasattr(fn, 'func_globals'), "Expected function to have globals: %s" % fn
     assert hasattr(fn, 'func_closure'), "Expected function to have closure cells: %s" % fn
     assert hasattr(fn, 'func_code'), "Expected function to have code object: %s" % fn
-    source = inspect.getsource(fn)
-    filename = inspect.getsourcefile(fn)
-    globals_dict = fn.func_globals
-
-    free_vars = fn.func_code.co_freevars
-    closure_cells = fn.func_closure
-    if closure_cells is None: closure_cells = ()
-    fundef = translate_function_source(source,
-                                        globals_dict,
-                                        free_vars,
-                                        closure_cells, 
-                                        filename = filename)
+    fundef = lookup_python_code(fn)
+    if fundef is not None:
+      compile_profiler.cache_hit("translate", fn.__name__)
+    else:
+      fundef = translate_python_fn(fn)
+      register_python_code(fn, fundef)
     if config.print_untyped_function:
       print "[ast_conversion] Translated %s into untyped function:\n%s" % (fn, repr(fundef))
                 
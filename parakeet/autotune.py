@@ -0,0 +1,218 @@
+"""
+Empirical tuning of the optimization settings whose best value depends on the
+kernel and its inputs: loop unrolling, tile sizes and parallel chunk sizes.
+
+tune(fn, *args) compiles the function with candidate values of each setting,
+times every variant on the given arguments, and records the fastest settings
+in a tuning database under the function's signature (its source along with
+the types and unit strides of its arguments). Whenever that signature gets
+compiled again, in this process or a later one, it's compiled with the
+recorded settings.
+
+Usage from the command line:
+  python -m parakeet.autotune list
+  python -m parakeet.autotune clear
+"""
+
+import cPickle
+import os
+import time
+
+import compile_cache
+import config
+import disk_cache
+
+from decorators import jit
+
+class Settings(object):
+  """
+  Overrides values in config until the end of a 'with' block:
+    with Settings({'opt_loop_unrolling' : True}):
+      ...
+  """
+
+  def __init__(self, settings):
+    self.settings = settings
+    self.old_values = None
+
+  def __enter__(self):
+    self.old_values = dict((k, getattr(config, k)) for k in self.settings)
+    for (k, v) in self.settings.iteritems():
+      setattr(config, k, v)
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    for (k, v) in self.old_values.iteritems():
+      setattr(config, k, v)
+    return False
+
+def search_space():
+  """
+  Candidate values for each group of related settings, the groups get tuned
+  one after the other
+  """
+
+  space = [
+    [{'opt_loop_unrolling' : False}] +
+    [{'opt_loop_unrolling' : True, 'opt_unroll_factor' : factor}
+     for factor in (2, 4, 8)]
+  ]
+  if config.opt_tiling:
+    space.append([{'opt_tile_sizes' : sizes}
+                  for sizes in (None, (8, 8), (32, 32), (128, 128))])
+  if config.parallel_outer_adverbs:
+    space.append([{'parallel_chunk_size' : size}
+                  for size in (None, 64, 1024, 16384)])
+  return space
+
+def database_path():
+  if config.autotune_db is not None:
+    return config.autotune_db
+  return os.path.join(disk_cache.cache_dir(create = False), "tuning.db")
+
+def load_database(path):
+  if not os.path.exists(path):
+    return {}
+  with open(path, 'rb') as f:
+    return cPickle.load(f)
+
+_database = None
+_database_path = None
+def database():
+  """Recorded entries for each signature, read from disk once per path"""
+
+  global _database, _database_path
+  path = database_path()
+  if _database is None or path != _database_path:
+    _database = load_database(path)
+    _database_path = path
+  return _database
+
+def store_database(db):
+  global _database, _database_path
+  path = database_path()
+  directory = os.path.dirname(os.path.abspath(path))
+  if not os.path.exists(directory):
+    os.makedirs(directory)
+  disk_cache._write_atomically(
+      path, lambda f: cPickle.dump(db, f, cPickle.HIGHEST_PROTOCOL))
+  _database = db
+  _database_path = path
+
+def record(key, entry):
+  # other processes might have tuned functions of their own
+  # since this one read the database
+  db = load_database(database_path())
+  db[key] = entry
+  store_database(db)
+
+def tuning_key(fn, args, kwargs):
+  """
+  Key of the function's signature in the tuning database, or None if the
+  function or its arguments can't be keyed
+  """
+
+  import run_function
+  _, arg_values, arg_types = run_function.prepare_args(fn, args, kwargs)
+  return disk_cache.cache_key(fn, arg_values, arg_types,
+                              include_config = False)
+
+def recorded_settings(fn, args, kwargs = {}):
+  """Settings recorded for the function's signature, empty if it wasn't tuned"""
+
+  if not config.autotune or len(database()) == 0:
+    return {}
+  key = tuning_key(fn, args, kwargs)
+  entry = database().get(key) if key is not None else None
+  if entry is None:
+    return {}
+  return entry['settings']
+
+def measure(fn, args, kwargs, settings):
+  """Best running time of the function compiled with the given settings"""
+
+  import run_function
+  with Settings(settings):
+    # drop everything compiled with other settings
+    compile_cache.clear()
+    untyped, compiled, all_args = \
+        run_function.compile_for_call(fn, args, kwargs)
+    linear_args = untyped.args.linearize_without_defaults(all_args)
+    compiled(*linear_args)
+    times = []
+    for _ in xrange(max(1, config.autotune_repeat)):
+      start = time.time()
+      compiled(*linear_args)
+      times.append(time.time() - start)
+  return min(times)
+
+def tune_space(fn, args, kwargs, space):
+  while isinstance(fn, jit):
+    fn = fn.f
+  best = {}
+  # recorded settings would override the ones being tried
+  with Settings({'autotune' : False}):
+    default_time = best_time = measure(fn, args, kwargs, best)
+    for candidates in space:
+      for candidate in candidates:
+        if all(best.get(k, getattr(config, k)) == v
+               for (k, v) in candidate.iteritems()):
+          continue
+        settings = dict(best)
+        settings.update(candidate)
+        t = measure(fn, args, kwargs, settings)
+        if t < best_time:
+          best, best_time = settings, t
+  # later calls should compile with the winning settings
+  compile_cache.clear()
+
+  key = tuning_key(fn, args, kwargs)
+  if key is not None:
+    record(key, {
+      'python_name' : getattr(fn, '__name__', str(fn)),
+      'settings' : best,
+      'time' : best_time,
+      'default_time' : default_time,
+      'created' : time.time(),
+    })
+  return best
+
+def tune(fn, *args, **kwargs):
+  """
+  Find the fastest settings from search_space() for running the function on
+  the given arguments and record them for its signature, returns the
+  settings which differ from the current config. Every variant runs
+  config.autotune_repeat + 1 times, so arguments which the function modifies
+  had better tolerate that. Clears the in-memory compilation caches.
+  """
+
+  return tune_space(fn, args, kwargs, search_space())
+
+def clear():
+  """Forget all recorded settings, returns the number of entries removed"""
+
+  count = len(load_database(database_path()))
+  store_database({})
+  return count
+
+def describe(key, entry):
+  settings = ", ".join("%s = %r" % (k, v)
+                       for (k, v) in sorted(entry['settings'].iteritems()))
+  return "%s  %s: {%s}  [%.2fX faster than default]" % \
+         (key[:12], entry['python_name'], settings,
+          entry['default_time'] / max(entry['time'], 1e-9))
+
+if __name__ == '__main__':
+  import sys
+  command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+  if command == 'list':
+    print "Tuning database %s" % database_path()
+    entries = sorted(load_database(database_path()).iteritems(),
+                     key = lambda (_, entry): entry['created'], reverse = True)
+    for (key, entry) in entries:
+      print "  " + describe(key, entry)
+  elif command == 'clear':
+    print "Removed %d entries from %s" % (clear(), database_path())
+  else:
+    print "Usage: python -m parakeet.autotune [list|clear]"
+    sys.exit(1)
@@ -0,0 +1,101 @@
+"""
+Compile new specializations on a worker thread so the first calls with a new
+signature don't have to wait for the compiler. Until the native code is ready
+those calls run through the interpreter, with NumPy semantics.
+
+Turned on by config.background_compilation, the Compilation futures can also
+be used directly to warm up a function before it gets called:
+  f.compile_async(x, y).wait()
+"""
+
+import Queue
+import numpy as np
+import sys
+import threading
+
+from args import ActualArgs
+
+# the compiler's caches aren't safe to update from
+# several threads, so only one compilation runs at a time
+compiler_lock = threading.RLock()
+
+class Compilation(object):
+  """Future for a specialization which is being compiled in the background"""
+
+  def __init__(self, compile_fn, args):
+    self.compile_fn = compile_fn
+    self.args = args
+    self.result = None
+    self.exc_info = None
+    self.done = threading.Event()
+
+  def run(self):
+    try:
+      self.result = self.compile_fn(*self.args)
+    except:
+      self.exc_info = sys.exc_info()
+    # don't keep the arguments of the first call alive
+    self.args = None
+    self.done.set()
+
+  def ready(self):
+    return self.done.is_set()
+
+  def wait(self, timeout = None):
+    """Block until the compilation finishes, return whether it has"""
+
+    self.done.wait(timeout)
+    return self.ready()
+
+  def get(self):
+    """Wait for the compiled result, re-raising any error from the compiler"""
+
+    self.wait()
+    if self.exc_info is not None:
+      raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+    return self.result
+
+class Finished(Compilation):
+  """Compilation which already happened, for signatures we've seen before"""
+
+  def __init__(self, result = None):
+    Compilation.__init__(self, None, ())
+    self.result = result
+    self.done.set()
+
+_queue = Queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+def _work():
+  while True:
+    compilation = _queue.get()
+    compilation.run()
+
+def submit(compile_fn, *args):
+  """Call compile_fn(*args) on the worker thread, returning a Compilation"""
+
+  global _worker
+  compilation = Compilation(compile_fn, args)
+  with _worker_lock:
+    if _worker is None:
+      _worker = threading.Thread(target = _work, name = "parakeet-compiler")
+      _worker.daemon = True
+      _worker.start()
+  _queue.put(compilation)
+  return compilation
+
+def interpret(untyped, nonlocals, args, kwargs, out = None):
+  """Evaluate the untyped function on the given arguments without compiling"""
+
+  import interp
+  actuals = ActualArgs(list(nonlocals) + list(args), kwargs)
+  result = interp.eval_fn(untyped, actuals)
+  if out is None:
+    return result
+  if np.shape(result) != out.shape:
+    # the same error compiled code raises, rather than broadcasting
+    raise ValueError("Output of shape %s can't hold a result of shape %s" % \
+                     (out.shape, np.shape(result)))
+  out[...] = result
+  return out
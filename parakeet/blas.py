@@ -0,0 +1,53 @@
+"""
+Addresses of the BLAS routines which compiled code can call, taken from the
+BLAS that SciPy was built against (through scipy.linalg.cython_blas). Without
+SciPy there are no BLAS calls. Compiled code refers to every routine by the
+name symbol(name), which gets bound to its address in the execution engine.
+"""
+
+import ctypes
+
+import llvm.ee
+
+import config
+
+# the routines BlasDispatch knows how to call
+routines = ['sgemm', 'dgemm', 'sgemv', 'dgemv', 'sdot', 'ddot']
+
+def symbol(name):
+  return "parakeet_blas_" + name
+
+def scipy_addresses():
+  try:
+    from scipy.linalg import cython_blas
+  except ImportError:
+    return {}
+  get_name = ctypes.pythonapi.PyCapsule_GetName
+  get_name.restype = ctypes.c_char_p
+  get_name.argtypes = [ctypes.py_object]
+  get_pointer = ctypes.pythonapi.PyCapsule_GetPointer
+  get_pointer.restype = ctypes.c_void_p
+  get_pointer.argtypes = [ctypes.py_object, ctypes.c_char_p]
+  result = {}
+  for name in routines:
+    capsule = cython_blas.__pyx_capi__.get(name)
+    if capsule is not None:
+      result[name] = get_pointer(capsule, get_name(capsule))
+  return result
+
+_addresses = None
+def addresses():
+  """
+  Address of each BLAS routine we found, registered with LLVM under
+  symbol(name) on the first call
+  """
+
+  global _addresses
+  if _addresses is None:
+    _addresses = scipy_addresses()
+    for (name, address) in _addresses.iteritems():
+      llvm.ee.dylib_add_symbol(symbol(name), address)
+  return _addresses
+
+def available(name):
+  return config.opt_blas and name in addresses()
@@ -0,0 +1,216 @@
+import adverb_patterns
+import blas
+import config
+import prims
+import syntax_helpers
+
+from adverb_semantics import AdverbSemantics
+from array_type import ArrayT
+from core_types import Float32, Float64, Int8, Int32, NoneType
+from syntax import BlasCall, Closure, ExprStmt, If, TypedFn
+from transform import Transform
+
+# largest dimension or stride BLAS can take as a 32-bit Fortran integer
+_max_fortran_int = 2 ** 31 - 1
+
+class BlasDispatch(adverb_patterns.WholeArrayAdverbs, AdverbSemantics,
+                   Transform):
+  """
+  Replace adverbs which compute matrix products and dot products over
+  float32 or float64 arrays with calls into BLAS:
+    allpairs(dot, X, Y) and map(lambda x: map(lambda y: dot(x, y), Y), X)
+      -> gemm
+    map(lambda x: dot(x, v), X) -> gemv
+    sum(x * y) -> dot
+  where dot is any function computing sum(x * y). BLAS only handles rows
+  with unit stride (and sizes which fit into 32 bits), so every call is
+  guarded by a check of the actual shapes and strides and the original
+  adverb still runs when the check fails.
+  """
+
+  _prefixes = {Float32 : 's', Float64 : 'd'}
+
+  def routine(self, elt_t, name):
+    prefix = self._prefixes.get(elt_t)
+    if prefix is not None and blas.available(prefix + name):
+      return prefix + name
+    return None
+
+  def char(self, c):
+    return syntax_helpers.const_int(ord(c), Int8)
+
+  def fortran_int(self, x):
+    return self.cast(x, Int32)
+
+  def float_arrays(self, xs, rank):
+    elt_t = xs[0].type.elt_type if isinstance(xs[0].type, ArrayT) else None
+    return all(isinstance(x.type, ArrayT) and x.type.rank == rank and
+               x.type.elt_type == elt_t for x in xs) and \
+           elt_t in self._prefixes
+
+  def all_true(self, conds):
+    result = conds[0]
+    for cond in conds[1:]:
+      result = self.prim(prims.logical_and, [result, cond], "blas_ok")
+    return result
+
+  def fits(self, values):
+    limit = self.int(_max_fortran_int)
+    return [self.lte(v, limit) for v in values]
+
+  def enough_work(self, sizes):
+    return self.gte(self.prod(sizes, "blas_work"),
+                    self.int(config.opt_blas_min_work))
+
+  def dispatch(self, conds, blas_block, fallback):
+    """
+    If every condition holds at runtime, compute the result with the
+    statements generated by blas_block (which returns the result) and
+    otherwise evaluate the original adverb
+    """
+
+    cond = self.all_true(conds)
+    result = self.fresh_var(fallback.type, "blas_result")
+    self.blocks.push()
+    blas_value = blas_block()
+    true_block = self.blocks.pop()
+    self.blocks.push()
+    fallback_value = self.assign_temp(fallback, "fallback")
+    false_block = self.blocks.pop()
+    self.blocks += If(cond, true_block, false_block,
+                      merge = {result.name : (blas_value, fallback_value)})
+    return result
+
+  def gemm(self, x, y, expr):
+    """
+    Rows of x (m by k) times rows of y (n by k), i.e. x * y^T. BLAS sees
+    row-major data as its transpose in column-major order, so we ask it
+    for (y^T)^T * x^T instead, which in row-major order is x * y^T.
+    """
+
+    elt_t = x.type.elt_type
+    name = self.routine(elt_t, 'gemm')
+    if name is None or expr.type.__class__ is not ArrayT or \
+       expr.type.rank != 2 or expr.type.elt_type != elt_t:
+      return expr
+    m = self.shape(x, 0)
+    k = self.shape(x, 1)
+    n = self.shape(y, 0)
+    ldx = self.strides(x, 0)
+    ldy = self.strides(y, 0)
+    zero = self.int(0)
+    conds = [self.eq(self.shape(y, 1), k),
+             self.eq(self.strides(x, 1), self.int(1)),
+             self.eq(self.strides(y, 1), self.int(1)),
+             self.gt(m, zero), self.gt(n, zero), self.gt(k, zero),
+             self.gte(ldx, k), self.gte(ldy, k),
+             self.enough_work([m, n, k])] + \
+            self.fits([m, n, k, ldx, ldy])
+    def call_gemm():
+      output = self.alloc_array(elt_t, [m, n], "blas_output")
+      args = [self.char('T'), self.char('N'),
+              self.fortran_int(n), self.fortran_int(m), self.fortran_int(k),
+              syntax_helpers.const_float(1.0, elt_t),
+              y, self.fortran_int(ldy), x, self.fortran_int(ldx),
+              syntax_helpers.const_float(0.0, elt_t),
+              output, self.fortran_int(n)]
+      self.blocks += ExprStmt(BlasCall(name, args, type = NoneType))
+      return output
+    return self.dispatch(conds, call_gemm, expr)
+
+  def gemv(self, x, v, expr):
+    """Dot products of the rows of x (m by k) with the vector v"""
+
+    elt_t = x.type.elt_type
+    name = self.routine(elt_t, 'gemv')
+    if name is None or expr.type.__class__ is not ArrayT or \
+       expr.type.rank != 1 or expr.type.elt_type != elt_t:
+      return expr
+    m = self.shape(x, 0)
+    k = self.shape(x, 1)
+    ldx = self.strides(x, 0)
+    incv = self.strides(v, 0)
+    zero = self.int(0)
+    conds = [self.eq(self.shape(v, 0), k),
+             self.eq(self.strides(x, 1), self.int(1)),
+             self.gt(m, zero), self.gt(k, zero),
+             self.gte(ldx, k), self.gt(incv, zero),
+             self.enough_work([m, k])] + \
+            self.fits([m, k, ldx, incv])
+    def call_gemv():
+      output = self.alloc_array(elt_t, [m], "blas_output")
+      args = [self.char('T'),
+              self.fortran_int(k), self.fortran_int(m),
+              syntax_helpers.const_float(1.0, elt_t),
+              x, self.fortran_int(ldx), v, self.fortran_int(incv),
+              syntax_helpers.const_float(0.0, elt_t),
+              output, self.fortran_int(self.int(1))]
+      self.blocks += ExprStmt(BlasCall(name, args, type = NoneType))
+      return output
+    return self.dispatch(conds, call_gemv, expr)
+
+  def dot(self, x, y, expr):
+    elt_t = x.type.elt_type
+    name = self.routine(elt_t, 'dot')
+    if name is None or expr.type != elt_t:
+      return expr
+    n = self.shape(x, 0)
+    incx = self.strides(x, 0)
+    incy = self.strides(y, 0)
+    zero = self.int(0)
+    conds = [self.eq(self.shape(y, 0), n),
+             self.gt(incx, zero), self.gt(incy, zero),
+             self.enough_work([n])] + \
+            self.fits([n, incx, incy])
+    def call_dot():
+      args = [self.fortran_int(n), x, self.fortran_int(incx),
+              y, self.fortran_int(incy)]
+      return self.assign_temp(BlasCall(name, args, type = elt_t), "dot")
+    return self.dispatch(conds, call_dot, expr)
+
+  def is_dot_fn(self, fn):
+    """Does the function take two vectors and return sum(x * y)?"""
+
+    if fn.__class__ is not TypedFn or len(fn.arg_names) != 2:
+      return False
+    return adverb_patterns.dot_product_args(fn) is not None
+
+  def transform_AllPairs(self, expr):
+    x, y = expr.args
+    if syntax_helpers.unwrap_constant(expr.axis) != 0 or \
+       not self.float_arrays([x, y], 2) or not self.is_dot_fn(expr.fn):
+      return expr
+    return self.gemm(x, y, expr)
+
+  def transform_Map(self, expr):
+    if syntax_helpers.unwrap_constant(expr.axis) != 0 or \
+       len(expr.args) != 1 or not self.float_arrays(expr.args, 2):
+      return expr
+    x = expr.args[0]
+    nested = adverb_patterns.nested_map(expr)
+    if nested is not None:
+      inner_fn, elts, y = nested
+      if len(elts) == 0 and self.is_dot_fn(inner_fn) and \
+         self.float_arrays([x, y], 2):
+        return self.gemm(x, y, expr)
+      return expr
+
+    # map(lambda row: dot(v, row), X) with v coming from the closure
+    fn = expr.fn
+    if fn.__class__ is not Closure or len(fn.args) != 1 or \
+       fn.fn.__class__ is not TypedFn or not self.is_dot_fn(fn.fn):
+      return expr
+    v = fn.args[0]
+    if not self.float_arrays([v], 1) or \
+       v.type.elt_type != x.type.elt_type:
+      return expr
+    return self.gemv(x, v, expr)
+
+  def transform_Reduce(self, expr):
+    if syntax_helpers.unwrap_constant(expr.axis) not in (None, 0):
+      return expr
+    operands = adverb_patterns.dot_product_operands(expr, {})
+    if operands is None or not self.float_arrays(operands, 1):
+      return expr
+    x, y = operands
+    return self.dot(x, y, expr)
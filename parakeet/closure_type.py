@@ -2,6 +2,7 @@ import ctypes
 # python's function type
 from types import FunctionType
 
+import compile_cache
 import type_conv
 
  
@@ -33,7 +34,7 @@ class ClosureT(StructT):
     for (i, t) in enumerate(self.arg_types):
       self._fields_.append( ('arg%d' % i, t) )
 
-    self.specializations = {}
+    self.specializations = compile_cache.LRUCache("specializations")
     if self in self.id_numbers:
       self.id = self.id_numbers[self]
     else:
@@ -62,8 +63,10 @@ class ClosureT(StructT):
 
   def from_python(self, python_fn):
     import ast_conversion
+    import function_registry
     untyped_fundef = ast_conversion.translate_function_value(python_fn)
-    closure_args = untyped_fundef.python_nonlocals()
+    closure_args = function_registry.python_nonlocals(python_fn,
+                                                      untyped_fundef)
     closure_arg_types = map(type_conv.typeof, closure_args)
 
     closure_t = make_closure_type(untyped_fundef, closure_arg_types)
@@ -80,7 +83,7 @@ class ClosureT(StructT):
     converted_args = [field_value(closure_arg) for closure_arg in closure_args]
     return closure_t.ctypes_repr(closure_id, *converted_args)
 
-  def to_python(self, parakeet_fn):
+  def to_python(self, parakeet_fn, memory = None):
     raise RuntimeError("TODO: Just return a compiled_fn wrapper")
 
   def combine(self, other):
@@ -0,0 +1,122 @@
+"""
+Size-bounded caches for everything the compiler memoizes: the results of
+optimization phases, function specializations, inferred return types, stride
+specializations, dispatch tables, and compiled LLVM functions.
+
+Each cache evicts its least recently used entries once it holds more than
+config.max_cache_entries of them. Evicting a compiled function only drops the
+cache's reference to its NativeCode handle, the machine code itself gets freed
+once no CompiledFn still uses it either (see llvm_backend.NativeCode).
+
+Usage from Python:
+  parakeet.compile_cache.stats()  # {name : {hits, misses, evictions, size}}
+  parakeet.compile_cache.clear()
+"""
+
+import weakref
+
+import config
+
+_missing = object()
+
+# every cache created so far, for reporting stats
+_caches = weakref.WeakSet()
+
+class LRUCache(object):
+  """
+  Dictionary which forgets its least recently used entries. Lookups just
+  stamp the entry with a counter, finding the oldest entry is a linear scan
+  but only happens when something new gets compiled.
+  """
+
+  def __init__(self, name, max_size = None, on_evict = None):
+    self.name = name
+    self.max_size = max_size
+    self.on_evict = on_evict
+    self.values = {}
+    self.last_used = {}
+    self.clock = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    _caches.add(self)
+
+  def capacity(self):
+    if self.max_size is not None:
+      return self.max_size
+    return config.max_cache_entries
+
+  def get(self, key, default = None):
+    value = self.values.get(key, _missing)
+    if value is _missing:
+      self.misses += 1
+      return default
+    self.hits += 1
+    self.clock += 1
+    self.last_used[key] = self.clock
+    return value
+
+  def __contains__(self, key):
+    return key in self.values
+
+  def __getitem__(self, key):
+    value = self.get(key, _missing)
+    if value is _missing:
+      raise KeyError(key)
+    return value
+
+  def __setitem__(self, key, value):
+    self.clock += 1
+    self.values[key] = value
+    self.last_used[key] = self.clock
+    limit = self.capacity()
+    if limit is not None:
+      while len(self.values) > limit:
+        oldest = min(self.last_used, key = self.last_used.get)
+        self.evict(oldest)
+
+  def evict(self, key):
+    value = self.values.pop(key, _missing)
+    self.last_used.pop(key, None)
+    if value is _missing:
+      # a lookup on another thread stamped the key after it was evicted
+      return
+    self.evictions += 1
+    if self.on_evict is not None:
+      self.on_evict(key, value)
+
+  def __len__(self):
+    return len(self.values)
+
+  def items(self):
+    return self.values.items()
+
+  def itervalues(self):
+    return self.values.itervalues()
+
+  def clear(self):
+    for key in self.values.keys():
+      self.evict(key)
+
+  def __str__(self):
+    return "LRUCache(%s, size = %d, hits = %d, misses = %d, evictions = %d)" % \
+           (self.name, len(self), self.hits, self.misses, self.evictions)
+
+def stats():
+  """Hits, misses, evictions, and current size summed over caches of each name"""
+
+  result = {}
+  for cache in list(_caches):
+    counts = result.setdefault(cache.name, {'hits' : 0, 'misses' : 0,
+                                            'evictions' : 0, 'size' : 0})
+    counts['hits'] += cache.hits
+    counts['misses'] += cache.misses
+    counts['evictions'] += cache.evictions
+    counts['size'] += len(cache)
+  return result
+
+def clear():
+  """Evict everything from every cache"""
+
+  for cache in list(_caches):
+    cache.clear()
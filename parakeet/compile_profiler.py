@@ -0,0 +1,209 @@
+"""
+Structured profile of where compile time goes: Python to untyped IR
+translation, type specialization, every optimization phase and the
+transforms inside it, stride specialization, LLVM code generation and
+LLVM's optimization passes.
+
+Usage from Python:
+  with parakeet.compile_profiler.profile() as prof:
+    f(x)
+  print prof.report()
+  prof.save("compile_profile.json")
+
+Each stage is a record of its wall time, the size of the function's IR before
+and after (statements for Parakeet IR, instructions for LLVM) and whether it
+was answered from a cache. Records nest the same way the stages call each
+other. With profile(llvm_passes = True) every LLVM pass runs on its own so it
+can be timed separately, which can change the optimized code a little.
+"""
+
+import json
+import threading
+import time
+
+from syntax import ForLoop, If, While
+
+# profile which stages currently report to, kept per thread since the
+# background compiler thread runs compilations of its own
+_local = threading.local()
+
+def active():
+  return getattr(_local, 'profile', None)
+
+def count_stmts(block):
+  total = 0
+  for stmt in block:
+    total += 1
+    c = stmt.__class__
+    if c is If:
+      total += count_stmts(stmt.true) + count_stmts(stmt.false)
+    elif c is While or c is ForLoop:
+      total += count_stmts(stmt.body)
+  return total
+
+def ir_size(fn):
+  """Statements in a Parakeet function or instructions in an LLVM function"""
+
+  if hasattr(fn, 'basic_blocks'):
+    return sum(len(bb.instructions) for bb in fn.basic_blocks)
+  else:
+    return count_stmts(fn.body)
+
+class Record(object):
+  def __init__(self, kind, name, fn_name = None):
+    self.kind = kind
+    self.name = name
+    self.fn_name = fn_name
+    self.time = 0.0
+    self.size_before = None
+    self.size_after = None
+    self.cache_hit = None
+    self.children = []
+
+  def as_dict(self):
+    result = {'kind' : self.kind, 'name' : self.name, 'time' : self.time}
+    if self.fn_name is not None:
+      result['fn'] = self.fn_name
+    if self.size_before is not None:
+      result['size_before'] = self.size_before
+    if self.size_after is not None:
+      result['size_after'] = self.size_after
+    if self.cache_hit is not None:
+      result['cache_hit'] = self.cache_hit
+    if self.children:
+      result['children'] = [child.as_dict() for child in self.children]
+    return result
+
+class stage(object):
+  """
+  Context manager recording one stage of compilation in the active profile,
+  does nothing if there isn't one. The name only gets converted to a string
+  while profiling. Stages which were looked up in a cache first should pass
+  cache = True so the record counts as a miss.
+  """
+
+  def __init__(self, kind, name, fn = None, cache = False):
+    self.kind = kind
+    self.name = name
+    self.fn = fn
+    self.cache = cache
+    self.record = None
+
+  def __enter__(self):
+    profile = active()
+    if profile is not None:
+      fn_name = getattr(self.fn, 'name', None)
+      self.record = Record(self.kind, str(self.name), fn_name)
+      if self.cache:
+        self.record.cache_hit = False
+      if self.fn is not None:
+        self.record.size_before = ir_size(self.fn)
+      profile.stack[-1].children.append(self.record)
+      profile.stack.append(self.record)
+      self.profile = profile
+      self.start = time.time()
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    if self.record is not None:
+      self.record.time = time.time() - self.start
+      stack = self.profile.stack
+      # a profile which ended in the middle of a stage no longer has it
+      if stack and stack[-1] is self.record:
+        stack.pop()
+    return False
+
+  def result(self, fn):
+    """Record the size of the function this stage produced"""
+
+    if self.record is not None and fn is not None:
+      self.record.size_after = ir_size(fn)
+    return fn
+
+def cache_hit(kind, name, fn = None):
+  """Record a stage which was skipped since its result was already cached"""
+
+  profile = active()
+  if profile is not None:
+    record = Record(kind, str(name), getattr(fn, 'name', None))
+    record.cache_hit = True
+    profile.stack[-1].children.append(record)
+
+class Profile(object):
+  def __init__(self, llvm_passes = False):
+    self.llvm_passes = llvm_passes
+    self.root = Record('profile', 'total')
+    # stages open on each thread, so that stages
+    # on different threads never nest in each other
+    self.stacks = threading.local()
+    self.previous = None
+
+  @property
+  def stack(self):
+    stack = getattr(self.stacks, 'stack', None)
+    if stack is None:
+      stack = self.stacks.stack = [self.root]
+    return stack
+
+  def __enter__(self):
+    self.previous = active()
+    _local.profile = self
+    self.start = time.time()
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    self.root.time += time.time() - self.start
+    _local.profile = self.previous
+    return False
+
+  def records(self):
+    stack = list(self.root.children)
+    while stack:
+      record = stack.pop()
+      yield record
+      stack.extend(record.children)
+
+  def summary(self):
+    """
+    Totals for each kind and name of stage. The time of a stage includes the
+    time of any stages nested inside it.
+    """
+
+    totals = {}
+    for record in self.records():
+      key = "%s:%s" % (record.kind, record.name)
+      entry = totals.setdefault(key, {'count' : 0, 'time' : 0.0,
+                                      'cache_hits' : 0})
+      entry['count'] += 1
+      entry['time'] += record.time
+      if record.cache_hit:
+        entry['cache_hits'] += 1
+    return totals
+
+  def as_dict(self):
+    return {
+      'version' : 1,
+      'total_time' : self.root.time,
+      'stages' : [child.as_dict() for child in self.root.children],
+      'summary' : self.summary(),
+    }
+
+  def to_json(self, indent = 2):
+    return json.dumps(self.as_dict(), indent = indent, sort_keys = True)
+
+  def save(self, path):
+    with open(path, 'w') as f:
+      f.write(self.to_json())
+
+  def report(self, limit = 30):
+    lines = ["%-50s %6s %10s %6s" % ("stage", "count", "total ms", "hits")]
+    items = sorted(self.summary().items(), key = lambda (_, e): e['time'],
+                   reverse = True)
+    for (key, entry) in items[:limit]:
+      lines.append("%-50s %6d %10.2f %6d" % \
+                   (key[:50], entry['count'], entry['time'] * 1000,
+                    entry['cache_hits']))
+    return "\n".join(lines)
+
+def profile(llvm_passes = False):
+  return Profile(llvm_passes)
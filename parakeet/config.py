@@ -50,12 +50,37 @@ print_x86 = False
 ######################################
 
 opt_verify = True
+
+# most times the cleanup transforms of a phase (i.e. Simplify, DCE) get
+# repeated after a transform which changed the function, they stop as soon
+# as a round of them leaves it unchanged
+opt_cleanup_iterations = 2
+
 opt_inline = True
 opt_fusion = True
 
+# a Map whose result several other adverbs consume gets fused into all of
+# them as long as evaluating its function again for each extra consumer
+# takes at most this many operations per element
+opt_fusion_max_recompute = 8
+
+# merge adjacent loops over the same range which read a common array
+opt_loop_fusion = True
+
 opt_licm = True
 opt_copy_elimination = True
 opt_stack_allocation = True
+
+# free memory allocated inside a compiled function which
+# doesn't escape through its inputs or return value
+opt_free_temporaries = True
+
+# largest temporary buffer which gets put on the stack
+stack_alloc_max_bytes = 1024
+
+# hand the data of returned arrays over to NumPy instead of copying it
+zero_copy_results = True
+
 opt_index_elimination = True
 opt_range_propagation = True
 opt_shape_elim = True
@@ -66,10 +91,66 @@ opt_redundant_load_elimination = True
 # may dramatically increase compile time
 opt_loop_unrolling = False
 
+# copies of the body in each iteration of an unrolled loop
+opt_unroll_factor = 4
+
+# loops with at most this many iterations known at compile time get
+# unrolled completely (None = same as opt_unroll_factor)
+opt_max_static_unrolling = 8
+
+# loops whose body has more statements than this don't get unrolled
+opt_max_unroll_block_size = 50
+
+# rewrite innermost unit-stride loops over numbers to use SIMD vectors,
+# reductions get reassociated across the lanes so float sums might round
+# slightly differently (off until the vector loops have been benchmarked)
+opt_vectorize = False
+
+# size of the vectors created by opt_vectorize (32 bytes fills an AVX
+# register, LLVM splits them up on targets with narrower registers)
+opt_vector_bytes = 32
+
+# split all-pairs adverbs (and maps of maps with the same structure) into
+# loops over tiles of rows, picking as many rows of both inputs as fit
+# into opt_tile_cache_bytes (about half of a typical L2 cache), off until
+# the tiled loops have been benchmarked
+opt_tiling = False
+opt_tile_cache_bytes = 128 * 1024
+
+# fixed (rows of x, rows of y) per tile instead of the cache heuristic
+opt_tile_sizes = None
+
+# call the BLAS library SciPy was built against for matrix products,
+# matrix-vector products and dot products over float32/float64 arrays
+# (falling back on compiled loops for strided data), as long as they
+# take at least opt_blas_min_work multiply-adds (off until the BLAS calls
+# have been benchmarked against the compiled loops)
+opt_blas = False
+opt_blas_min_work = 4096
+
 # recompile functions for distinct patterns of unit strides
 # in array arguments
 stride_specialization = True
 
+# remember which compiled function was used for each signature of
+# argument types and strides, skipping the compiler on later calls
+dispatch_cache = True
+
+# compile new specializations on a background thread, running calls with
+# their signature through the interpreter until the native code is ready
+# (only used along with the dispatch cache)
+background_compilation = False
+
+######################################
+#          RUNTIME PROFILING         #
+######################################
+
+# count the entries, iterations, and cycles of every loop in functions
+# compiled while this is on, see loop_profiler.report() (functions which
+# were already compiled keep running uninstrumented code until the
+# caches are cleared with compile_cache.clear())
+profile_loops = False
+
 ######################################
 #           LLVM OPTIONS             #
 ######################################
@@ -83,4 +164,58 @@ llvm_num_passes = 4
 # run verifier over generated LLVM code?
 llvm_verify = True
 
+######################################
+#          COMPILATION CACHE         #
+######################################
+
+# store optimized LLVM bitcode of compiled functions on disk
+# and reuse it in later processes
+disk_cache = False
+
+# where to keep cached bitcode, defaults to ~/.parakeet_cache
+disk_cache_dir = None
+
+# most entries each in-memory cache of specialized, optimized, or compiled
+# functions holds before evicting the least recently used (None = unbounded)
+max_cache_entries = 1000
+
+######################################
+#             AUTO-TUNING            #
+######################################
+
+# compile each function with the settings which autotune.tune
+# recorded for its signature
+autotune = True
+
+# file holding the recorded settings, defaults to tuning.db
+# in the disk cache directory
+autotune_db = None
+
+# timed runs of each variant during tuning, the fastest one counts
+autotune_repeat = 3
+
+######################################
+#          PARALLEL RUNTIME          #
+######################################
+
+# split the iterations of a function's outermost Map, IndexMap, ParFor,
+# Reduce, IndexReduce, or Scan across a pool of worker threads
+parallel_outer_adverbs = False
+
+# reductions only run in parallel when their combining function is
+# recognizably associative (built from add, multiply, maximum, etc...),
+# set this to parallelize all of them
+parallel_assume_associative = False
+
+# number of worker threads, defaults to the number of cores
+num_threads = None
+
+# iterations per chunk of work, by default a few chunks per thread
+# (fixed for each function when it gets compiled)
+parallel_chunk_size = None
+
+# run smaller iteration spaces serially on the calling thread
+parallel_min_iters = 2
 
+# a parallel scan reads its input twice, so only use it for long scans
+parallel_scan_min_iters = 100000
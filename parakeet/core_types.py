@@ -477,3 +477,44 @@ def ptr_type(t):
     ptr_t = PtrT(t)
     _ptr_types[t] = ptr_t
     return ptr_t
+
+###########################################
+#
+#  SIMD vectors, only created by the
+#  Vectorize transform after lowering
+#
+###########################################
+
+class VectorT(ConcreteT):
+  _members = ['elt_type', 'width']
+
+  def node_init(self):
+    self.nbytes = self.elt_type.nbytes * self.width
+
+  def __str__(self):
+    return "vec%d(%s)" % (self.width, self.elt_type)
+
+  def __eq__(self, other):
+    return isinstance(other, VectorT) and \
+           self.elt_type == other.elt_type and \
+           self.width == other.width
+
+  def __hash__(self):
+    return hash((self.elt_type, self.width))
+
+  def __repr__(self):
+    return str(self)
+
+  @property
+  def ctypes_repr(self):
+    return self.elt_type.ctypes_repr * self.width
+
+_vector_types = {}
+def vector_type(elt_t, width):
+  key = (elt_t, width)
+  if key in _vector_types:
+    return _vector_types[key]
+  else:
+    vec_t = VectorT(elt_t, width)
+    _vector_types[key] = vec_t
+    return vec_t
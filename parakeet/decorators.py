@@ -1,3 +1,4 @@
+import config
 import names
 
 import syntax
@@ -57,6 +58,7 @@ class macro(object):
   def __call__(self, *args, **kwargs):
     import run_function
     if self.call_from_python is None:
+      out = kwargs.pop('out', None)
       n_pos = len(args)
       keywords = kwargs.keys()
 
@@ -73,6 +75,8 @@ class macro(object):
         untyped = self._create_wrapper(n_pos, static_pairs, dynamic_keywords)
         self.wrappers[key] = untyped
       dynamic_kwargs = dict( (k, kwargs[k]) for k in dynamic_keywords)
+      if out is not None:
+        return run_function.run_with_output(untyped, out, args, dynamic_kwargs)
       return run_function.run(untyped, *args, **dynamic_kwargs)
     else:
       return self.call_from_python(*args, **kwargs)
@@ -85,6 +89,9 @@ class macro(object):
       assert isinstance(arg, syntax.Expr), \
           "Macros can only take syntax nodes as arguments, got %s = %s" % \
           (name, arg)
+    assert 'out' not in kwargs, \
+        "Output arguments are only supported when calling %s from Python" % \
+        self.name
     result = self.f(*args, **kwargs)
     assert isinstance(result, syntax.Expr), \
         "Expected macro %s to return syntax expression, got %s" % \
@@ -106,11 +113,53 @@ class staged_macro(object):
     return macro(fn, self.static_names,
                  call_from_python = self.call_from_python)
    
-class jit:
-  def __init__(self, f):
+def _has_param(f, name):
+  code = getattr(f, 'func_code', None)
+  return code is not None and name in code.co_varnames[:code.co_argcount]
+
+class jit(object):
+  def __new__(cls, f = None, signatures = None):
+    # used as @jit(signatures = [...])
+    if f is None:
+      return lambda f: cls(f, signatures)
+    return object.__new__(cls)
+
+  def __init__(self, f, signatures = None):
     self.f = f
+    self.dispatch_table = None
+    # functions with their own 'out' parameter don't
+    # get the out= calling convention
+    self.takes_out = _has_param(f, 'out')
+    # compile the known signatures right away, so any globals the
+    # function uses have to be defined before it is
+    if signatures:
+      import aot
+      aot.precompile(self, signatures)
 
   def __call__(self, *args, **kwargs):
     import run_function
-    return run_function.run(self.f, *args, **kwargs)
+    out = None
+    if not self.takes_out:
+      out = kwargs.pop('out', None)
+    if not config.dispatch_cache:
+      if out is not None:
+        return run_function.run_with_output(self.f, out, args, kwargs)
+      return run_function.run(self.f, *args, **kwargs)
+    if self.dispatch_table is None:
+      self.dispatch_table = run_function.DispatchTable(self.f)
+    return self.dispatch_table(args, kwargs, out)
+
+  def compile_async(self, *args, **kwargs):
+    """
+    Compile the specialization for these arguments on a background thread,
+    returning a future whose ready() says when calls stop being interpreted
+    """
+
+    import run_function
+    out = None
+    if not self.takes_out:
+      out = kwargs.pop('out', None)
+    if self.dispatch_table is None:
+      self.dispatch_table = run_function.DispatchTable(self.f)
+    return self.dispatch_table.compile_async(args, kwargs, out)
 
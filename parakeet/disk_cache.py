@@ -0,0 +1,403 @@
+"""
+Persistent on-disk cache of optimized LLVM bitcode, so that a fresh process
+can reuse a specialization compiled by an earlier one and skip type
+inference, lowering, and LLVM optimization.
+
+Each entry is stored as two files named after the hash of everything which
+could change the generated code:
+  - the source of the function and of every Python function it refers to
+  - the values of constant globals and closure cells baked into the code
+  - the Parakeet types of the arguments and their pattern of unit strides
+  - the optimization flags in config
+  - the source of Parakeet itself
+
+'<key>.bc' holds the bitcode of the compiled function and everything it calls,
+'<key>.meta' a pickled description of its name and signature.
+
+Usage from the command line:
+  python -m parakeet.disk_cache list
+  python -m parakeet.disk_cache clear
+"""
+
+import cPickle
+import cStringIO
+import glob
+import hashlib
+import inspect
+import os
+import tempfile
+import time
+import types
+
+import llvm.core as llc
+import numpy as np
+
+import blas
+import config
+import core_types
+import stride_specialization
+import syntax_helpers
+
+from array_type import ArrayT, SliceT, make_array_type, make_slice_type
+from core_types import NoneT, NoneType, ScalarT, TypeValueT
+from decorators import jit, macro
+from llvm_context import global_context
+from tuple_type import TupleT, make_tuple_type
+
+# bump whenever the layout of cache entries changes
+cache_format_version = 1
+
+def cache_dir(create = True):
+  if config.disk_cache_dir is not None:
+    path = config.disk_cache_dir
+  else:
+    path = os.path.join(os.path.expanduser("~"), ".parakeet_cache")
+  if create and not os.path.exists(path):
+    os.makedirs(path)
+  return path
+
+class UncacheableType(Exception):
+  def __init__(self, t):
+    self.t = t
+
+  def __str__(self):
+    return "UncacheableType(%s)" % (self.t,)
+
+def encode_type(t):
+  """
+  Parakeet types hold references to ctypes classes and compiled functions, so
+  write them out as nested tuples of plain values instead
+  """
+
+  c = t.__class__
+  if isinstance(t, ScalarT):
+    return ('scalar', t.dtype.str)
+  elif c is NoneT:
+    return ('none',)
+  elif c is ArrayT:
+    return ('array', encode_type(t.elt_type), t.rank)
+  elif c is TupleT:
+    return ('tuple', tuple(encode_type(elt_t) for elt_t in t.elt_types))
+  elif c is SliceT:
+    return ('slice', encode_type(t.start_type), encode_type(t.stop_type),
+            encode_type(t.step_type))
+  elif c is TypeValueT:
+    return ('type_value', encode_type(t.type))
+  else:
+    raise UncacheableType(t)
+
+def decode_type(encoded):
+  tag = encoded[0]
+  if tag == 'scalar':
+    return core_types.from_dtype(np.dtype(encoded[1]))
+  elif tag == 'none':
+    return NoneType
+  elif tag == 'array':
+    return make_array_type(decode_type(encoded[1]), encoded[2])
+  elif tag == 'tuple':
+    return make_tuple_type([decode_type(elt) for elt in encoded[1]])
+  elif tag == 'slice':
+    return make_slice_type(*[decode_type(elt) for elt in encoded[1:]])
+  else:
+    assert tag == 'type_value', "Unknown type encoding %s" % (encoded,)
+    return TypeValueT(decode_type(encoded[1]))
+
+def _code_names(code):
+  """Global names referenced by a code object and any functions nested in it"""
+
+  names = list(code.co_names)
+  for c in code.co_consts:
+    if isinstance(c, types.CodeType):
+      names.extend(_code_names(c))
+  return names
+
+def _fingerprint_value(name, value, h, seen):
+  if syntax_helpers.is_python_constant(value):
+    h.update("%s = %r;" % (name, value))
+  elif isinstance(value, np.dtype):
+    h.update("%s = %s;" % (name, value))
+  elif isinstance(value, (types.FunctionType, jit, macro)):
+    h.update("%s = fn;" % name)
+    _fingerprint_fn(value, h, seen)
+  # everything else is either a module or a value which gets passed
+  # into the compiled code as an argument, so only its type matters
+
+def _fingerprint_fn(fn, h, seen):
+  while isinstance(fn, jit):
+    fn = fn.f
+  if fn in seen:
+    return
+  seen.add(fn)
+  if isinstance(fn, macro):
+    # macros are defined inside Parakeet, covered by the
+    # fingerprint of Parakeet's own source
+    h.update("macro %s;" % fn.name)
+    return
+  h.update(inspect.getsource(fn))
+  globals_dict = fn.func_globals
+  for name in sorted(set(_code_names(fn.func_code))):
+    if name in globals_dict:
+      _fingerprint_value(name, globals_dict[name], h, seen)
+  closure_cells = fn.func_closure if fn.func_closure else ()
+  for (name, cell) in zip(fn.func_code.co_freevars, closure_cells):
+    _fingerprint_value(name, cell.cell_contents, h, seen)
+
+_parakeet_fingerprint = None
+def parakeet_fingerprint():
+  """Any change to the compiler itself invalidates the whole cache"""
+
+  global _parakeet_fingerprint
+  if _parakeet_fingerprint is None:
+    h = hashlib.sha1()
+    h.update(str(cache_format_version))
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for filename in sorted(glob.glob(os.path.join(package_dir, "*.py"))):
+      with open(filename) as f:
+        h.update(f.read())
+    _parakeet_fingerprint = h.hexdigest()
+  return _parakeet_fingerprint
+
+def config_fingerprint():
+  flags = []
+  for (k,v) in sorted(vars(config).iteritems()):
+    if k.startswith('opt_') or k.startswith('llvm_') or \
+       k == 'stride_specialization':
+      flags.append((k,v))
+  return repr(flags)
+
+def cache_key(fn, arg_values, arg_types, include_config = True):
+  """
+  Hash of everything that determines the compiled code for the given Python
+  function and actual arguments. Returns None if the function or any of its
+  argument types can't be cached. Without include_config the key stays the
+  same across all settings of the optimization flags.
+  """
+
+  if not isinstance(fn, (types.FunctionType, jit)):
+    return None
+  h = hashlib.sha1()
+  h.update(parakeet_fingerprint())
+  if include_config:
+    h.update(config_fingerprint())
+  try:
+    _fingerprint_fn(fn, h, set([]))
+  except (IOError, TypeError):
+    # source isn't available, i.e. function defined in the interpreter
+    return None
+
+  keywords = sorted(arg_types.keywords.keys())
+  try:
+    encoded_types = [encode_type(t) for t in arg_types.positional]
+    encoded_types.extend((k, encode_type(arg_types.keywords[k]))
+                         for k in keywords)
+    if arg_types.starargs:
+      encoded_types.append(('*', encode_type(arg_types.starargs)))
+  except UncacheableType:
+    return None
+  h.update(repr(encoded_types))
+
+  if config.stride_specialization:
+    values = list(arg_values.positional)
+    values.extend(arg_values.keywords[k] for k in keywords)
+    if arg_values.starargs:
+      values.append(arg_values.starargs)
+    h.update(str(stride_specialization.from_python_list(values)))
+  return h.hexdigest()
+
+class CachedSignature(object):
+  """
+  Stands in for the TypedFn of a function loaded from disk, carrying only the
+  information needed to call into its native code
+  """
+
+  def __init__(self, name, input_types, return_type):
+    self.name = name
+    self.input_types = tuple(input_types)
+    self.return_type = return_type
+
+  def __str__(self):
+    return "CachedSignature(%s : %s => %s)" % \
+           (self.name, self.input_types, self.return_type)
+
+def _path(key, ext):
+  return os.path.join(cache_dir(), key + ext)
+
+def _reachable_functions(llvm_fn):
+  names = set([llvm_fn.name])
+  stack = [llvm_fn]
+  while stack:
+    f = stack.pop()
+    for bb in f.basic_blocks:
+      for instr in bb.instructions:
+        if isinstance(instr, llc.CallOrInvokeInstruction):
+          callee = instr.called_function
+          if callee is not None and callee.name not in names:
+            names.add(callee.name)
+            stack.append(callee)
+  return names
+
+def _extract_module(llvm_fn):
+  """
+  Copy of the global module stripped down to the given function and
+  everything it calls
+  """
+
+  module = llvm_fn.module.clone()
+  keep = _reachable_functions(llvm_fn)
+  removed_any = True
+  while removed_any:
+    removed_any = False
+    for f in list(module.functions):
+      if f.name not in keep and f.use_count == 0:
+        f.delete()
+        removed_any = True
+  return module
+
+def _write_atomically(path, write_fn, mode = 'wb'):
+  fd, tmp_path = tempfile.mkstemp(dir = os.path.dirname(path))
+  with os.fdopen(fd, mode) as f:
+    write_fn(f)
+  os.rename(tmp_path, path)
+
+def serialize(llvm_fn, parakeet_fn, python_fn = None):
+  """
+  Description of a compiled function's signature along with the bitcode of it
+  and everything it calls, or None if its types can't be written out
+  """
+
+  try:
+    encoded_inputs = [encode_type(t) for t in parakeet_fn.input_types]
+    encoded_return = encode_type(parakeet_fn.return_type)
+  except UncacheableType:
+    return None
+  module = _extract_module(llvm_fn)
+  meta = {
+    'version' : cache_format_version,
+    'name' : llvm_fn.name,
+    'python_name' : getattr(python_fn, '__name__', str(python_fn)),
+    'input_types' : encoded_inputs,
+    'return_type' : encoded_return,
+    'created' : time.time(),
+  }
+  buf = cStringIO.StringIO()
+  module.to_bitcode(buf)
+  return meta, buf.getvalue()
+
+def link(meta, bitcode, prefix, llvm_cxt = global_context):
+  """
+  Link serialized bitcode into the given LLVM context, returning the LLVM
+  function, signature, and execution engine of the function it describes
+  """
+
+  module = llc.Module.from_bitcode(cStringIO.StringIO(bitcode))
+  # bind the symbols of any BLAS routines the code calls
+  blas.addresses()
+  # names were only unique within the process which compiled
+  # them, so tag every definition before linking
+  for f in module.functions:
+    if not f.is_declaration:
+      f.name = prefix + f.name
+  llvm_cxt.module.link_in(module)
+  llvm_fn = llvm_cxt.module.get_function_named(prefix + meta['name'])
+  signature = CachedSignature(llvm_fn.name,
+                              [decode_type(t) for t in meta['input_types']],
+                              decode_type(meta['return_type']))
+  return llvm_fn, signature, llvm_cxt.exec_engine
+
+def store(key, llvm_fn, parakeet_fn, python_fn = None):
+  serialized = serialize(llvm_fn, parakeet_fn, python_fn)
+  if serialized is None:
+    return False
+  meta, bitcode = serialized
+  _write_atomically(_path(key, ".bc"), lambda f: f.write(bitcode))
+  _write_atomically(_path(key, ".meta"),
+                    lambda f: cPickle.dump(meta, f, cPickle.HIGHEST_PROTOCOL))
+  return True
+
+# keys already linked into the global module by this process
+_loaded = {}
+
+def load(key, llvm_cxt = global_context):
+  """
+  Link a cached function into the given LLVM context, returning its LLVM
+  function, signature and execution engine or None if the key isn't cached
+  """
+
+  if key in _loaded:
+    return _loaded[key]
+  meta_path = _path(key, ".meta")
+  bitcode_path = _path(key, ".bc")
+  if not (os.path.exists(meta_path) and os.path.exists(bitcode_path)):
+    return None
+  with open(meta_path, 'rb') as f:
+    meta = cPickle.load(f)
+  if meta.get('version') != cache_format_version:
+    return None
+  with open(bitcode_path, 'rb') as f:
+    bitcode = f.read()
+  result = link(meta, bitcode, "cached_%s_" % key[:12], llvm_cxt)
+  _loaded[key] = result
+  return result
+
+def entries():
+  """Metadata of every entry in the cache, most recently created first"""
+
+  result = []
+  for meta_path in glob.glob(os.path.join(cache_dir(), "*.meta")):
+    key = os.path.basename(meta_path)[:-len(".meta")]
+    with open(meta_path, 'rb') as f:
+      meta = cPickle.load(f)
+    meta['key'] = key
+    bitcode_path = _path(key, ".bc")
+    if os.path.exists(bitcode_path):
+      meta['nbytes'] = os.path.getsize(bitcode_path)
+    else:
+      meta['nbytes'] = 0
+    result.append(meta)
+  result.sort(key = lambda meta: meta.get('created', 0), reverse = True)
+  return result
+
+def clear():
+  """Delete every entry in the cache, returns the number of entries removed"""
+
+  count = 0
+  for path in glob.glob(os.path.join(cache_dir(), "*.meta")):
+    os.remove(path)
+    count += 1
+  for path in glob.glob(os.path.join(cache_dir(), "*.bc")):
+    os.remove(path)
+  return count
+
+def warm(fn, *args, **kwargs):
+  """
+  Compile the given function for the types of the supplied arguments and write
+  the result to the cache without running it
+  """
+
+  import run_function
+  old_setting = config.disk_cache
+  config.disk_cache = True
+  try:
+    run_function.compile_for_call(fn, args, kwargs)
+  finally:
+    config.disk_cache = old_setting
+
+def describe(meta):
+  input_types = ", ".join(str(decode_type(t)) for t in meta['input_types'])
+  return_type = decode_type(meta['return_type'])
+  return "%s  %s(%s) -> %s  [%d bytes]" % \
+         (meta['key'][:12], meta['python_name'], input_types, return_type,
+          meta['nbytes'])
+
+if __name__ == '__main__':
+  import sys
+  command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+  if command == 'list':
+    print "Parakeet cache in %s" % cache_dir()
+    for meta in entries():
+      print "  " + describe(meta)
+  elif command == 'clear':
+    print "Removed %d entries from %s" % (clear(), cache_dir())
+  else:
+    print "Usage: python -m parakeet.disk_cache [list|clear]"
+    sys.exit(1)
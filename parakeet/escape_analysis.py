@@ -1,13 +1,14 @@
 import config 
 
-from core_types import ScalarT 
+from core_types import ScalarT, VectorT
 from syntax import Var, Attribute, Tuple 
+from syntax import Alloc, Assign, ForLoop, If, Struct, While
 from syntax_visitor import SyntaxVisitor
 
 empty = set([])
 
 def collect_nonscalar_names(expr):
-  if expr is None or isinstance(expr.type, ScalarT):
+  if expr is None or isinstance(expr.type, (ScalarT, VectorT)):
     return []
   elif expr.__class__ is Var:
     return [expr.name]
@@ -36,7 +37,7 @@ class EscapeAnalysis(SyntaxVisitor):
     all_scalars = True 
     # every name at least aliases it selfcollect_var_names
     for (name,t) in fn.type_env.iteritems():
-      if isinstance(t, ScalarT):
+      if isinstance(t, (ScalarT, VectorT)):
         self.scalars.add(name)
       else:
         self.may_alias[name] = set([name])
@@ -158,3 +159,69 @@ def may_alias(fundef):
 
 def may_escape(fundef):
   return run(fundef).may_escape
+
+def collect_assigned_names(stmts, result = None):
+  """
+  Names of all the variables assigned anywhere in a block, including the
+  blocks of nested statements and the variables bound by their merges
+  """
+
+  if result is None:
+    result = set([])
+  for stmt in stmts:
+    c = stmt.__class__
+    if c is Assign and stmt.lhs.__class__ is Var:
+      result.add(stmt.lhs.name)
+    elif c is If:
+      collect_assigned_names(stmt.true, result)
+      collect_assigned_names(stmt.false, result)
+      result.update(stmt.merge.keys())
+    elif c in (ForLoop, While):
+      collect_assigned_names(stmt.body, result)
+      result.update(stmt.merge.keys())
+  return result
+
+def _collect_allocations(stmts, result):
+  for stmt in stmts:
+    c = stmt.__class__
+    if c is Assign:
+      if stmt.lhs.__class__ is Var and stmt.rhs.__class__ in (Alloc, Struct):
+        result.append(stmt.lhs.name)
+    elif c is If:
+      _collect_allocations(stmt.true, result)
+      _collect_allocations(stmt.false, result)
+    elif c in (ForLoop, While):
+      _collect_allocations(stmt.body, result)
+  return result
+
+def temporaries(fundef):
+  """
+  Variables directly assigned freshly allocated memory (a buffer or a
+  struct) which can't be reached from the function's inputs or its return
+  value, and can therefore be freed once the function returns
+  """
+
+  analysis = run(fundef)
+  result = set([])
+  for name in _collect_allocations(fundef.body, []):
+    aliases = analysis.may_alias.get(name, set([name]))
+    if not any(alias in analysis.may_escape for alias in aliases):
+      result.add(name)
+  return result
+
+def loop_temporaries(fundef, loop, temps):
+  """
+  Temporaries which are dead by the end of every iteration of the given loop:
+  they only alias other variables of the loop body and don't get carried over
+  to the next iteration through the loop's merge
+  """
+
+  analysis = run(fundef)
+  body_names = collect_assigned_names(loop.body)
+  body_names.difference_update(loop.merge.keys())
+  result = set([])
+  for name in temps:
+    if name in body_names and \
+       analysis.may_alias.get(name, set([name])).issubset(body_names):
+      result.add(name)
+  return result
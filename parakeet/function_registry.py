@@ -1,3 +1,8 @@
+import types
+
+import compile_cache
+
+from python_ref import ClosureCellRef
 from syntax import Fn
 
 # python value of a user-defined function mapped to its
@@ -14,3 +19,75 @@ def lookup_python_fn(fn_val):
   """Returns untyped function definition"""
 
   return known_python_functions[fn_val]
+
+# untyped representation of each code object, keyed on the code along with
+# the globals and closure cell values it was translated with, so that new
+# function objects made from the same definition (i.e. by a kernel factory)
+# don't get translated again
+known_code = compile_cache.LRUCache("translations")
+
+# closure values which are keyed by equality, anything else (i.e. two equal
+# tuples or lists) gets keyed by identity. Equal values like 0.0 and -0.0
+# share a translation but python_nonlocals still reads each one's own value.
+_value_types = set([bool, int, long, float, complex, str, unicode,
+                    types.NoneType])
+
+def _value_key(v):
+  if type(v) in _value_types:
+    return (type(v), v)
+  # the cache entry keeps the value alive, so its id can't be reused
+  return (type(v), id(v))
+
+def code_key(fn_val):
+  cells = fn_val.func_closure if fn_val.func_closure else ()
+  try:
+    cell_values = tuple(cell.cell_contents for cell in cells)
+  except ValueError:
+    # a variable of the enclosing function which isn't assigned yet
+    return None, ()
+  key = (fn_val.func_code, id(fn_val.func_globals),
+         tuple(_value_key(v) for v in cell_values))
+  return key, cell_values
+
+def register_python_code(fn_val, fundef):
+  key, cell_values = code_key(fn_val)
+  if key is not None:
+    # hold on to the globals and closure values so their ids stay unique
+    known_code[key] = (fn_val.func_globals, cell_values, fundef)
+
+def lookup_python_code(fn_val):
+  """
+  Untyped function translated from the same code with the same globals and
+  closure values, or None
+  """
+
+  key, _ = code_key(fn_val)
+  if key is None:
+    return None
+  entry = known_code.get(key)
+  if entry is None:
+    return None
+  return entry[2]
+
+def python_nonlocals(fn_val, fundef):
+  """
+  Closure values of the Python function fn_val in the order fundef takes
+  them. A translation reused for another function made from the same code
+  still refers to the cells of the function it was translated from, so read
+  the values out of fn_val's own cells.
+  """
+
+  import decorators
+  while isinstance(fn_val, decorators.jit):
+    fn_val = fn_val.f
+  cells = getattr(fn_val, 'func_closure', None)
+  if not cells or not fundef.python_refs:
+    return fundef.python_nonlocals()
+  cell_dict = dict(zip(fn_val.func_code.co_freevars, cells))
+  values = []
+  for ref in fundef.python_refs:
+    if isinstance(ref, ClosureCellRef) and ref.name in cell_dict:
+      values.append(cell_dict[ref.name].cell_contents)
+    else:
+      values.append(ref.deref())
+  return values
@@ -1,12 +1,98 @@
+import config
 import inline
 import names
+import prims
 import syntax_helpers
 
 from syntax import Var, Const,  Return, TypedFn, DataAdverb, Adverb
 from syntax import IndexMap, IndexReduce, Map, Reduce, AllPairs
+from syntax_visitor import SyntaxVisitor
 from transform import Transform
 from use_analysis import use_count
 
+class RecomputeCost(SyntaxVisitor):
+  """
+  Rough number of operations it takes to evaluate a function once, which
+  stays unbounded if the function contains loops or adverbs
+  """
+
+  expensive_prims = (prims.divide, prims.mod, prims.power)
+  expensive_cost = 10
+
+  def __init__(self):
+    SyntaxVisitor.__init__(self)
+    self.cost = 0
+    self.bounded = True
+
+  def visit_expr(self, expr):
+    if isinstance(expr, Adverb):
+      self.bounded = False
+    else:
+      SyntaxVisitor.visit_expr(self, expr)
+
+  def visit_PrimCall(self, expr):
+    if isinstance(expr.prim, prims.Float) or \
+       expr.prim in self.expensive_prims:
+      self.cost += self.expensive_cost
+    else:
+      self.cost += 1
+    for arg in expr.args:
+      self.visit_expr(arg)
+
+  def visit_Index(self, expr):
+    self.cost += 1
+    self.visit_expr(expr.value)
+    self.visit_expr(expr.index)
+
+  def visit_Call(self, expr):
+    self.cost += 1
+    if expr.fn.__class__ is TypedFn:
+      self.visit_block(expr.fn.body)
+    for arg in expr.args:
+      self.visit_expr(arg)
+
+  def visit_ForLoop(self, stmt):
+    self.bounded = False
+
+  def visit_While(self, stmt):
+    self.bounded = False
+
+def recompute_cost(fn):
+  """Cost of evaluating the function once, None if it's unbounded"""
+
+  visitor = RecomputeCost()
+  visitor.visit_fn(fn)
+  if visitor.bounded:
+    return visitor.cost
+  return None
+
+class FindConsumers(SyntaxVisitor):
+  """
+  For every variable, the adverbs which take it as one of their arguments
+  (once for each time it occurs among them) in a form Fusion could fuse
+  """
+
+  def __init__(self):
+    SyntaxVisitor.__init__(self)
+    self.consumers = {}
+
+  def visit_Assign(self, stmt):
+    rhs = stmt.rhs
+    if isinstance(rhs, DataAdverb) and rhs.__class__ is not AllPairs and \
+       all(arg.__class__ in (Var, Const) for arg in rhs.args):
+      for arg in rhs.args:
+        if arg.__class__ is Var:
+          self.consumers.setdefault(arg.name, []).append(rhs)
+    SyntaxVisitor.visit_Assign(self, stmt)
+
+  def visit_fn(self, fn):
+    self.consumers.clear()
+    self.visit_block(fn.body)
+    return self.consumers
+
+def find_consumers(fn):
+  return FindConsumers().visit_fn(fn)
+
 def fuse(prev_fn, prev_fixed_args, next_fn, next_fixed_args, fusion_args):
   if syntax_helpers.is_identity_fn(next_fn):
     assert len(next_fixed_args) == 0
@@ -93,6 +179,27 @@ class Fusion(Transform):
   def pre_apply(self, fn):
     # map each variable to
     self.use_counts = use_count(fn)
+    self.consumers = find_consumers(fn)
+
+  def recompute_for_each_consumer(self, name, prev_adverb):
+    """
+    Should a Map whose result has several uses get fused into all of them?
+    Only if every use is an adverb we can fuse it into, so that the
+    intermediate array disappears, and evaluating the Map's function once
+    more for each extra consumer costs at most
+    config.opt_fusion_max_recompute operations per element (which is less
+    than writing the array out and reading it back in)
+    """
+
+    consumers = self.consumers.get(name, [])
+    if prev_adverb.__class__ is not Map or \
+       len(consumers) != self.use_counts.get(name) or \
+       any(c.axis != prev_adverb.axis or
+           not inline.can_inline(self.get_fn(c.fn)) for c in consumers):
+      return False
+    cost = recompute_cost(self.get_fn(prev_adverb.fn))
+    return cost is not None and \
+           cost * (len(consumers) - 1) <= config.opt_fusion_max_recompute
 
   def transform_TypedFn(self, fn):
     if self.fn.copied_by is not None:
@@ -120,8 +227,10 @@ class Fusion(Transform):
 
         for arg_name in adverb_vars:
           n_occurrences = sum((name == arg_name for name in arg_names))
-          if self.use_counts[arg_name] == n_occurrences:
-            prev_adverb = self.adverb_bindings[arg_name]
+          prev_adverb = self.adverb_bindings[arg_name]
+          single_use = self.use_counts[arg_name] == n_occurrences
+          if single_use or \
+             self.recompute_for_each_consumer(arg_name, prev_adverb):
             if inline.can_inline(self.get_fn(prev_adverb.fn)):
              
               # 
@@ -148,7 +257,10 @@ class Fusion(Transform):
                         self.closure_elts(rhs.fn),
                         fusion_args)
                 assert new_fn.return_type == self.return_type(rhs.fn)
-                del self.adverb_bindings[arg_name]
+                # other consumers still get to fuse with a
+                # Map which gets recomputed for each of them
+                if single_use:
+                  del self.adverb_bindings[arg_name]
                 if self.fn.copied_by:
                   new_fn = self.fn.copied_by.apply(new_fn)
                 rhs.fn = self.closure(new_fn, clos_args)
@@ -157,7 +269,8 @@ class Fusion(Transform):
               # 
               # Reduce(IndexMap) -> IndexReduce
               #   
-              elif prev_adverb.__class__ is IndexMap and \
+              elif single_use and \
+                   prev_adverb.__class__ is IndexMap and \
                    rhs.__class__ is Reduce and \
                    len(rhs.args) == 1 and \
                    (self.is_none(rhs.axis) or rhs.args[0].type.rank == 1):
@@ -9,6 +9,7 @@ import syntax
 from args import ActualArgs
 from common import dispatch
 from core_types import ScalarT, StructT
+from function_registry import python_nonlocals
 
 class InterpSemantics(adverb_semantics.AdverbSemantics):
   def size_along_axis(self, value, axis):
@@ -275,22 +276,17 @@ def eval_fn(fn, actuals):
       elts = [wrap_idx(idx) for idx in itertools.product(*ranges)]
       return np.array(elts).reshape((shape))
     
+    def expr_ParFor():
+      fn = eval_expr(expr.fn)
+      shape = eval_expr(expr.shape)
+      return adverb_evaluator.eval_parfor(fn, shape)
+
     def expr_IndexReduce():
       fn = eval_expr(expr.fn)
       combine = eval_expr(expr.combine)
       shape = eval_expr(expr.shape)
-      ranges = [xrange(n) for n in shape]
-        
-      acc = eval_if_expr(expr.init)
-      for idx in itertools.product(*ranges):
-        if len(idx) == 1:
-          idx = idx[0]
-        elt = eval_fn(fn, (idx,))
-        if acc is None:
-          acc = elt 
-        else:
-          elt = eval_fn(combine, (acc, elt))
-      return elt 
+      init = eval_if_expr(expr.init)
+      return adverb_evaluator.eval_index_reduce(fn, combine, shape, init)
     
     def expr_Map():
       fn = eval_expr(expr.fn)
@@ -331,7 +327,7 @@ def eval_fn(fn, actuals):
     # they have to be translated into Parakeet functions
     if isinstance(result, types.FunctionType):
       fundef = ast_conversion.translate_function_value(result)
-      return ClosureVal(fundef, fundef.python_nonlocals())
+      return ClosureVal(fundef, python_nonlocals(result, fundef))
     else:
       return result
 
@@ -1,4 +1,5 @@
 import os
+import weakref
 
 import llvm.core as llc 
 
@@ -6,20 +7,25 @@ from llvm.core import Builder, ATTR_NO_CAPTURE, Module
 from llvm.core import Type as lltype
 
 
+import blas
+import compile_cache
+import compile_profiler
 import config
 import escape_analysis
 import llvm_context
 import llvm_convert
+import loop_profiler
 import llvm_prims
 import llvm_types
 import prims
 import syntax_helpers
 
+from array_type import ArrayT
 from core_types import BoolT, FloatT, SignedT, UnsignedT, ScalarT, NoneT
-from core_types import Int32, Int64, PtrT
-from llvm_helpers import const, int32, zero 
+from core_types import Int32, Int64, PtrT, VectorT
+from llvm_helpers import const, int32, int64, zero 
 from llvm_types import llvm_value_type, llvm_ref_type
-from syntax import Var, Struct, Index, TypedFn, Attribute
+from syntax import Alloc, Const, Var, Struct, Index, TypedFn, Attribute
 
 _escape_analysis_cache = {}
 class Compiler(object):
@@ -29,6 +35,19 @@ class Compiler(object):
       self.may_escape = escape_analysis.may_escape(fundef)
     else:
       self.may_escape = None
+    # memory which isn't reachable from the inputs or result
+    # gets freed when we return
+    if config.opt_free_temporaries:
+      self.temporaries = escape_analysis.temporaries(fundef)
+    else:
+      self.temporaries = set([])
+    # for each loop we're currently inside of, the temporaries
+    # which are dead at the end of every iteration
+    self.loop_temporaries = []
+    # variables whose memory came from alloca, don't free those
+    self.stack_allocated = set([])
+    # counters of the profiled loops we're currently inside of
+    self.profiled_loops = []
     self.llvm_context = llvm_cxt
     self.vars = {}
     self.initialized = set([])
@@ -69,6 +88,10 @@ class Compiler(object):
         llvm_t = llvm_ref_type(t)
         stack_val = builder.alloca(llvm_t, name)
         self.vars[name] = stack_val
+        # freeing a null pointer does nothing, which covers
+        # the paths where a temporary never gets assigned
+        if name in self.temporaries:
+          builder.store(llc.Constant.null(llvm_t), stack_val)
 
     for llvm_arg, name in zip(self.llvm_fn.args, fundef.arg_names):
       self.initialized.add(name)
@@ -131,20 +154,106 @@ class Compiler(object):
 
     return struct_ptr
 
-  def compile_Alloc(self, expr, builder):
+  def compile_Alloc(self, expr, builder, local = False):
     elt_t = expr.elt_type
     llvm_elt_t = llvm_types.llvm_value_type(elt_t)
     n_elts = self.compile_expr(expr.count, builder)
+    if local:
+      # allocate at the start of the entry block so that
+      # the stack doesn't grow when we're inside a loop
+      alloca_builder = Builder.new(self.entry_block)
+      alloca_builder.position_at_beginning(self.entry_block)
+      return alloca_builder.alloca_array(llvm_elt_t, n_elts, "local_data_ptr")
     return builder.malloc_array(llvm_elt_t, n_elts, "data_ptr")
 
+  def stack_allocatable(self, name, expr):
+    """
+    Small buffers with a constant size can live on the stack if they're
+    temporaries which are dead by the end of the innermost enclosing loop
+    """
+
+    elt_size = getattr(expr.elt_type, 'nbytes', None)
+    if name not in self.temporaries or elt_size is None or \
+       expr.count.__class__ is not Const or \
+       expr.count.value * elt_size > config.stack_alloc_max_bytes:
+      return False
+    return len(self.loop_temporaries) == 0 or \
+           name in self.loop_temporaries[-1]
+
+  def free_temporaries(self, names, builder):
+    for name in names:
+      if name in self.initialized:
+        ref = self.vars[name]
+        builder.free(builder.load(ref, name + "_ptr"))
+        builder.store(llc.Constant.null(ref.type.pointee), ref)
+
   def compile_Index(self, expr, builder):
     llvm_arr = self.compile_expr(expr.value, builder)
     llvm_index = self.compile_expr(expr.index, builder)
     pointer = builder.gep(llvm_arr, [llvm_index], "elt_pointer")
+    if isinstance(expr.type, VectorT):
+      # consecutive elements starting at the index, which is only
+      # guaranteed to be aligned to the size of one element
+      pointer = self.vector_pointer(pointer, expr.type, builder)
+      return builder.load(pointer, "vec", align = expr.type.elt_type.nbytes)
     elt = builder.load(pointer, "elt", align = 16) #, invariant = True)
 
     return elt
 
+  def vector_pointer(self, elt_pointer, vec_t, builder):
+    llvm_ptr_t = lltype.pointer(llvm_value_type(vec_t))
+    return builder.bitcast(elt_pointer, llvm_ptr_t, "vec_pointer")
+
+  def compile_VectorSplat(self, expr, builder):
+    llvm_value = self.compile_expr(expr.value, builder)
+    vec = llc.Constant.undef(llvm_value_type(expr.type))
+    for i in xrange(expr.type.width):
+      vec = builder.insert_element(vec, llvm_value, int32(i), "splat")
+    return vec
+
+  def compile_VectorReduce(self, expr, builder):
+    llvm_vec = self.compile_expr(expr.vector, builder)
+    vec_t = expr.vector.type
+    result = builder.extract_element(llvm_vec, int32(0), "lane")
+    for i in xrange(1, vec_t.width):
+      lane = builder.extract_element(llvm_vec, int32(i), "lane")
+      result = self.prim(expr.prim, vec_t.elt_type, [result, lane], builder)
+    return result
+
+  def compile_BlasCall(self, expr, builder):
+    # make sure the symbol gets bound before the function is JIT compiled
+    assert expr.name in blas.addresses(), \
+        "BLAS routine %s isn't available" % expr.name
+    # allocate the arguments passed by reference at the start of
+    # the entry block so that the stack doesn't grow inside loops
+    alloca_builder = Builder.new(self.entry_block)
+    alloca_builder.position_at_beginning(self.entry_block)
+    llvm_args = []
+    for arg in expr.args:
+      if isinstance(arg.type, ArrayT):
+        data_ptr, _ = self.attribute_lookup(arg, 'data', builder)
+        offset_ptr, _ = self.attribute_lookup(arg, 'offset', builder)
+        data = builder.load(data_ptr, "blas_data")
+        offset = builder.load(offset_ptr, "blas_offset")
+        llvm_args.append(builder.gep(data, [offset], "blas_array"))
+      else:
+        ref = alloca_builder.alloca(llvm_value_type(arg.type), "blas_arg")
+        builder.store(self.compile_expr(arg, builder), ref)
+        llvm_args.append(ref)
+    if isinstance(expr.type, NoneT):
+      llvm_result_t = llvm_types.void_t
+      result_name = ""
+    else:
+      llvm_result_t = llvm_value_type(expr.type)
+      result_name = "blas_result"
+    fn_t = lltype.function(llvm_result_t, [arg.type for arg in llvm_args])
+    blas_fn = self.llvm_context.module.get_or_insert_function(
+        fn_t, blas.symbol(expr.name))
+    result = builder.call(blas_fn, llvm_args, result_name)
+    if isinstance(expr.type, NoneT):
+      return const(0, Int64)
+    return result
+
   def compile_Attribute(self, expr, builder):
     field_ptr, _ = \
         self.attribute_lookup(expr.value, expr.name, builder)
@@ -152,13 +261,12 @@ class Compiler(object):
     return field_value
 
   def compile_TypedFn(self, expr, builder):
-    (target_fn, _, _) = compile_fn(expr)
-    return target_fn
+    return compile_in_module(expr, self.llvm_context)
 
   def compile_Call(self, expr, builder):
     assert expr.fn.__class__ is TypedFn
     typed_fundef = expr.fn
-    (target_fn, _, _) = compile_fn(typed_fundef)
+    target_fn = compile_in_module(typed_fundef, self.llvm_context)
     arg_types = syntax_helpers.get_types(expr.args)
     llvm_args = [self.compile_expr(arg, builder) for arg in expr.args]
     assert len(arg_types) == len(llvm_args)
@@ -278,7 +386,8 @@ class Compiler(object):
       neg_value = self.neg(x, builder)
       return builder.select(bit, x, neg_value)
     elif isinstance(prim, prims.Float): 
-      llvm_op = llvm_prims.get_float_unary_op(prim, t)
+      llvm_op = llvm_prims.get_float_unary_op(prim, t,
+                                              self.llvm_context.module)
       return builder.call(llvm_op, llvm_args)
     
     else:
@@ -289,6 +398,8 @@ class Compiler(object):
     # type specialization should have made types of arguments uniform,
     # so we only need to check the type of the first arg
     t = args[0].type
+    if isinstance(t, VectorT):
+      t = t.elt_type
     llvm_args = [self.compile_expr(arg, builder) for arg in args]
     return self.prim(expr.prim, t, llvm_args, builder)
 
@@ -304,6 +415,13 @@ class Compiler(object):
        stmt.rhs.__class__ is Struct and \
        stmt.lhs.name  not in self.may_escape:
       value = self.compile_Struct(stmt.rhs, builder, local = True)
+      self.stack_allocated.add(stmt.lhs.name)
+    elif self.may_escape is not None and \
+         stmt.lhs.__class__ is Var and \
+         stmt.rhs.__class__ is Alloc and \
+         self.stack_allocatable(stmt.lhs.name, stmt.rhs):
+      value = self.compile_Alloc(stmt.rhs, builder, local = True)
+      self.stack_allocated.add(stmt.lhs.name)
     else:
       value = self.compile_expr(stmt.rhs, builder)
     if stmt.lhs.__class__ is Var:
@@ -320,6 +438,14 @@ class Compiler(object):
       index = self.compile_expr(stmt.lhs.index, builder)
       index = llvm_convert.from_signed(index, Int32, builder)
       ref = builder.gep(base_ptr, [index], "elt_ptr")
+      if isinstance(stmt.lhs.type, VectorT):
+        assert stmt.lhs.type.elt_type == lhs_t
+        lhs_t = stmt.lhs.type
+        ref = self.vector_pointer(ref, lhs_t, builder)
+        assert lhs_t == rhs_t, \
+            "Type mismatch between LHS %s and RHS %s" % (lhs_t, rhs_t)
+        builder.store(value, ref, align = lhs_t.elt_type.nbytes)
+        return builder, False
     else:
       assert stmt.lhs.__class__ is Attribute, \
           "Unexpected LHS: %s" % stmt.lhs
@@ -338,9 +464,76 @@ class Compiler(object):
 
   def compile_Return(self, stmt, builder):
     ret_val = self.compile_expr(stmt.value, builder)
+    self.free_temporaries(self.heap_temporaries(self.temporaries), builder)
     builder.ret(ret_val)
     return builder, True
 
+  def heap_temporaries(self, names):
+    return sorted(name for name in names if name not in self.stack_allocated)
+
+  def enter_loop(self, stmt):
+    self.loop_temporaries.append(
+      escape_analysis.loop_temporaries(self.parakeet_fundef, stmt,
+                                       self.temporaries))
+
+  def exit_loop(self, builder):
+    """
+    Free the temporaries allocated in the body of the loop we're leaving,
+    which has to happen at the end of every iteration
+    """
+
+    names = self.loop_temporaries.pop()
+    if builder is not None:
+      self.free_temporaries(self.heap_temporaries(names), builder)
+
+  def add_to_counter(self, loop, field, value, builder):
+    addr = const(loop.address(field), Int64)
+    ptr = builder.inttoptr(addr, llvm_types.ptr_int64_t, "counter_ptr")
+    old_value = builder.load(ptr, "counter")
+    builder.store(builder.add(old_value, value, "new_counter"), ptr)
+
+  def read_cycle_counter(self, builder):
+    fn_t = lltype.function(llvm_types.int64_t, [])
+    read_fn = self.llvm_context.module.get_or_insert_function(
+        fn_t, "llvm.readcyclecounter")
+    return builder.call(read_fn, [], "cycles")
+
+  def start_loop_profile(self, stmt, builder):
+    """
+    If we're instrumenting loops, count one more entry into this loop and
+    read the cycle counter before it starts
+    """
+
+    if not config.profile_loops:
+      return None
+    source_info = stmt.source_info
+    if source_info is None and self.profiled_loops:
+      # loops generated from an adverb only carry the
+      # source of their outermost statement
+      source_info = self.profiled_loops[-1][0].source_info
+    loop = loop_profiler.new_loop(self.llvm_context.name,
+                                  self.parakeet_fundef.name,
+                                  stmt.node_type(),
+                                  source_info,
+                                  len(self.profiled_loops))
+    self.add_to_counter(loop, loop_profiler.ENTRIES, int64(1), builder)
+    profile = (loop, self.read_cycle_counter(builder))
+    self.profiled_loops.append(profile)
+    return profile
+
+  def count_iteration(self, profile, builder):
+    if profile is not None:
+      loop, _ = profile
+      self.add_to_counter(loop, loop_profiler.ITERATIONS, int64(1), builder)
+
+  def end_loop_profile(self, profile, builder):
+    if profile is not None:
+      self.profiled_loops.pop()
+      loop, start_cycles = profile
+      elapsed = builder.sub(self.read_cycle_counter(builder), start_cycles,
+                            "elapsed_cycles")
+      self.add_to_counter(loop, loop_profiler.CYCLES, elapsed, builder)
+
   def compile_merge_left(self, phi_nodes, builder):
     for name, (left, _) in phi_nodes.iteritems():
       ref = self.vars[name]
@@ -379,6 +572,8 @@ class Compiler(object):
     loop_bb, body_start_builder = self.new_block("loop_body")
     after_bb, after_builder = self.new_block("after_loop")
 
+    profile = self.start_loop_profile(stmt, builder)
+
     # WARNING: Assuming loop is always increasing,
     # only enter the loop if we're less than the stopping value
     enter_cond = self.cmp(prims.less, loop_var_t,  start, stop,
@@ -386,8 +581,11 @@ class Compiler(object):
     builder.cbranch(enter_cond, loop_bb, after_bb)
 
     # TODO: what should we do if the body always ends in a return statement?
+    self.enter_loop(stmt)
     body_end_builder, body_always_returns = \
       self.compile_block(stmt.body, body_start_builder)
+    if not body_always_returns:
+      self.count_iteration(profile, body_end_builder)
 
     counter_at_end = body_end_builder.load(loop_var)
     # increment the loop counter
@@ -396,10 +594,12 @@ class Compiler(object):
                      body_end_builder,  "incr_loop_var")
     body_end_builder.store(incr, loop_var)
     self.compile_merge_right(stmt.merge, body_end_builder)
+    self.exit_loop(None if body_always_returns else body_end_builder)
 
     exit_cond = self.cmp(prims.less, loop_var_t, incr, stop,
                          body_end_builder, "exit_cond")
     body_end_builder.cbranch(exit_cond, loop_bb, after_bb)
+    self.end_loop_profile(profile, after_builder)
     # WARNING: what if the loop doesn't run? Should
     # we still be returning 'body_always_returns'?
     return after_builder, body_always_returns
@@ -413,20 +613,27 @@ class Compiler(object):
     loop_bb, body_start_builder = self.new_block("loop_body")
 
     after_bb, after_builder = self.new_block("after_loop")
+    profile = self.start_loop_profile(stmt, builder)
     enter_cond = self.compile_expr(stmt.cond, builder)
     enter_cond = llvm_convert.to_bit(enter_cond, builder)
     builder.cbranch(enter_cond, loop_bb, after_bb)
 
+    self.enter_loop(stmt)
     body_end_builder, body_always_returns = \
         self.compile_block(stmt.body, body_start_builder)
-    if not body_always_returns:
+    if body_always_returns:
+      self.exit_loop(None)
+    else:
       exit_bb, exit_builder = self.new_block("loop_exit")
+      self.count_iteration(profile, body_end_builder)
       self.compile_merge_right(stmt.merge, body_end_builder)
       repeat_cond = self.compile_expr(stmt.cond, body_end_builder)
       repeat_cond = llvm_convert.to_bit(repeat_cond, body_end_builder)
+      self.exit_loop(body_end_builder)
       body_end_builder.cbranch(repeat_cond, loop_bb, exit_bb)
       exit_builder.branch(after_bb)
 
+    self.end_loop_profile(profile, after_builder)
     return after_builder, False
 
   def compile_If(self, stmt, builder):
@@ -499,11 +706,68 @@ class Compiler(object):
   def compile_body(self, body):
     return self.compile_block(body, builder = self.entry_builder)
 
-compiled_functions = {}
-def compile_fn(fundef):
+# modules whose NativeCode handles were collected
+_dead_modules = []
+
+class NativeCode(object):
+  """
+  Keeps the module holding a compiled function loaded for as long as either
+  the compile cache or some CompiledFn refers to it
+  """
+
+  def __init__(self, llvm_cxt):
+    self.llvm_context = llvm_cxt
+
+  def __del__(self):
+    # might run in the middle of a compilation, so
+    # only queue the module up for unloading
+    _dead_modules.append(self.llvm_context)
+
+def free_dead_modules():
+  """
+  Unload the modules of unreferenced functions. Every module carries its own
+  copy of the functions it calls, so nothing else can still depend on them.
+  """
+
+  while _dead_modules:
+    _dead_modules.pop().unload()
+
+# name of each compiled LLVM function -> its NativeCode handle,
+# which lives as long as the compile cache or a CompiledFn holds it
+_native_code = weakref.WeakValueDictionary()
+
+def native_code(llvm_fn):
+  return _native_code.get(llvm_fn.name)
+
+def compile_in_module(fundef, llvm_cxt):
+  """
+  Compile a function into the given module unless it's already in there,
+  along with everything it calls
+  """
+
   key = fundef.name, fundef.copied_by
-  if key in compiled_functions:
-    return compiled_functions[key]
+  llvm_fn = llvm_cxt.functions.get(key)
+  if llvm_fn is None:
+    compiler = Compiler(fundef, llvm_cxt)
+    llvm_cxt.functions[key] = compiler.llvm_fn
+    compiler.compile_body(fundef.body)
+    llvm_fn = compiler.llvm_fn
+  return llvm_fn
+
+compiled_functions = compile_cache.LRUCache("llvm")
+def compile_fn(fundef):
+  """
+  Compile a top-level function into a module of its own, which gets
+  optimized on its own and added to the shared execution engine
+  """
+
+  # instrumented and plain code for the same function can't be shared
+  key = fundef.name, fundef.copied_by, config.profile_loops
+  cached = compiled_functions.get(key)
+  if cached is not None:
+    compile_profiler.cache_hit("llvm", fundef.name, fundef)
+    result, _ = cached
+    return result
   
   if config.print_lowered_function:
     print
@@ -512,19 +776,23 @@ def compile_fn(fundef):
     print repr(fundef)
     print
 
-  compiler = Compiler(fundef)
-  compiler.compile_body(fundef.body)
+  llvm_cxt = llvm_context.module_context(fundef.name)
+  with compile_profiler.stage("llvm_codegen", fundef.name, fundef,
+                              cache = True):
+    llvm_fn = compile_in_module(fundef, llvm_cxt)
   if config.print_unoptimized_llvm:
     print "=== LLVM before optimizations =="
     print
-    print compiler.llvm_context.module
+    print llvm_cxt.module
     print
-  compiler.llvm_context.run_passes(compiler.llvm_fn)
+  with compile_profiler.stage("llvm_optimize", fundef.name, llvm_fn) as s:
+    llvm_cxt.optimize()
+    s.result(llvm_fn)
 
   if config.print_optimized_llvm:
     print "=== LLVM after optimizations =="
     print
-    print compiler.llvm_context.module
+    print llvm_cxt.module
     print
 
   if config.print_x86:
@@ -532,7 +800,7 @@ def compile_fn(fundef):
     print
     start_printing = False
     w,r = os.popen2("llc")
-    w.write(str(compiler.llvm_context.module))
+    w.write(str(llvm_cxt.module))
     w.close()
     assembly_str = r.read()
     r.close()
@@ -545,6 +813,8 @@ def compile_fn(fundef):
       if start_printing:
         print l
 
-  result = (compiler.llvm_fn, fundef, compiler.llvm_context.exec_engine)
-  compiled_functions[key] = result
+  result = (llvm_fn, fundef, llvm_cxt.exec_engine)
+  handle = NativeCode(llvm_cxt)
+  _native_code[llvm_fn.name] = handle
+  compiled_functions[key] = (result, handle)
   return result
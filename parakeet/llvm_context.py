@@ -1,10 +1,15 @@
+import compile_profiler
 import config
 import llvm.core as core
 import llvm.ee as ee
 import llvm.passes as passes
 
 class LLVM_Context:
-  """Combine a module, exec engine, and pass manager into a single object"""
+  """
+  Combine a module, exec engine, and pass manager into a single object. Given
+  an existing execution engine the module gets added to it, otherwise the
+  context creates an engine of its own.
+  """
 
   _verify_passes = [
     'preverify',
@@ -66,31 +71,87 @@ class LLVM_Context:
   ]
 
   def __init__(self, module_name, optimize = config.llvm_optimize,
-               verify = config.llvm_verify):
+               verify = config.llvm_verify, exec_engine = None):
+    self.name = module_name
     self.module = core.Module.new(module_name)
-    self.engine_builder = ee.EngineBuilder.new(self.module)
-    self.engine_builder.force_jit()
+    # every function compiled into this module, keyed
+    # by the name and origin of its TypedFn
+    self.functions = {}
     opt_level = 3 if optimize else 0
-    if optimize:
+    if exec_engine is None:
+      self.engine_builder = ee.EngineBuilder.new(self.module)
+      self.engine_builder.force_jit()
       self.engine_builder.opt(opt_level)
+      self.exec_engine = self.engine_builder.create()
     else:
-      self.engine_builder.opt(opt_level)
-    self.exec_engine = self.engine_builder.create()
-    tm = ee.TargetMachine.new(opt = opt_level)
+      self.exec_engine = exec_engine
+      self.exec_engine.add_module(self.module)
+    self.opt_level = opt_level
+    self.pass_manager = self.standard_pass_manager()
+    self.pass_names = list(self._verify_passes)
+    if optimize:
+      self.pass_names.extend(self._opt_passes + self._verify_passes)
+    for p in self.pass_names:
+      self.pass_manager.add(p)
+    # one pass manager per pass, only created when profiling them
+    self.single_pass_managers = None
+
+  def standard_pass_manager(self):
+    tm = ee.TargetMachine.new(opt = self.opt_level)
     _, fpm = passes.build_pass_managers(tm, 
-                                     opt = opt_level,
-                                     loop_vectorize = (opt_level > 0), 
+                                     opt = self.opt_level,
+                                     loop_vectorize = (self.opt_level > 0), 
                                      mod = self.module)
-    self.pass_manager = fpm 
-
-    for p in self._verify_passes:
-      self.pass_manager.add(p)
-    if optimize:
-      for p in (self._opt_passes + self._verify_passes):
-        self.pass_manager.add(p)
+    return fpm
 
   def run_passes(self, llvm_fn, n_iters = config.llvm_num_passes):
+    profile = compile_profiler.active()
+    if profile is not None and profile.llvm_passes:
+      return self.run_passes_separately(llvm_fn, n_iters)
     for _ in xrange(n_iters):
       self.pass_manager.run(llvm_fn)
 
+  def run_passes_separately(self, llvm_fn, n_iters):
+    """Same passes as run_passes, timing each one on its own"""
+
+    if self.single_pass_managers is None:
+      managers = [("standard", self.standard_pass_manager())]
+      for p in self.pass_names:
+        fpm = passes.FunctionPassManager.new(self.module)
+        fpm.add(p)
+        fpm.initialize()
+        managers.append((p, fpm))
+      self.single_pass_managers = managers
+    for _ in xrange(n_iters):
+      for (name, fpm) in self.single_pass_managers:
+        with compile_profiler.stage("llvm_pass", name, llvm_fn) as s:
+          fpm.run(llvm_fn)
+          s.result(llvm_fn)
+
+  def optimize(self, n_iters = config.llvm_num_passes):
+    """Run the optimization passes over every function defined in the module"""
+
+    for llvm_fn in self.module.functions:
+      if not llvm_fn.is_declaration:
+        self.run_passes(llvm_fn, n_iters)
+
+  def unload(self):
+    """Free the machine code of the module and take it out of the engine"""
+
+    # not every version of llvmpy exposes this
+    free_machine_code = getattr(self.exec_engine, 'free_machine_code_for', None)
+    if free_machine_code is not None:
+      for llvm_fn in self.module.functions:
+        if not llvm_fn.is_declaration:
+          free_machine_code(llvm_fn)
+    self.exec_engine.remove_module(self.module)
+
 global_context = LLVM_Context("module")
+
+def module_context(name):
+  """
+  Fresh module for compiling one top-level function and everything it calls,
+  sharing the global execution engine
+  """
+
+  return LLVM_Context(name, exec_engine = global_context.exec_engine)
@@ -71,16 +71,14 @@ bool_binops = {
 import core_types 
 import llvm_types
 
-from llvm_context import global_context
-
 float32_fn_t = llc.Type.function(llvm_types.float32_t, [llvm_types.float32_t])
 float64_fn_t = llc.Type.function(llvm_types.float64_t, [llvm_types.float64_t])
 
-def float32_fn(name):
-  return global_context.module.add_function(float32_fn_t, name)
+def float32_fn(name, module):
+  return module.get_or_insert_function(float32_fn_t, name)
 
-def float64_fn(name):
-  return global_context.module.add_function(float64_fn_t, name)
+def float64_fn(name, module):
+  return module.get_or_insert_function(float64_fn_t, name)
 
 float_unary_ops_list = [ 
   prims.tan, prims.tanh, prims.cos, prims.cosh, prims.sin, prims.sinh, 
@@ -88,17 +86,14 @@ float_unary_ops_list = [
   prims.exp 
 ]
 
-float_unary_ops = {}
+def get_float_unary_op(prim, t, module):
+  """Declaration of the C math function for a prim in the given module"""
 
-def get_float_unary_op(prim, t):
-  key = (prim, t)
-  if key in float_unary_ops:
-    return float_unary_ops[key]
   assert prim in float_unary_ops_list, \
     "Unsupported float primitive %s" % prim 
   assert t in (core_types.Float32, core_types.Float64), \
     "Invalid type %s, expected Float32 or Float64" % t
-  fn_t = float32_fn_t if t == core_types.Float32 else float64_fn_t    
-  llvm_value = global_context.module.add_function(fn_t, prim.name)
-  float_unary_ops[key] = llvm_value 
-  return llvm_value 
+  if t == core_types.Float32:
+    return float32_fn(prim.name, module)
+  else:
+    return float64_fn(prim.name, module)
@@ -3,7 +3,7 @@ import llvm.core as llcore
 
 from llvm.core import Type as lltype
 
-from core_types import ScalarT, PtrT, NoneT
+from core_types import ScalarT, PtrT, NoneT, VectorT
 
 void_t = lltype.void()
 int1_t = lltype.int(1)
@@ -86,11 +86,13 @@ def ctypes_to_lltype(ctypes_repr, name = None):
     return ctypes_scalar_to_lltype(ctypes_repr)
 
 def llvm_value_type(t):
+  if isinstance(t, VectorT):
+    return lltype.vector(llvm_value_type(t.elt_type), t.width)
   return ctypes_to_lltype(t.ctypes_repr, t.node_type())
 
 def llvm_ref_type(t):
   llvm_value_t = llvm_value_type(t)
-  if isinstance(t, (PtrT, ScalarT, NoneT)):
+  if isinstance(t, (PtrT, ScalarT, NoneT, VectorT)):
     return llvm_value_t
   else:
     return lltype.pointer(llvm_value_t)
@@ -0,0 +1,190 @@
+import subst
+
+from array_type import ArrayT
+from collect_vars import SetCollector, collect_var_names
+from escape_analysis import may_alias
+from syntax import Assign, Attribute, BlasCall, Call, Cast, Comment, Const
+from syntax import ExprStmt, ForLoop, If, Index, PrimCall, Return, Slice
+from syntax import Tuple, TupleProj, Var, While
+from transform import Transform
+
+def collect_definitions(stmts, result):
+  for stmt in stmts:
+    c = stmt.__class__
+    if c is Assign and stmt.lhs.__class__ is Var:
+      result[stmt.lhs.name] = stmt.rhs
+    elif c is If:
+      collect_definitions(stmt.true, result)
+      collect_definitions(stmt.false, result)
+    elif c in (ForLoop, While):
+      collect_definitions(stmt.body, result)
+  return result
+
+def collect_writes(stmts, result):
+  """Names of the arrays a block writes to, or passes to a call"""
+
+  for stmt in stmts:
+    c = stmt.__class__
+    if c is Assign:
+      if stmt.lhs.__class__ is Index:
+        result.update(collect_var_names(stmt.lhs.value))
+      if stmt.rhs.__class__ in (Call, BlasCall):
+        result.update(collect_var_names(stmt.rhs))
+    elif c is ExprStmt:
+      result.update(collect_var_names(stmt.value))
+    elif c is If:
+      collect_writes(stmt.true, result)
+      collect_writes(stmt.false, result)
+    elif c in (ForLoop, While):
+      collect_writes(stmt.body, result)
+  return result
+
+def contains_return(stmts):
+  for stmt in stmts:
+    c = stmt.__class__
+    if c is Return:
+      return True
+    elif c is If:
+      if contains_return(stmt.true) or contains_return(stmt.false):
+        return True
+    elif c in (ForLoop, While):
+      if contains_return(stmt.body):
+        return True
+  return False
+
+class LoopFusion(Transform):
+  """
+  Merge adjacent loops over the same range into one loop when they both read
+  some common array, i.e. the loops of two Maps (or Reduces) over the same
+  input, so that the fused loop only has to stream through the array once
+  (RedundantLoadElimination later drops the second load of each element).
+  Statements between the loops move above the first one as long as they
+  don't depend on it, and the loops mustn't write to anything the other
+  one touches.
+  """
+
+  # expressions whose value only depends on the values of their arguments
+  pure_exprs = (Attribute, Cast, Index, PrimCall, Slice, Tuple, TupleProj)
+
+  def pre_apply(self, fn):
+    self.may_alias = may_alias(fn)
+    self.definitions = collect_definitions(fn.body, {})
+    # loop variables of fused loops -> loop variable which replaced them
+    self.renamed = {}
+
+  def canonical(self, expr):
+    """
+    Hashable description of how a value was computed, equal for any two
+    expressions which compute the same value in the same iteration
+    """
+
+    c = expr.__class__
+    if c is Var:
+      name = self.renamed.get(expr.name, expr.name)
+      rhs = self.definitions.get(name)
+      if rhs is not None and rhs.__class__ in self.pure_exprs and \
+         (rhs.__class__ is not Index or isinstance(rhs.type, ArrayT)):
+        return self.canonical(rhs)
+      return name
+    elif c is Const:
+      return ('Const', expr.value, expr.type)
+    elif c is Attribute:
+      return ('Attribute', self.canonical(expr.value), expr.name)
+    elif c is Cast:
+      return ('Cast', self.canonical(expr.value), expr.type)
+    elif c is Index:
+      return ('Index', self.canonical(expr.value), self.canonical(expr.index))
+    elif c is PrimCall:
+      return ('PrimCall', expr.prim) + \
+             tuple(self.canonical(arg) for arg in expr.args)
+    elif c is Slice:
+      return ('Slice', self.canonical(expr.start), self.canonical(expr.stop),
+              self.canonical(expr.step))
+    elif c is Tuple:
+      return ('Tuple',) + tuple(self.canonical(elt) for elt in expr.elts)
+    elif c is TupleProj:
+      return ('TupleProj', self.canonical(expr.tuple), expr.index)
+    return ('expr', id(expr))
+
+  def same_value(self, x, y):
+    return self.canonical(x) == self.canonical(y)
+
+  def aliases(self, names):
+    result = set(names)
+    for name in names:
+      result.update(self.may_alias.get(name, ()))
+    return result
+
+  def referenced_names(self, stmt):
+    collector = SetCollector()
+    collector.visit_stmt(stmt)
+    return collector.var_names
+
+  def array_values(self, names):
+    return set(self.canonical(Var(name, type = self.type_env[name]))
+               for name in names
+               if isinstance(self.type_env.get(name), ArrayT))
+
+  def can_fuse(self, first, between, second):
+    if not (self.same_value(first.start, second.start) and
+            self.same_value(first.stop, second.stop) and
+            self.same_value(first.step, second.step)) or \
+       first.var.type != second.var.type or \
+       contains_return(first.body) or contains_return(second.body):
+      return False
+
+    first_names = self.referenced_names(first)
+    second_names = self.referenced_names(second)
+    # only worth it if the loops read some of the same data
+    if not (self.array_values(first_names) & self.array_values(second_names)):
+      return False
+
+    first_writes = self.aliases(collect_writes(first.body, set([])))
+    second_writes = self.aliases(collect_writes(second.body, set([])))
+    # the second loop can't use the final values of the first one's
+    # accumulators, or any array either of them writes to
+    unavailable = first_writes.union(first.merge.keys())
+    if self.aliases(second_names) & unavailable or \
+       self.aliases(first_names) & second_writes:
+      return False
+
+    for stmt in between:
+      if stmt.__class__ is Comment:
+        continue
+      if stmt.__class__ is not Assign or stmt.lhs.__class__ is not Var or \
+         stmt.rhs.__class__ in (Call, BlasCall) or \
+         self.aliases(collect_var_names(stmt.rhs)) & unavailable:
+        return False
+    return True
+
+  def fuse(self, first, second):
+    rename = {second.var.name : first.var}
+    self.renamed[second.var.name] = first.var.name
+    body = first.body + subst.subst_stmt_list(second.body, rename)
+    merge = dict(first.merge)
+    for (name, (init, update)) in second.merge.iteritems():
+      merge[name] = (init, subst.subst_expr(update, rename))
+    fused = ForLoop(var = first.var, start = first.start, stop = first.stop,
+                    step = first.step, body = self.fuse_loops(body),
+                    merge = merge)
+    fused.source_info = first.source_info
+    return fused
+
+  def fuse_loops(self, stmts):
+    result = []
+    # position in result of the last loop we've seen
+    last_loop = None
+    for stmt in stmts:
+      if stmt.__class__ is ForLoop:
+        if last_loop is not None:
+          first = result[last_loop]
+          between = result[last_loop + 1:]
+          if self.can_fuse(first, between, stmt):
+            result = result[:last_loop] + between
+            stmt = self.fuse(first, stmt)
+        last_loop = len(result)
+      result.append(stmt)
+    return result
+
+  def transform_block(self, stmts):
+    return self.fuse_loops(Transform.transform_block(self, stmts))
@@ -0,0 +1,94 @@
+"""
+Counters for the loops of compiled code, filled in by native code compiled
+while config.profile_loops is on. Every loop (including the ones generated
+from adverbs) counts how often it was entered, its total iterations and the
+cycles spent inside of it, and remembers the line of Python it came from.
+
+Usage from Python:
+  parakeet.config.profile_loops = True
+  f(x)
+  print parakeet.loop_profiler.report()
+  parakeet.loop_profiler.reset()
+
+The counters aren't updated atomically, so loops which run in parallel
+across threads only get approximate counts.
+"""
+
+import ctypes
+import linecache
+
+# fields of each loop's counter array
+ENTRIES = 0
+ITERATIONS = 1
+CYCLES = 2
+
+class LoopCounters(object):
+  def __init__(self, kernel, fn_name, kind, source_info, depth):
+    self.kernel = kernel
+    self.fn_name = fn_name
+    self.kind = kind
+    self.source_info = source_info
+    self.depth = depth
+    self.counts = (ctypes.c_int64 * 3)()
+
+  def address(self, field):
+    return ctypes.addressof(self.counts) + field * ctypes.sizeof(ctypes.c_int64)
+
+  def source_line(self):
+    if self.source_info is None or self.source_info.filename is None:
+      return None
+    line = linecache.getline(self.source_info.filename, self.source_info.line)
+    return line.strip() or None
+
+  def as_dict(self):
+    result = {
+      'kernel' : self.kernel,
+      'fn' : self.fn_name,
+      'loop' : self.kind,
+      'depth' : self.depth,
+      'entries' : self.counts[ENTRIES],
+      'iterations' : self.counts[ITERATIONS],
+      'cycles' : self.counts[CYCLES],
+    }
+    if self.source_info is not None:
+      result['file'] = self.source_info.filename
+      result['line'] = self.source_info.line
+      result['source'] = self.source_line()
+    return result
+
+# every instrumented loop, in the order they were compiled
+_loops = []
+
+def new_loop(kernel, fn_name, kind, source_info, depth):
+  counters = LoopCounters(kernel, fn_name, kind, source_info, depth)
+  _loops.append(counters)
+  return counters
+
+def reset():
+  """Zero the counters of every instrumented loop"""
+
+  for loop in _loops:
+    for field in (ENTRIES, ITERATIONS, CYCLES):
+      loop.counts[field] = 0
+
+def stats():
+  """Counts of every loop which ran, grouped by the kernel it's compiled into"""
+
+  result = {}
+  for loop in _loops:
+    if loop.counts[ENTRIES] > 0 or loop.counts[ITERATIONS] > 0:
+      result.setdefault(loop.kernel, []).append(loop.as_dict())
+  return result
+
+def report():
+  lines = []
+  for (kernel, loops) in sorted(stats().items()):
+    total = sum(loop['cycles'] for loop in loops if loop['depth'] == 0)
+    lines.append("%s (%d cycles in outermost loops)" % (kernel, total))
+    for loop in loops:
+      where = "line %s" % loop['line'] if 'line' in loop else "generated"
+      lines.append("  %s%-8s %-12s %10d entries %12d iterations %14d cycles  %s" % \
+                   ("  " * loop['depth'], loop['loop'], where, loop['entries'],
+                    loop['iterations'], loop['cycles'],
+                    loop.get('source') or ""))
+  return "\n".join(lines)
@@ -1,6 +1,7 @@
 from collect_vars import collect_binding_names, collect_var_names
 from escape_analysis import may_alias
 from syntax import Return, While, ForLoop, If, Assign, Var, Index, Const
+from syntax import BlasCall, ExprStmt
 from transform import Transform
 
 class LoopTransform(Transform):
@@ -8,6 +9,9 @@ class LoopTransform(Transform):
     for stmt in stmts:
       if stmt.__class__ in (Return, While, ForLoop):
         return False
+      # BLAS calls write to memory without any visible Index on the lhs
+      elif stmt.__class__ is ExprStmt and stmt.value.__class__ is BlasCall:
+        return False
       elif stmt.__class__ is If:
         if not allow_branches or \
            not self.is_simple_block(stmt.true) or \
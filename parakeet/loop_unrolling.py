@@ -1,3 +1,4 @@
+import config
 import syntax_helpers
 
 from clone_stmt import CloneStmt
@@ -9,17 +10,23 @@ def safediv(m,n):
   return (m+n-1)/n
 
 class LoopUnrolling(LoopTransform):
-  def __init__(self, unroll_factor = 4,
-                      max_static_unrolling = 8,
-                      max_block_size = 50):
+  def __init__(self, unroll_factor = None,
+                      max_static_unrolling = None,
+                      max_block_size = None):
     LoopTransform.__init__(self)
+    if unroll_factor is None:
+      unroll_factor = config.opt_unroll_factor
     self.unroll_factor = unroll_factor
+    if max_static_unrolling is None:
+      max_static_unrolling = config.opt_max_static_unrolling
     if max_static_unrolling is not None:
     # should we unroll static loops more than ones with unknown iters?
       self.max_static_unrolling = max_static_unrolling
     else:
       self.max_static_unrolling = unroll_factor
 
+    if max_block_size is None:
+      max_block_size = config.opt_max_unroll_block_size
     self.max_block_size = max_block_size
 
   def pre_apply(self, fn):
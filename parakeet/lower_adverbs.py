@@ -1,7 +1,7 @@
 import syntax_helpers
 
 from adverb_semantics import AdverbSemantics
-from syntax import Index, Map 
+from syntax import AllPairs, Index, IndexMap, Map
 from transform import Transform
 
 class LowerAdverbs(AdverbSemantics, Transform):
@@ -14,6 +14,11 @@ class LowerAdverbs(AdverbSemantics, Transform):
     shape = self.transform_expr(expr.shape)
     return self.eval_index_map(fn, shape, output)
   
+  def transform_ParFor(self, expr):
+    fn = self.transform_expr(expr.fn)
+    shape = self.transform_expr(expr.shape)
+    return self.eval_parfor(fn, shape)
+
   def transform_IndexReduce(self, expr):
     fn = self.transform_expr(expr.fn)
     combine = self.transform_expr(expr.combine)
@@ -46,17 +51,27 @@ class LowerAdverbs(AdverbSemantics, Transform):
     axis = syntax_helpers.unwrap_constant(expr.axis)
     return self.eval_scan(fn, combine, emit, init, args, axis)
 
-  def transform_AllPairs(self, expr):
+  def transform_AllPairs(self, expr, output = None):
     fn = self.transform_expr(expr.fn)
     args = self.transform_expr_list(expr.args)
     assert len(args) == 2
     x,y = self.transform_expr_list(args)
     axis = syntax_helpers.unwrap_constant(expr.axis)
-    return self.eval_allpairs(fn, x, y, axis)
+    return self.eval_allpairs(fn, x, y, axis, output = output)
   
   def transform_Assign(self, stmt):
-    if stmt.lhs.__class__ is Index and isinstance(stmt.rhs, Map):
-      self.transform_Map(stmt.rhs, output = stmt.lhs)
-      return None 
+    if stmt.lhs.__class__ is Index:
+      rhs_class = stmt.rhs.__class__
+      # write the elements straight into the indexed
+      # array instead of allocating a temporary
+      if rhs_class is Map:
+        self.transform_Map(stmt.rhs, output = stmt.lhs)
+        return None
+      elif rhs_class is IndexMap:
+        self.transform_IndexMap(stmt.rhs, output = stmt.lhs)
+        return None
+      elif rhs_class is AllPairs:
+        self.transform_AllPairs(stmt.rhs, output = stmt.lhs)
+        return None
     return Transform.transform_Assign(self, stmt)
   
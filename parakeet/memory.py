@@ -0,0 +1,97 @@
+"""
+Ownership of the array buffers returned by compiled functions.
+
+Compiled code allocates the data of its results with malloc, so instead of
+copying a result into memory owned by Python we hand the buffer straight to
+NumPy along with a ParakeetBuffer which frees it once the last array looking
+at it gets collected. Results which point into the data of one of the call's
+inputs become views that keep the input alive instead.
+"""
+
+import ctypes
+import ctypes.util
+import numpy as np
+
+import array_type
+import core_types
+
+from array_type import ArrayT
+from tuple_type import TupleT
+
+_libc = ctypes.CDLL(ctypes.util.find_library('c'))
+_free = _libc.free
+_free.argtypes = [ctypes.c_void_p]
+_free.restype = None
+
+class ParakeetBuffer(object):
+  """Frees memory malloc'd by compiled code when it gets garbage collected"""
+
+  def __init__(self, address):
+    self.address = address
+
+  def __del__(self, free = _free):
+    free(self.address)
+
+def holds_arrays(t):
+  if isinstance(t, ArrayT):
+    return True
+  elif isinstance(t, TupleT):
+    return any(holds_arrays(elt_t) for elt_t in t.elt_types)
+  else:
+    return False
+
+def _known_value(x):
+  return x is None or np.isscalar(x) or \
+         isinstance(x, (slice, np.dtype, type, core_types.Type))
+
+class ResultMemory(object):
+  """
+  Maps the start of every buffer which a call's result might point into to
+  the object keeping that buffer alive: the inputs of the call, and fresh
+  ParakeetBuffers for anything allocated by the compiled code
+  """
+
+  def __init__(self, parent = None):
+    if parent is None:
+      self.owners = {}
+      self.complete = True
+    else:
+      self.owners = parent.owners.copy()
+      self.complete = parent.complete
+
+  def track(self, x):
+    if isinstance(x, (list, xrange)):
+      # convert here rather than in ArrayT.from_python, otherwise
+      # we'd never see the array whose memory the input points to
+      x = np.asarray(x)
+    if isinstance(x, np.ndarray):
+      self.owners.setdefault(array_type.data_address(x), x)
+    elif isinstance(x, tuple):
+      x = tuple(self.track(elt) for elt in x)
+    elif not _known_value(x):
+      # closures might carry arrays we can't see from here, so
+      # we can't tell which result buffers belong to Parakeet
+      self.complete = False
+    return x
+
+  def track_inputs(self, args):
+    """
+    Remember the buffers of the given arguments, returning them with any
+    lists replaced by the arrays that actually get passed to native code
+    """
+
+    return [self.track(x) for x in args]
+
+  def wrap(self, address, start, nbytes):
+    """
+    A ctypes view of nbytes beginning 'start' bytes from the given address,
+    which keeps the buffer's owner alive for as long as NumPy holds on to it
+    """
+
+    owner = self.owners.get(address)
+    if owner is None:
+      owner = ParakeetBuffer(address)
+      self.owners[address] = owner
+    buf = (ctypes.c_char * nbytes).from_address(address + start)
+    buf._owner = owner
+    return buf
@@ -78,6 +78,11 @@ class TypeBasedMutabilityAnalysis(SyntaxVisitor):
       isn't made mutable
       """
       self._mark_type(arg.type)
+
+  def visit_BlasCall(self, expr):
+    # BLAS routines write into the data of their output array
+    for arg in expr.args:
+      self._mark_type(arg.type)
     
   def visit_fn(self, fn):
     self.mutable_types.clear()
@@ -0,0 +1,51 @@
+"""
+Support for the out= calling convention: rewrite a typed function so that it
+stores its result into an extra trailing argument rather than allocating it.
+
+Every 'return x' becomes 'output[...] = x; return output'. If x is a Map,
+IndexMap, or AllPairs then LowerAdverbs fills the output directly, otherwise
+copy elimination turns the local array which held x into a view of the output.
+"""
+
+import names
+import syntax_helpers
+
+from array_type import ArrayT
+from clone_function import CloneFunction
+from syntax import Index, Return, Tuple, TypedFn, Var
+from syntax_helpers import get_types
+from transform import Transform
+from tuple_type import make_tuple_type
+
+class StoreResult(Transform):
+  def __init__(self, output):
+    Transform.__init__(self)
+    self.output = output
+
+  def transform_Return(self, stmt):
+    output_t = self.output.type
+    slices = [syntax_helpers.slice_none] * output_t.rank
+    # keep the index free of temporaries so copy elimination
+    # can still move the source array's allocation
+    if len(slices) == 1:
+      idx = slices[0]
+    else:
+      idx = Tuple(slices, type = make_tuple_type(get_types(slices)))
+    self.assign(Index(self.output, idx, type = output_t), stmt.value)
+    return Return(self.output)
+
+def add_output_arg(fn):
+  assert isinstance(fn.return_type, ArrayT), \
+      "Only functions which return arrays can take an output, %s returns %s" % \
+      (fn.name, fn.return_type)
+  fn = CloneFunction().apply(fn)
+  output = Var(names.fresh("output"), type = fn.return_type)
+  type_env = fn.type_env
+  type_env[output.name] = output.type
+  new_fn = TypedFn(name = names.fresh(fn.name + "_into"),
+                   arg_names = list(fn.arg_names) + [output.name],
+                   input_types = list(fn.input_types) + [output.type],
+                   return_type = output.type,
+                   type_env = type_env,
+                   body = fn.body)
+  return StoreResult(output).apply(new_fn)
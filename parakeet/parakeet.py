@@ -2,7 +2,10 @@ import numpy as np
 
 
 import config
+import disk_cache
 import type_conv_decls
+from aot import compile_many, precompile
+from autotune import tune
 from decorators import jit, macro
 from lib import *
 from run_function import run, specialize_and_compile
@@ -0,0 +1,387 @@
+import config
+import names
+import pipeline
+import prims
+import syntax_helpers
+
+from adverb_semantics import AdverbSemantics
+from clone_function import CloneFunction
+from core_types import Int64, ScalarT
+from syntax import Assign, Cast, Closure, ExprStmt, PrimCall, Return
+from syntax import TypedFn, Var
+from syntax import Map, IndexMap, ParFor, Reduce, IndexReduce, Scan
+from transform import Transform
+
+associative_prims = set([prims.add, prims.multiply,
+                         prims.maximum, prims.minimum,
+                         prims.logical_and, prims.logical_or,
+                         prims.bitwise_and, prims.bitwise_or,
+                         prims.bitwise_xor])
+
+def _strip_casts(expr):
+  while expr.__class__ is Cast:
+    expr = expr.value
+  return expr
+
+def is_associative(fn):
+  """
+  Recognize combining functions which just apply an associative operator,
+  possibly elementwise, to their last two inputs
+  """
+
+  if fn.__class__ is Closure:
+    fn = fn.fn
+  if fn.__class__ is not TypedFn or len(fn.arg_names) < 2:
+    return False
+  defs = {}
+  for stmt in fn.body[:-1]:
+    if stmt.__class__ is not Assign or stmt.lhs.__class__ is not Var:
+      return False
+    defs[stmt.lhs.name] = stmt.rhs
+  if len(fn.body) == 0 or fn.body[-1].__class__ is not Return:
+    return False
+
+  def resolve(expr):
+    expr = _strip_casts(expr)
+    while expr.__class__ is Var and expr.name in defs:
+      expr = _strip_casts(defs[expr.name])
+    return expr
+
+  result = resolve(fn.body[-1].value)
+  if result.__class__ is PrimCall:
+    if result.prim not in associative_prims:
+      return False
+  elif result.__class__ is Map:
+    if not is_associative(result.fn):
+      return False
+  else:
+    return False
+  args = [resolve(arg) for arg in result.args]
+  if len(args) != 2 or any(arg.__class__ is not Var for arg in args):
+    return False
+  return set(arg.name for arg in args) == set(fn.arg_names[-2:])
+
+def _pure_prelude(stmts):
+  """
+  Only copy statements into every helper function if they're
+  plain assignments which don't launch any adverbs
+  """
+
+  for stmt in stmts:
+    if stmt.__class__ is not Assign or stmt.lhs.__class__ is not Var:
+      return False
+    try:
+      pipeline.ContainsAdverbs().visit_expr(stmt.rhs)
+    except pipeline.ContainsAdverbs.Yes:
+      return False
+  return True
+
+def _has_array_arg(adverb):
+  return any(getattr(arg.type, 'rank', 0) > 0 for arg in adverb.args)
+
+def _parallelizable(adverb):
+  c = adverb.__class__
+  if c is Map:
+    return syntax_helpers.unwrap_constant(adverb.axis) == 0 and \
+           _has_array_arg(adverb)
+  elif c is Reduce:
+    axis = syntax_helpers.unwrap_constant(adverb.axis)
+    if axis is None:
+      if len(adverb.args) != 1:
+        return False
+    elif axis != 0:
+      return False
+    return _has_array_arg(adverb) and combine_is_associative(adverb)
+  elif c is IndexReduce:
+    return combine_is_associative(adverb)
+  elif c is Scan:
+    return syntax_helpers.unwrap_constant(adverb.axis) == 0 and \
+           _has_array_arg(adverb) and combine_is_associative(adverb)
+  return c in (IndexMap, ParFor)
+
+def combine_is_associative(adverb):
+  """
+  Partial reductions (or scans) can only be merged in a different grouping
+  than the serial loop if the combining function is associative; unless we
+  can see that it is, the user has to vouch for it
+  """
+
+  return config.parallel_assume_associative or is_associative(adverb.combine)
+
+def split_outer_adverb(fn):
+  """
+  If the body of a function is some adverb-free setup followed by a single
+  Map, IndexMap, ParFor, Reduce, IndexReduce, or Scan which determines the
+  result, return the setup statements and the adverb. Otherwise return None.
+  """
+
+  body = fn.body
+  if len(body) == 0 or body[-1].__class__ is not Return:
+    return None
+  ret = body[-1].value
+  result_adverbs = (Map, IndexMap, Reduce, IndexReduce, Scan)
+  if isinstance(ret, result_adverbs):
+    prelude, adverb = body[:-1], ret
+  elif len(body) < 2:
+    return None
+  else:
+    last = body[-2]
+    if last.__class__ is Assign and last.lhs.__class__ is Var and \
+       isinstance(last.rhs, result_adverbs) and \
+       ret.__class__ is Var and ret.name == last.lhs.name:
+      prelude, adverb = body[:-2], last.rhs
+    elif last.__class__ is ExprStmt and last.value.__class__ is ParFor and \
+         syntax_helpers.is_none(ret):
+      prelude, adverb = body[:-2], last.value
+    else:
+      return None
+
+  if _parallelizable(adverb) and _pure_prelude(prelude):
+    return prelude, adverb
+  return None
+
+class ChunkBuilder(AdverbSemantics, Transform):
+  """
+  Builds one of the helper functions needed to run the outermost adverb of a
+  function in parallel. Each helper takes the same inputs as the original
+  (possibly preceded by some extra arguments) and repeats its setup code.
+  """
+
+  def __init__(self, fn, suffix):
+    Transform.__init__(self)
+    self.original = CloneFunction().apply(fn)
+    self.type_env = self.original.type_env
+    self.name = names.fresh(fn.name + "_" + suffix)
+    self.prelude, self.adverb = split_outer_adverb(self.original)
+    self.extra_args = []
+
+  def extra_arg(self, t, prefix):
+    v = self.fresh_var(t, prefix)
+    self.extra_args.append(v)
+    return v
+
+  def build(self, body_fn):
+    self.blocks.push()
+    for stmt in self.prelude:
+      self.insert_stmt(stmt)
+    result = body_fn(self.adverb)
+    self.insert_stmt(Return(result))
+    body = self.blocks.pop()
+    return TypedFn(name = self.name,
+                   arg_names = [v.name for v in self.extra_args] + \
+                               list(self.original.arg_names),
+                   input_types = [v.type for v in self.extra_args] + \
+                                 list(self.original.input_types),
+                   return_type = result.type,
+                   type_env = self.type_env,
+                   body = body)
+
+  def reduce_values(self, adverb):
+    if syntax_helpers.unwrap_constant(adverb.axis) is None:
+      return [self.ravel(adverb.args[0])]
+    else:
+      return adverb.args
+
+  def outer_dims(self, adverb):
+    c = adverb.__class__
+    if c in (Map, Scan):
+      return self.sizes_along_axis(adverb.args, 0)
+    elif c is Reduce:
+      return self.sizes_along_axis(self.reduce_values(adverb), 0)
+    else:
+      return self.tuple_elts(adverb.shape)
+
+  def niters(self, adverb):
+    return self.cast(self.outer_dims(adverb)[0], Int64)
+
+  def alloc(self, adverb):
+    c = adverb.__class__
+    if c is Map:
+      niters, delayed_elts = self.map_prelude(adverb.fn, adverb.args, 0)
+      first_elts = self.force_list(delayed_elts, self.int(0))
+      return self.create_output_array(adverb.fn, first_elts, niters)
+    elif c is Scan:
+      niters, delayed_elts = self.map_prelude(adverb.fn, adverb.args, 0)
+      def delayed_map_result(idx):
+        return self.invoke(adverb.fn, self.force_list(delayed_elts, idx))
+      first_acc = self.acc_prelude(adverb.init, adverb.combine,
+                                   delayed_map_result)
+      return self.create_output_array(adverb.emit, [first_acc], niters)
+    else:
+      dims = self.tuple_elts(adverb.shape)
+      shape = dims[0] if len(dims) == 1 else adverb.shape
+      return self.create_output_array(adverb.fn, [shape], shape)
+
+  def chunk(self, adverb, start, stop, output):
+    c = adverb.__class__
+    if c is Map:
+      self.eval_map(adverb.fn, adverb.args, 0, output, start, stop)
+    elif c is IndexMap:
+      self.eval_index_map(adverb.fn, adverb.shape, output, start, stop)
+    else:
+      self.eval_parfor(adverb.fn, adverb.shape, start, stop)
+    return self.none
+
+  def partial_reduce(self, adverb, start, stop, init = None):
+    c = adverb.__class__
+    if c is Reduce:
+      return self.eval_reduce(adverb.fn, adverb.combine, init,
+                              self.reduce_values(adverb), 0, start, stop)
+    elif c is Scan:
+      return self.eval_reduce(adverb.fn, adverb.combine, init, adverb.args, 0,
+                              start, stop)
+    else:
+      return self.eval_index_reduce(adverb.fn, adverb.combine, adverb.shape,
+                                    init, start, stop)
+
+  def scan_block(self, adverb, start, stop, output, offset):
+    self.eval_scan(adverb.fn, adverb.combine, adverb.emit, offset,
+                   adverb.args, 0, output, start, stop)
+    return self.none
+
+def niters_fn(fn):
+  """Number of iterations of the outermost adverb"""
+
+  builder = ChunkBuilder(fn, "niters")
+  return builder.build(builder.niters)
+
+def alloc_fn(fn):
+  """
+  Preallocate the result of the outermost adverb, or return None if it's a
+  ParFor which doesn't produce anything
+  """
+
+  builder = ChunkBuilder(fn, "alloc")
+  if builder.adverb.__class__ is ParFor:
+    return None
+  return builder.build(builder.alloc)
+
+def chunk_fn(fn):
+  """
+  Run the iterations [start, stop) of the outermost adverb. Maps write into
+  the output array passed in as the third argument, reductions return the
+  partial result of their range.
+  """
+
+  builder = ChunkBuilder(fn, "chunk")
+  start = builder.extra_arg(Int64, "start")
+  stop = builder.extra_arg(Int64, "stop")
+  c = builder.adverb.__class__
+  if c in (Reduce, IndexReduce):
+    return builder.build(lambda adverb: builder.partial_reduce(adverb, start,
+                                                               stop))
+  if c is ParFor:
+    output = None
+  else:
+    output = builder.extra_arg(fn.return_type, "output")
+  return builder.build(lambda adverb: builder.chunk(adverb, start, stop,
+                                                    output))
+
+def block_total_fn(fn, with_init = False):
+  """
+  Total of a block of a scan's input. The first block also needs to include
+  the scan's initial value, if it has one.
+  """
+
+  builder = ChunkBuilder(fn, "first_total" if with_init else "block_total")
+  start = builder.extra_arg(Int64, "start")
+  stop = builder.extra_arg(Int64, "stop")
+  if with_init:
+    init = builder.adverb.init
+    if init is None or builder.is_none(init):
+      return None
+  else:
+    init = None
+  return builder.build(lambda adverb: builder.partial_reduce(adverb, start,
+                                                             stop, init))
+
+def scan_block_fn(fn, offset_t = None):
+  """
+  Scan a block of the input, writing into the output array. Blocks after the
+  first start from an offset holding the total of all the earlier blocks.
+  """
+
+  builder = ChunkBuilder(fn, "rescan" if offset_t else "first_block")
+  start = builder.extra_arg(Int64, "start")
+  stop = builder.extra_arg(Int64, "stop")
+  if offset_t is None:
+    offset = builder.adverb.init
+  else:
+    offset = builder.extra_arg(offset_t, "offset")
+  output = builder.extra_arg(fn.return_type, "output")
+  return builder.build(lambda adverb: builder.scan_block(adverb, start, stop,
+                                                         output, offset))
+
+def combine_fn(fn, partial_t):
+  """Merge the partial results of two neighbouring ranges of a reduction"""
+
+  builder = ChunkBuilder(fn, "combine")
+  left = builder.extra_arg(partial_t, "left")
+  right = builder.extra_arg(partial_t, "right")
+  return builder.build(lambda adverb: builder.invoke(adverb.combine,
+                                                     [left, right]))
+
+def finish_fn(fn, partial_t):
+  """
+  Fold the reduction's initial value into the combined partial results,
+  returns None if there isn't one
+  """
+
+  builder = ChunkBuilder(fn, "finish")
+  init = builder.adverb.init
+  if init is None or builder.is_none(init):
+    return None
+  total = builder.extra_arg(partial_t, "total")
+  return builder.build(lambda adverb: builder.invoke(adverb.combine,
+                                                     [adverb.init, total]))
+
+def init_fn(fn):
+  """
+  The reduction's initial value, which is also its result when there's
+  nothing to reduce; returns None if there isn't one
+  """
+
+  builder = ChunkBuilder(fn, "init")
+  init = builder.adverb.init
+  if init is None or builder.is_none(init):
+    return None
+  def result(adverb):
+    if isinstance(fn.return_type, ScalarT):
+      return builder.cast(adverb.init, fn.return_type)
+    return adverb.init
+  return builder.build(result)
+
+def parallel_helpers(fn):
+  """
+  Split a typed function into helpers which count the iterations of its
+  outermost adverb, run a range of its iterations, and either preallocate
+  the result (maps) or merge partial results (reductions). Returns a
+  dictionary of helpers keyed by role or None if the function doesn't have
+  that shape. Scans get separate helpers for the two passes of a blocked
+  parallel scan.
+  """
+
+  fn = pipeline.high_level_optimizations.apply(fn)
+  split = split_outer_adverb(fn)
+  if split is None:
+    return None
+  if split[1].__class__ is Scan:
+    block_total = block_total_fn(fn)
+    partial_t = block_total.return_type
+    return {'niters' : niters_fn(fn),
+            'alloc' : alloc_fn(fn),
+            'block_total' : block_total,
+            'first_total' : block_total_fn(fn, with_init = True),
+            'combine' : combine_fn(fn, partial_t),
+            'first_block' : scan_block_fn(fn),
+            'rescan' : scan_block_fn(fn, partial_t)}
+
+  helpers = {'niters' : niters_fn(fn), 'chunk' : chunk_fn(fn)}
+  if isinstance(split[1], (Reduce, IndexReduce)):
+    partial_t = helpers['chunk'].return_type
+    helpers['combine'] = combine_fn(fn, partial_t)
+    helpers['finish'] = finish_fn(fn, partial_t)
+    helpers['init'] = init_fn(fn)
+  else:
+    helpers['alloc'] = alloc_fn(fn)
+  return helpers
@@ -1,2 +1,398 @@
-import threading 
+"""
+Multithreaded execution of the outermost Map, IndexMap, ParFor, Reduce,
+IndexReduce, or Scan of a compiled function.
 
+The iteration space is cut into chunks which get dealt out to per-worker
+deques. Each worker takes chunks from the back of its own deque and, once
+that runs dry, steals from the front of everyone else's. Every chunk is a
+call into native code through ctypes, which releases the GIL for the
+duration of the call, so the workers really do run concurrently.
+
+Reductions compute one partial result per chunk and then merge the partials
+pairwise in a tree. Scans take two passes over blocks of their input, see
+ParallelScanFn.
+"""
+
+import collections
+import multiprocessing
+import sys
+import threading
+
+import config
+import memory
+
+class Job(object):
+  """
+  Tracks completion of the chunks belonging to one parallel call and
+  remembers the first exception raised by any of them
+  """
+
+  def __init__(self, chunk_fn, n_chunks):
+    self.chunk_fn = chunk_fn
+    self.remaining = n_chunks
+    self.lock = threading.Lock()
+    self.done = threading.Event()
+    self.error = None
+
+  def run_chunk(self, start, stop):
+    try:
+      if self.error is None:
+        self.chunk_fn(start, stop)
+    except:
+      if self.error is None:
+        self.error = sys.exc_info()
+    finally:
+      with self.lock:
+        self.remaining -= 1
+        finished = self.remaining == 0
+      if finished:
+        self.done.set()
+
+  def wait(self):
+    self.done.wait()
+    if self.error is not None:
+      raise self.error[0], self.error[1], self.error[2]
+
+class WorkerPool(object):
+  def __init__(self, n_threads):
+    self.n_threads = n_threads
+    self.queues = [collections.deque() for _ in xrange(n_threads)]
+
+    # number of chunks sitting in the queues, only used to
+    # decide when idle workers should go to sleep
+    self.n_queued = 0
+    self.work_available = threading.Condition()
+
+    self.threads = []
+    for worker_id in xrange(n_threads):
+      t = threading.Thread(target = self.worker_loop, args = (worker_id,),
+                           name = "parakeet-worker-%d" % worker_id)
+      t.daemon = True
+      t.start()
+      self.threads.append(t)
+
+  def take(self, worker_id):
+    """
+    Pop the most recently queued chunk from this worker's own deque or steal
+    the oldest chunk of some other worker, returns None if all are empty
+    """
+
+    try:
+      task = self.queues[worker_id].pop()
+    except IndexError:
+      task = None
+      for offset in xrange(1, self.n_threads):
+        victim = self.queues[(worker_id + offset) % self.n_threads]
+        try:
+          task = victim.popleft()
+          break
+        except IndexError:
+          pass
+    if task is not None:
+      with self.work_available:
+        self.n_queued -= 1
+    return task
+
+  def worker_loop(self, worker_id):
+    while True:
+      task = self.take(worker_id)
+      if task is None:
+        with self.work_available:
+          while self.n_queued <= 0:
+            self.work_available.wait()
+      else:
+        job, start, stop = task
+        job.run_chunk(start, stop)
+
+  def submit(self, chunk_fn, niters, chunk_size):
+    """
+    Split [0, niters) into chunks, giving each worker a contiguous range of
+    chunks so that neighbouring iterations tend to run on the same core
+    """
+
+    n_chunks = (niters + chunk_size - 1) / chunk_size
+    job = Job(chunk_fn, n_chunks)
+    for i in xrange(n_chunks):
+      start = i * chunk_size
+      stop = min(start + chunk_size, niters)
+      worker_id = i * self.n_threads / n_chunks
+      # workers pop from the right, so push in reverse order to
+      # have each one start at the beginning of its range
+      self.queues[worker_id].appendleft((job, start, stop))
+    with self.work_available:
+      self.n_queued += n_chunks
+      self.work_available.notify_all()
+    return job
+
+  def run(self, chunk_fn, niters, chunk_size):
+    job = self.submit(chunk_fn, niters, chunk_size)
+    # the calling thread helps out instead of just blocking
+    while not job.done.is_set():
+      task = self.take(0)
+      if task is None:
+        break
+      other_job, start, stop = task
+      other_job.run_chunk(start, stop)
+    job.wait()
+
+def num_threads():
+  if config.num_threads is None:
+    return multiprocessing.cpu_count()
+  return max(1, config.num_threads)
+
+_pool = None
+_pool_lock = threading.Lock()
+def get_pool():
+  global _pool
+  with _pool_lock:
+    n = num_threads()
+    # worker threads never exit, so a pool which is too small gets
+    # replaced but one which is too large is kept around
+    if _pool is None or _pool.n_threads < n:
+      _pool = WorkerPool(n)
+    return _pool
+
+def pool_started():
+  """Are there worker threads which a forked process wouldn't get copies of?"""
+
+  return _pool is not None
+
+def chunk_size(niters, n_threads, fixed_size = None):
+  if fixed_size is None:
+    fixed_size = config.parallel_chunk_size
+  if fixed_size is not None:
+    return max(1, fixed_size)
+  # a few chunks per thread leaves room for load balancing
+  return max(1, niters / (n_threads * 8))
+
+def parallel_for(chunk_fn, niters, size = None):
+  """
+  Call chunk_fn(start, stop) on disjoint ranges covering [0, niters), each
+  range holding 'size' iterations unless it's the last one
+  """
+
+  if niters <= 0:
+    return
+  n_threads = num_threads()
+  size = chunk_size(niters, n_threads, size)
+  if n_threads == 1 or niters <= size or niters < config.parallel_min_iters:
+    chunk_fn(0, niters)
+  else:
+    get_pool().run(chunk_fn, niters, size)
+
+def bind_trailing(compiled, n_leading, trailing_args):
+  """
+  Convert the trailing arguments of a compiled function once, returning a
+  Python function of just the leading arguments which calls the native code
+  """
+
+  import run_function
+  leading_converters = compiled.input_converters[:n_leading]
+  # the converted trailing arguments get reused by many calls,
+  # so they need structs of their own
+  trailing_converters = [run_function.input_converter(t, reuse_structs = False)
+                         for t in compiled.parakeet_fn.input_types[n_leading:]]
+  if compiled.returns_arrays and config.zero_copy_results:
+    trailing_memory = memory.ResultMemory()
+    trailing_args = trailing_memory.track_inputs(trailing_args)
+  else:
+    trailing_memory = None
+  ctypes_trailing = [convert(v) for (convert, v)
+                     in zip(trailing_converters, trailing_args)]
+  native_fn = compiled.native_fn
+  output_converter = compiled.output_converter
+  def call(*leading):
+    if trailing_memory is not None:
+      result_memory = memory.ResultMemory(trailing_memory)
+      leading = result_memory.track_inputs(leading)
+    ctypes_inputs = [convert(v) for (convert, v)
+                     in zip(leading_converters, leading)]
+    ctypes_inputs.extend(ctypes_trailing)
+    result = native_fn(*ctypes_inputs)
+    if trailing_memory is None:
+      return output_converter(result)
+    return output_converter(result, result_memory)
+  return call
+
+def tree_combine(combine, partials):
+  """
+  Merge a list of partial results in log(n) rounds, combining neighbouring
+  pairs in parallel so that the order of the original sequence is preserved
+  """
+
+  while len(partials) > 1:
+    n_pairs = len(partials) / 2
+    combined = [None] * n_pairs
+    def combine_range(start, stop):
+      for i in xrange(start, stop):
+        combined[i] = combine(partials[2*i], partials[2*i+1])
+    parallel_for(combine_range, n_pairs)
+    if len(partials) % 2 == 1:
+      combined.append(partials[-1])
+    partials = combined
+  return partials[0]
+
+class ParallelFn(object):
+  """
+  Stands in for a CompiledFn whose outermost adverb gets split across
+  threads. Wraps compiled helpers which count the iterations, run a chunk of
+  iterations, and either allocate the result of a map or merge the partial
+  results of a reduction.
+  """
+
+  def __init__(self, parakeet_fn, niters_fn, chunk_fn,
+               alloc_fn = None, combine_fn = None, finish_fn = None,
+               init_fn = None, output_arg = False):
+    self.parakeet_fn = parakeet_fn
+    self.input_types = tuple(parakeet_fn.input_types)
+    # with the out= calling convention the result array
+    # gets passed in as an extra last argument
+    self.output_arg = output_arg
+    if output_arg:
+      assert alloc_fn is not None, \
+          "Only adverbs which allocate their result can fill an output"
+      self.input_types += (parakeet_fn.return_type,)
+    self.niters_fn = niters_fn
+    self.chunk_fn = chunk_fn
+    self.alloc_fn = alloc_fn
+    self.combine_fn = combine_fn
+    self.finish_fn = finish_fn
+    self.init_fn = init_fn
+    # chosen along with the compiled code, so that
+    # tuned sizes stay with the function they were tuned for
+    self.chunk_size = config.parallel_chunk_size
+
+  def __call__(self, *args):
+    import type_conv
+    actual_types = tuple(map(type_conv.typeof, args))
+    expected_types = self.input_types
+    assert actual_types == expected_types, \
+        "Arg type mismatch, expected %s but got %s" % \
+        (expected_types, actual_types)
+    return self.call_unchecked(args)
+
+  def split_output(self, args):
+    if self.output_arg:
+      return args[:-1], args[-1]
+    return args, None
+
+  def call_unchecked(self, args):
+    args, output = self.split_output(args)
+    niters = int(self.niters_fn.call_unchecked(args))
+    if self.combine_fn is not None:
+      return self.reduce(niters, args)
+
+    if self.alloc_fn is None:
+      chunk_args = list(args)
+    else:
+      if output is None:
+        output = self.alloc_fn.call_unchecked(args)
+      chunk_args = [output] + list(args)
+    # the start and stop of each chunk are the only arguments
+    # which change between calls into the native code
+    run_chunk = bind_trailing(self.chunk_fn, 2, chunk_args)
+    parallel_for(run_chunk, niters, self.chunk_size)
+    return output
+
+  def reduce(self, niters, args):
+    if niters <= 0:
+      # no chunks, so no partial results to combine
+      if self.init_fn is None:
+        raise ValueError("Can't reduce an empty array without an initial value")
+      return self.init_fn.call_unchecked(args)
+    reduce_chunk = bind_trailing(self.chunk_fn, 2, args)
+    partials = {}
+    def run_chunk(start, stop):
+      partials[start] = reduce_chunk(start, stop)
+    parallel_for(run_chunk, niters, self.chunk_size)
+    ordered = [partials[start] for start in sorted(partials.keys())]
+    total = tree_combine(bind_trailing(self.combine_fn, 2, args), ordered)
+    if self.finish_fn is not None:
+      total = self.finish_fn.call_unchecked([total] + list(args))
+    return total
+
+class ParallelScanFn(ParallelFn):
+  """
+  Blocked two-pass prefix scan: reduce every block but the last to its
+  total, scan the block totals serially, then rescan all the blocks at once,
+  each starting from the combined total of the blocks before it
+  """
+
+  def __init__(self, parakeet_fn, niters_fn, alloc_fn, block_total_fn,
+               first_total_fn, combine_fn, first_block_fn, rescan_fn,
+               output_arg = False):
+    ParallelFn.__init__(self, parakeet_fn, niters_fn, None,
+                        alloc_fn = alloc_fn, combine_fn = combine_fn,
+                        output_arg = output_arg)
+    self.block_total_fn = block_total_fn
+    self.first_total_fn = first_total_fn
+    self.first_block_fn = first_block_fn
+    self.rescan_fn = rescan_fn
+
+  def call_unchecked(self, args):
+    args, output = self.split_output(args)
+    niters = int(self.niters_fn.call_unchecked(args))
+    if output is None:
+      output = self.alloc_fn.call_unchecked(args)
+    output_args = [output] + list(args)
+    first_block = bind_trailing(self.first_block_fn, 2, output_args)
+    n_threads = num_threads()
+    # the parallel version reads the input twice,
+    # only worth it for big enough arrays
+    if n_threads == 1 or niters < config.parallel_scan_min_iters:
+      first_block(0, niters)
+      return output
+
+    size = chunk_size(niters, n_threads, self.chunk_size)
+    blocks = [(start, min(start + size, niters))
+              for start in xrange(0, niters, size)]
+    if len(blocks) == 1:
+      first_block(0, niters)
+      return output
+    block_total = bind_trailing(self.block_total_fn, 2, args)
+    if self.first_total_fn is not None:
+      first_total = bind_trailing(self.first_total_fn, 2, args)
+    else:
+      first_total = block_total
+    totals = [None] * (len(blocks) - 1)
+    def total_range(lo, hi):
+      for b in xrange(lo, hi):
+        total_fn = first_total if b == 0 else block_total
+        totals[b] = total_fn(*blocks[b])
+    parallel_for(total_range, len(totals), 1)
+
+    combine = bind_trailing(self.combine_fn, 2, args)
+    offsets = [None, totals[0]]
+    for total in totals[1:]:
+      offsets.append(combine(offsets[-1], total))
+
+    rescan = bind_trailing(self.rescan_fn, 3, output_args)
+    def rescan_range(lo, hi):
+      for b in xrange(lo, hi):
+        start, stop = blocks[b]
+        if b == 0:
+          first_block(start, stop)
+        else:
+          rescan(start, stop, offsets[b])
+    parallel_for(rescan_range, len(blocks), 1)
+    return output
+
+def make_parallel_fn(parakeet_fn, compiled_helpers, output_arg = False):
+  if 'rescan' in compiled_helpers:
+    return ParallelScanFn(parakeet_fn,
+                          compiled_helpers['niters'],
+                          compiled_helpers['alloc'],
+                          compiled_helpers['block_total'],
+                          compiled_helpers.get('first_total'),
+                          compiled_helpers['combine'],
+                          compiled_helpers['first_block'],
+                          compiled_helpers['rescan'],
+                          output_arg = output_arg)
+  return ParallelFn(parakeet_fn,
+                    compiled_helpers['niters'],
+                    compiled_helpers['chunk'],
+                    alloc_fn = compiled_helpers.get('alloc'),
+                    combine_fn = compiled_helpers.get('combine'),
+                    finish_fn = compiled_helpers.get('finish'),
+                    init_fn = compiled_helpers.get('init'),
+                    output_arg = output_arg)
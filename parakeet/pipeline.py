@@ -2,11 +2,13 @@ import config
 import syntax 
 import syntax_visitor
 
+from blas_dispatch import BlasDispatch
 from copy_elimination import CopyElimination
 from dead_code_elim import DCE
 from fusion import Fusion
 from inline import Inliner
 from licm import LoopInvariantCodeMotion
+from loop_fusion import LoopFusion
 from loop_unrolling import LoopUnrolling
 from lower_adverbs import LowerAdverbs
 from lower_indexing import LowerIndexing
@@ -18,7 +20,9 @@ from redundant_load_elim import RedundantLoadElimination
 from scalar_replacement import ScalarReplacement
 from shape_elim import ShapeElimination
 from simplify import Simplify
+from tile_adverbs import TileAdverbs
 from index_elimination import IndexElim
+from vectorize import Vectorize
 
 class ContainsAdverbs(syntax_visitor.SyntaxVisitor):
   class Yes(Exception):
@@ -60,12 +64,21 @@ symbolic_range_propagation = Phase(RangePropagation,
                            memoize = False)
 shape_elim = Phase(ShapeElimination,
                    config_param = 'opt_shape_elim')
-# loop_fusion = Phase(LoopFusion, config_param = 'opt_loop_fusion')
+loop_fusion = Phase(LoopFusion, config_param = 'opt_loop_fusion',
+                    memoize = False)
+
+blas = Phase(BlasDispatch, config_param = 'opt_blas', memoize = False,
+             run_if = contains_adverbs)
+tiling = Phase(TileAdverbs, config_param = 'opt_tiling', memoize = False,
+               run_if = contains_adverbs)
 
 loopify = Phase([Simplify,
                  fusion_opt,
+                 blas,
+                 tiling,
                  LowerAdverbs, inline_opt,
                  copy_elim,
+                 loop_fusion,
                  licm,],
                 depends_on = high_level_optimizations,
                 cleanup = [Simplify, DCE],
@@ -80,6 +93,7 @@ scalar_repl = Phase(ScalarReplacement, config_param = 'opt_scalar_replacement')
 load_elim = Phase(RedundantLoadElimination,
                   config_param = 'opt_redundant_load_elimination')
 unroll = Phase(LoopUnrolling, config_param = 'opt_loop_unrolling')
+vectorize = Phase(Vectorize, config_param = 'opt_vectorize')
 
 index_elim = Phase(IndexElim, config_param = 'opt_index_elimination')
 
@@ -94,6 +108,7 @@ post_lowering = Phase([licm,
                        Simplify,
                        load_elim,
                        scalar_repl,
+                       vectorize,
                        ], cleanup = [Simplify, DCE])
 
 lowering = Phase([pre_lowering,
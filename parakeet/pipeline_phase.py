@@ -1,15 +1,103 @@
+import compile_cache
+import compile_profiler
 import config
 
 from clone_function import CloneFunction
+from node import Node
 from syntax import TypedFn
 
+def _structure(value):
+  """
+  Nested tuples of every member of every node below value. Functions referred
+  to from inside the body only contribute their name and version, since
+  phases bump the version of every function they run on.
+  """
+
+  if isinstance(value, Node):
+    if value.__class__ is TypedFn:
+      return (TypedFn, value.name, value.version)
+    return (value.__class__,) + \
+           tuple(_structure(getattr(value, m, None)) for m in value.members())
+  elif isinstance(value, (list, tuple)):
+    return (value.__class__,) + tuple(_structure(elt) for elt in value)
+  elif isinstance(value, dict):
+    return (dict,) + tuple((k, _structure(v))
+                           for (k, v) in sorted(value.iteritems()))
+  try:
+    hash(value)
+    return value
+  except TypeError:
+    # can't look inside, so only the same object counts as unchanged
+    return (value.__class__, id(value))
+
+def fingerprint(fn):
+  """
+  Structural summary of a function which compares equal for two functions
+  only when they have the same name, version, argument and return types,
+  type environment and statements (including the types of all expressions)
+  """
+
+  return (TypedFn,) + tuple(_structure(getattr(fn, m, None))
+                            for m in fn.members())
+
+# transforms (or phases) paired with the fingerprints of functions they left
+# unchanged, only kept for the duration of the outermost apply_transforms
+# since the configuration might change between compilations
+_no_ops = None
+
+def _apply_transform(T, fn, fn_fingerprint):
+  """
+  Returns the transformed function, its fingerprint, and whether it changed.
+  Transforms are deterministic, so a transform which already left a function
+  with this fingerprint alone doesn't need to run again.
+  """
+
+  key = (T, fn_fingerprint)
+  if key in _no_ops:
+    compile_profiler.cache_hit("skipped", T.__name__ if type(T) == type else T,
+                               fn)
+    return fn, fn_fingerprint, False
+  t = T() if type(T) == type else T
+  new_fn = t.apply(fn)
+  assert new_fn is not None, "%s transformed fn into None" % T
+  new_fingerprint = fingerprint(new_fn)
+  if new_fingerprint != fn_fingerprint:
+    return new_fn, new_fingerprint, True
+  # copying phases return an identical function under a new
+  # identity, which we can't skip even though nothing changed
+  if new_fn is fn:
+    _no_ops.add(key)
+  return new_fn, fn_fingerprint, False
+
 def apply_transforms(fn, transforms, cleanup = []):
-  for T in transforms:
-    t = T() if type(T) == type else T
-    fn = t.apply(fn)
-    assert fn is not None, "%s transformed fn into None" % T
-    fn = apply_transforms(fn, cleanup, [])
-  return fn
+  """
+  Run each transform in order. After every transform which changed the
+  function, repeat the cleanup transforms until they stop changing it (at most
+  config.opt_cleanup_iterations times).
+  """
+
+  global _no_ops
+  outermost = _no_ops is None
+  if outermost:
+    _no_ops = set([])
+  try:
+    fn_fingerprint = fingerprint(fn)
+    for T in transforms:
+      fn, fn_fingerprint, changed = _apply_transform(T, fn, fn_fingerprint)
+      if not changed:
+        continue
+      for _ in xrange(config.opt_cleanup_iterations):
+        changed = False
+        for C in cleanup:
+          fn, fn_fingerprint, cleaned = \
+              _apply_transform(C, fn, fn_fingerprint)
+          changed = changed or cleaned
+        if not changed:
+          break
+    return fn
+  finally:
+    if outermost:
+      _no_ops = None
 
 class Phase(object):
   def __init__(self,
@@ -23,7 +111,7 @@ class Phase(object):
                post_apply = None,
                memoize = True,
                name = None):
-    self.cache = {}
+    self.cache = compile_cache.LRUCache("phase")
     if not isinstance(transforms, (tuple, list)):
       transforms = [transforms]
     self.transforms = transforms
@@ -79,9 +167,15 @@ class Phase(object):
       return fn
 
     original_key = fn.name, fn.copied_by
-    if original_key in self.cache:
-      return self.cache[original_key]
+    cached = self.cache.get(original_key)
+    if cached is not None:
+      compile_profiler.cache_hit("phase", self, fn)
+      return cached
+
+    with compile_profiler.stage("phase", self, fn, cache = self.memoize) as s:
+      return s.result(self.apply_uncached(fn, original_key, run_dependencies))
 
+  def apply_uncached(self, fn, original_key, run_dependencies = True):
     if self.depends_on and run_dependencies:
       fn = apply_transforms(fn, self.depends_on)
 
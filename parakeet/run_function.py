@@ -1,10 +1,22 @@
 import ctypes
-from llvm.ee import GenericValue
+import numpy as np
+import threading
 
+import array_type
+import autotune
+import background
+import compile_cache
+import compile_profiler
 import config
 import core_types
+import disk_cache
+import function_registry
 import llvm_backend
-import llvm_types
+import memory
+import output_arg
+import parallel_adverbs
+import parallel_runtime
+import shape_eval
 import stride_specialization
 import syntax
 import type_conv
@@ -14,53 +26,104 @@ from args import ActualArgs
 from llvm_context import global_context
 from pipeline import lowering 
 
-def python_to_generic_value(x, t):
-  if isinstance(t, core_types.FloatT):
-    llvm_t = llvm_types.llvm_value_type(t)
-    return GenericValue.real(llvm_t, x)
-  elif isinstance(t, core_types.SignedT):
-    llvm_t = llvm_types.llvm_value_type(t)
-    return GenericValue.int_signed(llvm_t, x)
-  elif isinstance(t, core_types.IntT):
-    llvm_t = llvm_types.llvm_value_type(t)
-    return GenericValue.int(llvm_t, x)
-  elif isinstance(t, core_types.PtrT):
-    return GenericValue.pointer(x)
+def passed_by_value(t):
+  """
+  Mirror the calling convention from llvm_types.llvm_ref_type: scalars,
+  pointers and None are passed directly, everything else by reference
+  """
+
+  return isinstance(t, (core_types.ScalarT, core_types.PtrT, core_types.NoneT))
+
+def ctypes_arg_type(t):
+  if passed_by_value(t):
+    return t.ctypes_repr
   else:
-    ctypes_obj = type_conv.from_python(x)
-    return GenericValue.pointer(ctypes.addressof(ctypes_obj))
-
-def ctypes_to_generic_value(cval, t):
-  if isinstance(t, core_types.FloatT):
-    llvm_t = llvm_types.llvm_value_type(t)
-    return GenericValue.real(llvm_t, cval.value)
-  elif isinstance(t, core_types.SignedT):
-    llvm_t = llvm_types.llvm_value_type(t)
-    return GenericValue.int_signed(llvm_t, cval.value)
-  elif isinstance(t, core_types.IntT):
-    llvm_t = llvm_types.llvm_value_type(t)
-    return GenericValue.int(llvm_t, cval.value)
-  elif isinstance(t, core_types.NoneT):
-    return GenericValue.int(llvm_types.int64_t, 0)
-  elif isinstance(t, core_types.PtrT):
-    return GenericValue.pointer(ctypes.addressof(cval.contents))
+    return ctypes.POINTER(t.ctypes_repr)
+
+_prototype_cache = {}
+def ctypes_prototype(input_types, return_type):
+  """
+  Cached ctypes function type matching the native signature of a compiled
+  Parakeet function
+  """
+
+  key = (input_types, return_type)
+  if key in _prototype_cache:
+    return _prototype_cache[key]
+  arg_types = [ctypes_arg_type(t) for t in input_types]
+  prototype = ctypes.CFUNCTYPE(ctypes_arg_type(return_type), *arg_types)
+  _prototype_cache[key] = prototype
+  return prototype
+
+class ArrayArgConverter(object):
+  """
+  Fills in a preallocated struct (along with its shape and strides) for each
+  ndarray argument instead of building fresh ctypes objects on every call.
+  There's one set of structs per thread, and each is only valid until the next
+  conversion on that thread, which is plenty for arguments that die with the
+  native call.
+  """
+
+  def __init__(self, t):
+    self.t = t
+    self.local = threading.local()
+
+  def preallocate(self):
+    t = self.t
+    shape = t.shape_t.ctypes_repr()
+    strides = t.strides_t.ctypes_repr()
+    struct = t.ctypes_repr()
+    struct.shape = ctypes.pointer(shape)
+    struct.strides = ctypes.pointer(strides)
+    struct.offset = 0
+    # views of the struct's memory which can be overwritten
+    # with plain integers and tuples
+    data = ctypes.c_void_p.from_buffer(struct, type(struct).data.offset)
+    shape_elts = (ctypes.c_int64 * t.rank).from_buffer(shape)
+    strides_elts = (ctypes.c_int64 * t.rank).from_buffer(strides)
+    slots = (ctypes.byref(struct), struct, data, shape_elts, strides_elts)
+    self.local.slots = slots
+    return slots
+
+  def __call__(self, x):
+    if x.__class__ is not np.ndarray:
+      return ctypes.byref(self.t.from_python(x))
+    slots = getattr(self.local, 'slots', None)
+    if slots is None:
+      slots = self.preallocate()
+    ref, struct, data, shape_elts, strides_elts = slots
+    elt_size = x.dtype.itemsize
+    data.value = x.__array_interface__['data'][0]
+    shape_elts[:] = x.shape
+    strides_elts[:] = [s / elt_size for s in x.strides]
+    struct.size = x.size
+    return ref
+
+def input_converter(t, reuse_structs = True):
+  """
+  Python value -> argument of a native call. Unless reuse_structs is false,
+  the ctypes representation of an array might get overwritten by the next
+  call, so don't hold on to it.
+  """
+
+  if passed_by_value(t):
+    return t.from_python
+  elif reuse_structs and isinstance(t, array_type.ArrayT):
+    return ArrayArgConverter(t)
   else:
-    return GenericValue.pointer(ctypes.addressof(cval))
-
-def generic_value_to_python(gv, t):
-  if isinstance(t, core_types.SignedT):
-    return t.dtype.type(gv.as_int_signed() )
-  elif isinstance(t, core_types.IntT):
-    return t.dtype.type( gv.as_int() )
-  elif isinstance(t, core_types.FloatT):
-    llvm_t = llvm_types.ctypes_scalar_to_lltype(t.ctypes_repr)
-    return t.dtype.type(gv.as_real(llvm_t))
-  elif isinstance(t, core_types.NoneT):
-    return None
+    return lambda v: ctypes.byref(t.from_python(v))
+
+def output_converter(t):
+  if isinstance(t, core_types.NoneT):
+    return lambda _: None
+  elif isinstance(t, core_types.ScalarT):
+    # ctypes already unboxed the native value into a Python scalar,
+    # just wrap it in the corresponding NumPy type
+    return t.dtype.type
+  elif isinstance(t, core_types.PtrT):
+    return lambda ptr: ptr
   else:
-    addr = gv.as_pointer()
-    struct = t.ctypes_repr.from_address(addr)
-    return t.to_python(struct)
+    return lambda ptr, memory = None: t.to_python(ptr.contents, memory)
 
 class CompiledFn:
   def __init__(self, llvm_fn, parakeet_fn,
@@ -68,6 +131,18 @@ class CompiledFn:
     self.llvm_fn = llvm_fn
     self.parakeet_fn = parakeet_fn
     self.exec_engine = exec_engine
+    # keeps the machine code from being freed while this wrapper is around
+    self.native_code = llvm_backend.native_code(llvm_fn)
+
+    prototype = ctypes_prototype(parakeet_fn.input_types,
+                                 parakeet_fn.return_type)
+    fn_ptr = exec_engine.get_pointer_to_function(llvm_fn)
+    self.native_fn = prototype(fn_ptr)
+    self.input_converters = [input_converter(t)
+                             for t in parakeet_fn.input_types]
+    self.output_converter = output_converter(parakeet_fn.return_type)
+    # only results containing arrays care where their memory came from
+    self.returns_arrays = memory.holds_arrays(parakeet_fn.return_type)
 
   def __call__(self, *args):
     actual_types = tuple(map(type_conv.typeof, args))
@@ -75,13 +150,26 @@ class CompiledFn:
     assert actual_types == expected_types, \
         "Arg type mismatch, expected %s but got %s" % \
         (expected_types, actual_types)
-    # calling conventions are that output must be preallocated by the caller'
-    ctypes_inputs = [t.from_python(v) for (v,t) in zip(args, expected_types)]
-    gv_inputs = [ctypes_to_generic_value(cv, t) for (cv,t) in
-                 zip(ctypes_inputs, expected_types)]
+    return self.call_unchecked(args)
 
-    gv_return = self.exec_engine.run_function(self.llvm_fn, gv_inputs)
-    return generic_value_to_python(gv_return, self.parakeet_fn.return_type)
+  def call_unchecked(self, args):
+    """
+    Run the native code without first checking that the types of the arguments
+    match the compiled function's input types
+    """
+
+    if self.returns_arrays and config.zero_copy_results:
+      result_memory = memory.ResultMemory()
+      args = result_memory.track_inputs(args)
+    else:
+      result_memory = None
+    # the converted inputs have to stay alive until the native call returns
+    ctypes_inputs = [convert(v) for (convert, v)
+                     in zip(self.input_converters, args)]
+    result = self.native_fn(*ctypes_inputs)
+    if result_memory is None:
+      return self.output_converter(result)
+    return self.output_converter(result, result_memory)
 
 def prepare_args(fn, args, kwargs):
   """
@@ -92,45 +180,419 @@ def prepare_args(fn, args, kwargs):
   
   if isinstance(fn, syntax.Fn):
     untyped = fn
+    nonlocals = list(untyped.python_nonlocals())
   else:
     import ast_conversion
     # translate from the Python AST to Parakeet's untyped format
     untyped = ast_conversion.translate_function_value(fn)
+    nonlocals = list(function_registry.python_nonlocals(fn, untyped))
 
-  nonlocals = list(untyped.python_nonlocals())
   arg_values = ActualArgs(nonlocals + list(args), kwargs)
 
   # get types of all inputs
   arg_types = arg_values.transform(type_conv.typeof)
   return untyped, arg_values, arg_types
 
-def specialize_and_compile(fn, args, kwargs = {}):
+def specialize_and_compile(fn, args, kwargs = {}, out = None):
   """
   Translate, specialize, optimize, and compile the given function for the types
-  of the supplies arguments.
+  of the supplies arguments. If an output array is given, the compiled code
+  takes it as an extra last argument and stores its result there.
 
   Return the untyped, typed, and compiled representation, along with all the
   arguments needed to actually execute.
   """
 
+  with compile_profiler.stage("specialize_and_compile",
+                              getattr(fn, '__name__', fn)):
+    return _specialize_and_compile(fn, args, kwargs, out)
+
+def _specialize_and_compile(fn, args, kwargs, out):
   untyped, arg_values, arg_types = prepare_args(fn, args, kwargs)
 
   # propagate types through function representation and all
   # other functions it calls
   typed = type_inference.specialize(untyped, arg_types)
-  lowered = lowering.apply(typed)
-  if config.stride_specialization:
-    lowered = stride_specialization.specialize(lowered, arg_values)
 
-  # compile to native code
-  llvm_fn, parakeet_fn, exec_engine = llvm_backend.compile_fn(lowered)
-  compiled_fn_wrapper = CompiledFn(llvm_fn, parakeet_fn, exec_engine)
+  # can the native code store straight into the output? only if
+  # we can make sure beforehand that the result will fit there
+  store_into_out = False
+  if out is not None:
+    out_t = type_conv.typeof(out)
+    assert out_t == typed.return_type, \
+        "Can't store result of type %s in output of type %s" % \
+        (typed.return_type, out_t)
+    linear_args = untyped.args.linearize_without_defaults(arg_values)
+    store_into_out = \
+        shape_eval.known_result_shape(typed, linear_args) is not None
+
+  if config.parallel_outer_adverbs:
+    helpers = parallel_adverbs.parallel_helpers(typed)
+    # reductions don't preallocate anything which an output could replace
+    if helpers is not None and \
+       (out is None or (store_into_out and helpers.get('alloc') is not None)):
+      compiled_helpers = dict((role, compile_typed(helper))
+                              for (role, helper) in helpers.iteritems()
+                              if helper is not None)
+      parallel_fn = parallel_runtime.make_parallel_fn(
+          typed, compiled_helpers, output_arg = out is not None)
+      if out is not None:
+        parallel_fn = OutputShapeCheck(parallel_fn, typed)
+      return untyped, typed, parallel_fn, arg_values
+
+  if out is None:
+    compiled_fn_wrapper = compile_typed(typed, arg_values)
+  elif store_into_out:
+    typed_into = output_arg.add_output_arg(typed)
+    compiled_fn_wrapper = OutputShapeCheck(
+        compile_typed(typed_into, list(arg_values) + [out]), typed)
+    typed = typed_into
+  else:
+    compiled_fn_wrapper = CopyToOutput(compile_typed(typed, arg_values))
   return untyped, typed, compiled_fn_wrapper, arg_values
 
+def wrong_output_shape(out_shape, result_shape):
+  return ValueError("Output of shape %s can't hold a result of shape %s" % \
+                    (out_shape, result_shape))
+
+class OutputShapeCheck(object):
+  """
+  Wraps compiled code which stores its result into a trailing output array,
+  making sure before every call that the output has exactly the shape of the
+  result, since the native code would just write past the end of a smaller one
+  """
+
+  def __init__(self, compiled, typed):
+    self.compiled = compiled
+    self.typed = typed
+    self.parakeet_fn = compiled.parakeet_fn
+
+  def check(self, args):
+    out = args[-1]
+    result_shape = shape_eval.known_result_shape(self.typed, args[:-1])
+    if result_shape is None or tuple(out.shape) != tuple(result_shape):
+      raise wrong_output_shape(out.shape, result_shape)
+
+  def __call__(self, *args):
+    self.check(args)
+    return self.compiled(*args)
+
+  def call_unchecked(self, args):
+    self.check(args)
+    return self.compiled.call_unchecked(args)
+
+class CopyToOutput(object):
+  """
+  Stands in for compiled code taking an output array when we can't tell the
+  shape of the result before computing it: runs the code which allocates its
+  own result and then copies that into the output
+  """
+
+  def __init__(self, compiled):
+    self.compiled = compiled
+    self.parakeet_fn = compiled.parakeet_fn
+
+  def store(self, result, out):
+    if result.shape != out.shape:
+      raise wrong_output_shape(out.shape, result.shape)
+    out[...] = result
+    return out
+
+  def __call__(self, *args):
+    return self.store(self.compiled(*args[:-1]), args[-1])
+
+  def call_unchecked(self, args):
+    return self.store(self.compiled.call_unchecked(args[:-1]), args[-1])
+
+def compile_typed(typed, arg_values = None):
+  """
+  Lower a typed function to native code, specializing on the strides of the
+  given argument values (if any)
+  """
+
+  # only safe to delete evicted LLVM functions between compilations
+  llvm_backend.free_dead_modules()
+  with compile_profiler.stage("lowering", typed.name, typed) as s:
+    lowered = s.result(lowering.apply(typed))
+  if config.stride_specialization and arg_values is not None:
+    lowered = stride_specialization.specialize(lowered, arg_values)
+  llvm_fn, parakeet_fn, exec_engine = llvm_backend.compile_fn(lowered)
+  return CompiledFn(llvm_fn, parakeet_fn, exec_engine)
+
+def compile_for_call(fn, args, kwargs = {}, out = None):
+  """
+  Like specialize_and_compile but only returns what's needed to run the
+  function (the untyped representation, compiled code, and actual args). If
+  the disk cache is enabled, look for the compiled code there first and store
+  it there after a miss. Signatures which autotune.tune has seen get compiled
+  with the settings it recorded for them.
+  """
+
+  with background.compiler_lock:
+    with autotune.Settings(autotune.recorded_settings(fn, args, kwargs)):
+      return _compile_for_call(fn, args, kwargs, out)
+
+def _compile_for_call(fn, args, kwargs, out):
+
+  # parallel functions are split into several native pieces,
+  # which the disk cache doesn't know how to store, its keys
+  # don't cover the type of an output argument, and profiled
+  # loops point at counters which only exist in this process
+  if not config.disk_cache or config.parallel_outer_adverbs or \
+     out is not None or config.profile_loops:
+    untyped, _, compiled, all_args = \
+        specialize_and_compile(fn, args, kwargs, out)
+    return untyped, compiled, all_args
+
+  untyped, arg_values, arg_types = prepare_args(fn, args, kwargs)
+  key = disk_cache.cache_key(fn, arg_values, arg_types)
+  if key is not None:
+    cached = disk_cache.load(key)
+    if cached is not None:
+      llvm_fn, signature, exec_engine = cached
+      return untyped, CompiledFn(llvm_fn, signature, exec_engine), arg_values
+
+  untyped, _, compiled, all_args = specialize_and_compile(fn, args, kwargs)
+  if key is not None:
+    disk_cache.store(key, compiled.llvm_fn, compiled.parakeet_fn, fn)
+  return untyped, compiled, all_args
+
 def run(fn, *args, **kwargs):
   """
   Given a python function, run it in Parakeet on the supplied args
   """
-  untyped, _, compiled, all_args = specialize_and_compile(fn, args, kwargs)
+  untyped, compiled, all_args = compile_for_call(fn, args, kwargs)
   linear_args = untyped.args.linearize_without_defaults(all_args)
   return compiled(*linear_args)
+
+def run_with_output(fn, out, args, kwargs = {}):
+  """
+  Run a Python function in Parakeet, storing its result in the given array
+  rather than allocating a new one
+  """
+
+  untyped, compiled, all_args = compile_for_call(fn, args, kwargs, out)
+  linear_args = untyped.args.linearize_without_defaults(all_args)
+  compiled(*(list(linear_args) + [out]))
+  return out
+
+# Python classes whose values always map to the same Parakeet type,
+# filled in lazily as we encounter them
+_class_determines_type = {}
+
+def signature_elt(python_value):
+  """
+  Cheap hashable summary of everything about a value which might change its
+  compiled specialization: the Parakeet type and, for arrays, the pattern of
+  zero and unit strides. Returns None for values we can't summarize without
+  running the full type conversion (i.e. functions, lists).
+  """
+
+  c = python_value.__class__
+  if c is np.ndarray:
+    if config.stride_specialization:
+      elt_size = python_value.dtype.itemsize
+      strides = tuple([s / elt_size for s in python_value.strides])
+      strides = tuple([s if s in (0,1) else None for s in strides])
+    else:
+      strides = None
+    return (c, python_value.dtype, python_value.ndim, strides)
+  elif c is tuple:
+    elts = tuple([signature_elt(elt) for elt in python_value])
+    if any(elt is None for elt in elts):
+      return None
+    return (c, elts)
+
+  determines_type = _class_determines_type.get(c)
+  if determines_type is None:
+    t = type_conv.typeof(python_value)
+    determines_type = isinstance(t, (core_types.ScalarT, core_types.NoneT))
+    _class_determines_type[c] = determines_type
+  if determines_type:
+    return c
+  else:
+    return None
+
+def signature(values):
+  sig = []
+  for v in values:
+    elt = signature_elt(v)
+    if elt is None:
+      return None
+    sig.append(elt)
+  return tuple(sig)
+
+class DispatchEntry(object):
+  """
+  Everything needed to call a previously compiled specialization: the native
+  function wrapper and the permutation which takes the flat list of
+  (nonlocals + positional + keyword values) to the linear argument order
+  expected by the compiled code.
+  """
+
+  def __init__(self, compiled, linear_positions):
+    self.compiled = compiled
+    self.linear_positions = linear_positions
+
+  def __call__(self, flat_values):
+    return self.compiled.call_unchecked([flat_values[i]
+                                         for i in self.linear_positions])
+
+def linear_positions(untyped, n_nonlocals, n_pos, keyword_names):
+  """
+  Run the argument linearization once on placeholder indices so it doesn't
+  need to be repeated on the values of every call
+  """
+
+  n_leading = n_nonlocals + n_pos
+  positions = ActualArgs(range(n_leading),
+                         dict((k, n_leading + i)
+                              for (i,k) in enumerate(keyword_names)))
+  return tuple(untyped.args.linearize_without_defaults(positions))
+
+class DispatchTable(object):
+  """
+  Per-function table mapping argument signatures straight to compiled code, so
+  that repeated calls with the same types and stride patterns skip
+  specialization and compilation entirely
+  """
+
+  def __init__(self, fn):
+    self.fn = fn
+    self.untyped = None
+    self.entries = compile_cache.LRUCache("dispatch")
+    # signature key -> Compilation running on the background thread
+    self.pending = {}
+
+  def nonlocals(self):
+    return function_registry.python_nonlocals(self.fn, self.untyped)
+
+  def flat_values(self, args, kwargs, keyword_names):
+    values = self.nonlocals() + list(args)
+    for k in keyword_names:
+      values.append(kwargs[k])
+    return values
+
+  def translate(self):
+    if self.untyped is None:
+      import ast_conversion
+      with background.compiler_lock:
+        self.untyped = ast_conversion.translate_function_value(self.fn)
+    return self.untyped
+
+  def key(self, args, kwargs, out):
+    """
+    Flat list of argument values and the dispatch key for their signature,
+    which is None if some value can't be summarized cheaply
+    """
+
+    keyword_names = tuple(sorted(kwargs.keys()))
+    flat_values = self.flat_values(args, kwargs, keyword_names)
+    if out is not None:
+      # the output always goes last in the linear argument order
+      flat_values.append(out)
+    sig = signature(flat_values)
+    if sig is None:
+      return flat_values, None
+    return flat_values, (len(args), keyword_names, out is not None, sig)
+
+  def __call__(self, args, kwargs, out = None):
+    if self.untyped is None and not config.background_compilation:
+      return self.compile_and_run(args, kwargs, out)
+
+    self.translate()
+    flat_values, key = self.key(args, kwargs, out)
+    entry = self.entries.get(key) if key is not None else None
+    if entry is None:
+      if config.background_compilation and key is not None:
+        return self.run_while_compiling(key, args, kwargs, out)
+      return self.compile_and_run(args, kwargs, out)
+    result = entry(flat_values)
+    return result if out is None else out
+
+  def compile_async(self, args, kwargs, out = None):
+    """
+    Start compiling a specialization for the given arguments on the background
+    thread, returning a Compilation future of the compiled function
+    """
+
+    self.translate()
+    _, key = self.key(args, kwargs, out)
+    if key is None:
+      # nothing to look the result up by later, so just compile now
+      compiled, _, _ = self.compile(args, kwargs, out)
+      return background.Finished(compiled)
+    with background.compiler_lock:
+      # a single lookup, the entry could get evicted between two
+      entry = self.entries.get(key)
+      if entry is not None:
+        return background.Finished(entry.compiled)
+      pending = self.pending.get(key)
+      if pending is None:
+        # pass the arguments through submit, which lets go of
+        # them once compiled, instead of closing over them
+        def compile_fn(args, kwargs, out):
+          return self.compile(args, kwargs, out)[0]
+        pending = background.submit(compile_fn, args, kwargs, out)
+        self.pending[key] = pending
+    return pending
+
+  def run_while_compiling(self, key, args, kwargs, out):
+    pending = self.compile_async(args, kwargs, out)
+    if pending.ready():
+      self.pending.pop(key, None)
+      # raises if the compiler failed
+      pending.get()
+      if key in self.entries:
+        return self(args, kwargs, out)
+      return self.compile_and_run(args, kwargs, out)
+    try:
+      return background.interpret(self.untyped, self.nonlocals(), args,
+                                  kwargs, out)
+    except Exception:
+      # the interpreter doesn't support everything
+      # the compiler does, so wait for native code
+      pending.get()
+      self.pending.pop(key, None)
+      return self(args, kwargs, out)
+
+  def compile(self, args, kwargs, out = None):
+    """
+    Compile a specialization for the given arguments and remember it for calls
+    with the same signature, returning the compiled function along with the
+    untyped function and the full list of arguments it expects
+    """
+
+    untyped, compiled, all_args = \
+        compile_for_call(self.fn, args, kwargs, out)
+    self.install(untyped, compiled, args, kwargs, out)
+    return compiled, untyped, all_args
+
+  def install(self, untyped, compiled, args, kwargs, out = None):
+    """Use the compiled code for later calls with the same signature as args"""
+
+    self.untyped = untyped
+    keyword_names = tuple(sorted(kwargs.keys()))
+    flat_values = self.flat_values(args, kwargs, keyword_names)
+    n_nonlocals = len(flat_values) - len(args) - len(keyword_names)
+    if out is not None:
+      flat_values.append(out)
+    sig = signature(flat_values)
+    if sig is not None:
+      positions = linear_positions(untyped, n_nonlocals, len(args),
+                                   keyword_names)
+      if out is not None:
+        positions += (len(flat_values) - 1,)
+      key = (len(args), keyword_names, out is not None, sig)
+      # both the background compiler and the calling thread install
+      # entries, and evicting the oldest one isn't atomic
+      with background.compiler_lock:
+        self.entries[key] = DispatchEntry(compiled, positions)
+
+  def compile_and_run(self, args, kwargs, out = None):
+    compiled, untyped, all_args = self.compile(args, kwargs, out)
+    linear_args = untyped.args.linearize_without_defaults(all_args)
+    if out is None:
+      return compiled(*linear_args)
+    compiled(*(list(linear_args) + [out]))
+    return out
@@ -0,0 +1,429 @@
+"""
+Compact, versioned serialization of Parakeet IR: untyped and typed functions
+along with their types, closures and formal arguments, so the results of ast
+conversion and type inference can be cached or sent to another process
+without going through LLVM.
+
+Usage from Python:
+  data = parakeet.serialization.dumps(typed_fn)
+  typed_fn = parakeet.serialization.loads(data)
+
+The IR gets flattened into nested tuples of plain values which are then
+pickled. Every type and function is stored once in a shared table no matter
+how often it's referenced, and gets rebuilt through the same memoized
+constructors the compiler uses, so loaded types are the very same objects as
+the ones created locally. Loaded functions whose names are already taken get
+fresh names.
+
+Python globals are written out as the module and name they can be found
+under, so functions which refer to closure cells of another Python function
+can't be serialized.
+"""
+
+import cPickle
+import importlib
+import numpy as np
+import sys
+
+import names
+import syntax
+
+from args import ActualArgs, FormalArgs
+from array_type import ArrayT, SliceT, make_array_type, make_slice_type
+from closure_type import ClosureSet, ClosureT, make_closure_type
+from core_types import ConstIntT, FnT, PtrT, Type, TypeValueT, VectorT
+from core_types import make_fn_type, ptr_type, vector_type
+from node import Node
+from python_ref import GlobalNameRef, GlobalValueRef
+from syntax_stmts import SourceInfo, Stmt
+from tuple_type import TupleT, make_tuple_type
+
+# bump whenever the encoding changes, data written
+# with any other version gets rejected by loads
+format_version = 1
+_magic = "parakeet-ir"
+
+class Unserializable(Exception):
+  def __init__(self, value):
+    self.value = value
+
+  def __str__(self):
+    return "Unserializable(%s)" % (self.value,)
+
+class IncompatibleFormat(Exception):
+  def __init__(self, reason):
+    self.reason = reason
+
+  def __str__(self):
+    return "IncompatibleFormat(%s)" % self.reason
+
+_plain_values = (type(None), bool, int, long, float, complex, str, unicode)
+
+def _searched_modules():
+  """Modules whose unnamed globals (primitives, phases) can be referenced"""
+
+  import core_types
+  import pipeline
+  import prims
+  return [core_types, prims, pipeline]
+
+# the name of every object defined in one of the searched modules
+_global_names = None
+
+def _global_name(value):
+  """Module and name under which a Python object can be found again"""
+
+  global _global_names
+  module_name = getattr(value, '__module__', None)
+  name = getattr(value, '__name__', None)
+  if isinstance(value, np.ufunc):
+    module_name = 'numpy'
+  if module_name is not None and isinstance(name, str):
+    module = sys.modules.get(module_name)
+    if module is not None and getattr(module, name, None) is value:
+      return (module_name, name)
+  if _global_names is None:
+    _global_names = {}
+    for module in _searched_modules():
+      for (k, v) in vars(module).iteritems():
+        _global_names.setdefault(id(v), (module.__name__, k))
+  if id(value) in _global_names:
+    module_name, name = _global_names[id(value)]
+    if getattr(sys.modules[module_name], name) is value:
+      return (module_name, name)
+  raise Unserializable(value)
+
+def _reserve_name(name):
+  """Make sure names.fresh never hands out a name which just got loaded"""
+
+  root, _, suffix = name.rpartition('.')
+  if root and suffix.isdigit():
+    version = int(suffix)
+    names.original_names.setdefault(name, root)
+  else:
+    root, version = name, 1
+  if names.versions.get(root, 0) < version:
+    names.versions[root] = version
+
+class Encoder(object):
+  def __init__(self):
+    # module, name and members of every node class used
+    self.classes = []
+    self.class_ids = {}
+    # encoded types and functions, each referring only to earlier entries
+    self.table = []
+    self.table_ids = {}
+    # keep the objects in the table alive so their ids don't get reused
+    self.table_objects = []
+    self.in_progress = set([])
+
+  def class_id(self, cls):
+    if cls in self.class_ids:
+      return self.class_ids[cls]
+    members = tuple(cls.members()) if issubclass(cls, Node) else None
+    n = len(self.classes)
+    self.classes.append((cls.__module__, cls.__name__, members))
+    self.class_ids[cls] = n
+    return n
+
+  def shared(self, obj, encode_fn):
+    key = id(obj)
+    if key in self.table_ids:
+      return ('r', self.table_ids[key])
+    if key in self.in_progress:
+      # only recursive functions refer back to themselves
+      raise Unserializable(obj)
+    self.in_progress.add(key)
+    encoded = encode_fn(obj)
+    self.in_progress.remove(key)
+    n = len(self.table)
+    self.table.append(encoded)
+    self.table_objects.append(obj)
+    self.table_ids[key] = n
+    return ('r', n)
+
+  def values(self, vs):
+    return tuple(self.value(v) for v in vs)
+
+  def value(self, v):
+    c = v.__class__
+    if c in _plain_values:
+      return v
+    elif c is list:
+      return [self.value(elt) for elt in v]
+    elif c is tuple:
+      return ('t',) + self.values(v)
+    elif c is dict:
+      return ('d', [(self.value(k), self.value(elt))
+                    for (k, elt) in v.iteritems()])
+    elif c is set:
+      return ('set', [self.value(elt) for elt in v])
+    elif isinstance(v, Type):
+      return self.shared(v, self.encode_type)
+    elif c is syntax.Fn:
+      return self.shared(v, self.encode_fn)
+    elif c is syntax.TypedFn:
+      return self.shared(v, self.encode_typed_fn)
+    elif isinstance(v, Node):
+      return self.encode_node(v)
+    elif c is FormalArgs:
+      return ('formals', self.value(v.__dict__))
+    elif c is ActualArgs:
+      return ('actuals', self.value(v.positional), self.value(v.keywords),
+              self.value(v.starargs))
+    elif c is GlobalNameRef:
+      return ('global_ref', v.globals_dict['__name__'], v.name)
+    elif c is GlobalValueRef:
+      return ('value_ref', self.value(v.value))
+    elif c is np.dtype:
+      return ('dtype', v.str)
+    elif isinstance(v, np.generic):
+      return ('np', v.dtype.str, v.tostring())
+    elif c is np.ndarray:
+      return ('ndarray', v.dtype.str, self.value(v.shape),
+              np.ascontiguousarray(v).tostring())
+    else:
+      return ('global',) + _global_name(v)
+
+  def encode_node(self, node):
+    c = node.__class__
+    values = self.values(getattr(node, m, None) for m in c.members())
+    source_info = getattr(node, 'source_info', None)
+    if source_info is not None and isinstance(node, Stmt):
+      source = (source_info.filename, source_info.line,
+                source_info.function_name)
+      return ('s', self.class_id(c), values, source)
+    return ('n', self.class_id(c), values)
+
+  def encode_type(self, t):
+    c = t.__class__
+    if c is ArrayT:
+      return ('array', self.value(t.elt_type), t.rank)
+    elif c is TupleT:
+      return ('tuple', self.values(t.elt_types))
+    elif c is SliceT:
+      return ('slice', self.value(t.start_type), self.value(t.stop_type),
+              self.value(t.step_type))
+    elif c is PtrT:
+      return ('ptr', self.value(t.elt_type))
+    elif c is VectorT:
+      return ('vector', self.value(t.elt_type), t.width)
+    elif c is ClosureT:
+      return ('closure', self.value(t.fn), self.values(t.arg_types))
+    elif c is FnT:
+      return ('fn_type', self.values(t.input_types),
+              self.value(t.return_type))
+    elif c is TypeValueT:
+      return ('type_value', self.value(t.type))
+    elif c is ClosureSet:
+      return ('closure_set', [self.value(clos_t) for clos_t in t.closures])
+    elif c is ConstIntT:
+      return ('const_int', t.value)
+    else:
+      # scalars and the other singleton types
+      return ('global',) + _global_name(t)
+
+  def encode_fn(self, fn):
+    return ('fn', fn.name, self.value(fn.args), self.value(fn.body),
+            self.value(fn.python_refs), self.value(fn.parakeet_nonlocals))
+
+  def encode_typed_fn(self, fn):
+    return ('typed_fn', fn.name, self.value(fn.arg_names),
+            self.value(fn.body), self.value(fn.input_types),
+            self.value(fn.return_type), self.value(fn.type_env),
+            self.value(fn.copied_by))
+
+class Decoder(object):
+  def __init__(self, classes):
+    self.classes = [self.find_class(*entry) for entry in classes]
+    self.table = []
+
+  def find_class(self, module_name, class_name, members):
+    cls = getattr(importlib.import_module(module_name), class_name, None)
+    if cls is None:
+      raise IncompatibleFormat("%s.%s not found" % (module_name, class_name))
+    if members is not None and tuple(cls.members()) != members:
+      raise IncompatibleFormat("members of %s changed" % class_name)
+    return cls
+
+  def value(self, v):
+    c = v.__class__
+    if c is tuple:
+      return self.decoders[v[0]](self, v)
+    elif c is list:
+      return [self.value(elt) for elt in v]
+    else:
+      return v
+
+  def values(self, vs):
+    return tuple(self.value(v) for v in vs)
+
+  def decode_ref(self, v):
+    return self.table[v[1]]
+
+  def decode_tuple(self, v):
+    return tuple(self.value(elt) for elt in v[1:])
+
+  def decode_dict(self, v):
+    return dict((self.value(k), self.value(elt)) for (k, elt) in v[1])
+
+  def decode_set(self, v):
+    return set(self.value(elt) for elt in v[1])
+
+  def decode_node(self, v):
+    node = self.classes[v[1]](*self.values(v[2]))
+    if node.__class__ is syntax.Var:
+      _reserve_name(node.name)
+    return node
+
+  def decode_stmt(self, v):
+    stmt = self.decode_node(v)
+    stmt.source_info = SourceInfo(*v[3])
+    return stmt
+
+  def decode_formals(self, v):
+    formals = FormalArgs.__new__(FormalArgs)
+    formals.__dict__.update(self.value(v[1]))
+    for name in formals.nonlocals + tuple(formals.positional):
+      _reserve_name(name)
+    if formals.starargs:
+      _reserve_name(formals.starargs)
+    return formals
+
+  def decode_actuals(self, v):
+    return ActualArgs(*self.values(v[1:]))
+
+  def decode_global_ref(self, v):
+    module = importlib.import_module(v[1])
+    return GlobalNameRef(vars(module), v[2])
+
+  def decode_value_ref(self, v):
+    return GlobalValueRef(self.value(v[1]))
+
+  def decode_dtype(self, v):
+    return np.dtype(v[1])
+
+  def decode_np(self, v):
+    return np.fromstring(v[2], dtype = np.dtype(v[1]))[0]
+
+  def decode_ndarray(self, v):
+    array = np.fromstring(v[3], dtype = np.dtype(v[1]))
+    return array.reshape(self.value(v[2]))
+
+  def decode_global(self, v):
+    return getattr(importlib.import_module(v[1]), v[2])
+
+  def decode_array(self, v):
+    return make_array_type(self.value(v[1]), v[2])
+
+  def decode_tuple_type(self, v):
+    return make_tuple_type(self.values(v[1]))
+
+  def decode_slice(self, v):
+    return make_slice_type(*self.values(v[1:]))
+
+  def decode_ptr(self, v):
+    return ptr_type(self.value(v[1]))
+
+  def decode_vector(self, v):
+    return vector_type(self.value(v[1]), v[2])
+
+  def decode_closure(self, v):
+    return make_closure_type(self.value(v[1]), self.values(v[2]))
+
+  def decode_fn_type(self, v):
+    return make_fn_type(self.values(v[1]), self.value(v[2]))
+
+  def decode_type_value(self, v):
+    return TypeValueT(self.value(v[1]))
+
+  def decode_closure_set(self, v):
+    return ClosureSet(*[self.value(clos_t) for clos_t in v[1]])
+
+  def decode_const_int(self, v):
+    return ConstIntT(v[1])
+
+  def decode_fn(self, v):
+    name = v[1]
+    _reserve_name(name)
+    if name in syntax.Fn.registry:
+      name = names.refresh(name)
+    return syntax.Fn(name, *self.values(v[2:]))
+
+  def decode_typed_fn(self, v):
+    name = v[1]
+    _reserve_name(name)
+    if name in syntax.TypedFn.max_version:
+      name = names.refresh(name)
+    arg_names, body, input_types, return_type, type_env, copied_by = \
+        self.values(v[2:])
+    for local_name in type_env:
+      _reserve_name(local_name)
+    return syntax.TypedFn(name = name,
+                          arg_names = arg_names,
+                          body = body,
+                          input_types = input_types,
+                          return_type = return_type,
+                          type_env = type_env,
+                          copied_by = copied_by)
+
+  decoders = {
+    'r' : decode_ref,
+    't' : decode_tuple,
+    'd' : decode_dict,
+    'set' : decode_set,
+    'n' : decode_node,
+    's' : decode_stmt,
+    'formals' : decode_formals,
+    'actuals' : decode_actuals,
+    'global_ref' : decode_global_ref,
+    'value_ref' : decode_value_ref,
+    'dtype' : decode_dtype,
+    'np' : decode_np,
+    'ndarray' : decode_ndarray,
+    'global' : decode_global,
+    'array' : decode_array,
+    'tuple' : decode_tuple_type,
+    'slice' : decode_slice,
+    'ptr' : decode_ptr,
+    'vector' : decode_vector,
+    'closure' : decode_closure,
+    'fn_type' : decode_fn_type,
+    'type_value' : decode_type_value,
+    'closure_set' : decode_closure_set,
+    'const_int' : decode_const_int,
+    'fn' : decode_fn,
+    'typed_fn' : decode_typed_fn,
+  }
+
+def dumps(value):
+  """
+  Serialize an untyped or typed function (or any other piece of IR) along
+  with every type and function it refers to
+  """
+
+  encoder = Encoder()
+  root = encoder.value(value)
+  return cPickle.dumps((_magic, format_version, encoder.classes,
+                        encoder.table, root), cPickle.HIGHEST_PROTOCOL)
+
+def loads(data):
+  try:
+    magic, version, classes, table, root = cPickle.loads(data)
+  except Exception:
+    raise IncompatibleFormat("not serialized Parakeet IR")
+  if magic != _magic:
+    raise IncompatibleFormat("not serialized Parakeet IR")
+  if version != format_version:
+    raise IncompatibleFormat("format version %s, expected %s" % \
+                             (version, format_version))
+  decoder = Decoder(classes)
+  for encoded in table:
+    decoder.table.append(decoder.value(encoded))
+  return decoder.value(root)
+
+def dump(value, f):
+  f.write(dumps(value))
+
+def load(f):
+  return loads(f.read())
@@ -1,7 +1,14 @@
 from traversal import Traversal 
+import numbers
 import types 
 import numpy as np 
 
+from array_type import ArrayT, SliceT
+from closure_type import ClosureT
+from core_types import ScalarT, StructT
+from shape import Shape
+from tuple_type import TupleT
+
 def transform_value(x):
   """
   Replace arrays with their shapes, 
@@ -43,8 +50,8 @@ class EvalShape(Traversal):
     
   def visit_Shape(self, v):
     dims = self.visit_tuple(v.dims)
-    assert all(isinstance(d, int) for d in dims)
-    return dims
+    assert all(isinstance(d, numbers.Integral) for d in dims)
+    return tuple(int(d) for d in dims)
     
   def visit_Dim(self, v):
     return self.visit(v.array)[v.dim]
@@ -85,5 +92,57 @@ def result_shape(typed_fn, input_values):
   symbolic_shape = shape_inference.call_shape_expr(typed_fn)
   return eval_shape(symbolic_shape, input_values)
 
-      
-  
\ No newline at end of file
+def input_dims(value, t, result):
+  """
+  Flatten an input value the way shape_from_type numbers it: one entry per
+  scalar and per array dimension. Closure arguments and struct fields get
+  None, since we don't have their values.
+  """
+
+  if isinstance(t, ScalarT):
+    # NumPy scalars would make the evaluated dims NumPy scalars too
+    if isinstance(value, np.generic):
+      value = value.item()
+    result.append(value)
+  elif t.__class__ is ArrayT:
+    result.extend(np.shape(value) if value is not None else [None] * t.rank)
+  elif t.__class__ is TupleT:
+    if value is None:
+      value = [None] * len(t.elt_types)
+    for (elt, elt_t) in zip(value, t.elt_types):
+      input_dims(elt, elt_t, result)
+  elif t.__class__ is SliceT:
+    if value is None:
+      parts = (None, None, None)
+    else:
+      parts = (value.start, value.stop, value.step)
+    for (part, part_t) in zip(parts, (t.start_type, t.stop_type, t.step_type)):
+      input_dims(part, part_t, result)
+  elif t.__class__ is ClosureT:
+    for arg_t in t.arg_types:
+      input_dims(None, arg_t, result)
+  elif isinstance(t, StructT):
+    for (_, field_t) in t._fields_:
+      input_dims(None, field_t, result)
+  return result
+
+def known_result_shape(typed_fn, input_values):
+  """
+  Shape of the array typed_fn returns when called on the given values, or None
+  if it depends on more than the shapes and scalar values of the inputs
+  """
+
+  import shape_inference
+  symbolic_shape = shape_inference.call_shape_expr(typed_fn)
+  if symbolic_shape.__class__ is not Shape:
+    return None
+  dims = []
+  for (v, t) in zip(input_values, typed_fn.input_types):
+    input_dims(v, t, dims)
+  evaluator = EvalShape([])
+  evaluator.inputs = dims
+  try:
+    return evaluator.visit(symbolic_shape)
+  except (AssertionError, IndexError, TypeError):
+    # unknown dimensions, or ones computed from values we don't have
+    return None
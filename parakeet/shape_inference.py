@@ -103,6 +103,13 @@ class ShapeInference(SyntaxVisitor):
     # we don't yet care about here
     return unknown_value
 
+  def visit_BlasCall(self, expr):
+    for arg in expr.args:
+      self.visit_expr(arg)
+    if isinstance(expr.type, core_types.ScalarT):
+      return any_scalar
+    return unknown_value
+
   def visit_Struct(self, expr):
     if isinstance(expr.type, ArrayT):
       shape_tuple = self.visit_expr(expr.args[1])
@@ -283,6 +290,10 @@ class ShapeInference(SyntaxVisitor):
     fn = self.visit_expr(expr.fn)
     return shape_semantics.eval_index_map(fn, shape_tuple)
     
+  def visit_ParFor(self, expr):
+    # only evaluated for its side effects
+    return Const(None)
+
   def visit_IndexReduce(self, expr):
     assert False, "IndexReduce not implemented"
     
@@ -14,7 +14,7 @@ from syntax import AllocArray, Assign, ExprStmt, Adverb
 from syntax import Const, Var, Tuple, TupleProj, Closure, ClosureElt, Cast
 from syntax import Slice, Index, Array, ArrayView, Attribute, Struct
 from syntax import PrimCall, Call, TypedFn, Fn
-from syntax import AllPairs, Map, Reduce, Scan, IndexMap, IndexReduce
+from syntax import AllPairs, Map, Reduce, Scan, IndexMap, IndexReduce, ParFor
 from syntax_helpers import collect_constants, is_one, is_zero, all_constants
 from syntax_helpers import get_types, slice_none_t, const_int
 from transform import Transform
@@ -102,6 +102,9 @@ class Simplify(Transform):
     return None
 
   def immutable(self, expr):
+    # ParFor is only ever evaluated for its side effects
+    if expr.__class__ is ParFor:
+      return False
     return (isinstance(expr, (Const, Tuple, Adverb, Cast, Var, PrimCall)) and 
             (all(self.immutable(c) for c in expr.children())) or \
            (isinstance(expr, (Attribute, TupleProj)) and \
@@ -1,5 +1,7 @@
 import numpy as np
 
+import compile_cache
+import compile_profiler
 import type_conv
 
 from array_type import ArrayT
@@ -281,7 +283,7 @@ def has_unit_stride(abstract_value):
   else:
     return False
   
-_cache = {}
+_cache = compile_cache.LRUCache("stride_specializations")
 def specialize(fn, python_values, types = None):
   if types is None:
     abstract_values = from_python_list(python_values)
@@ -294,14 +296,18 @@ def specialize(fn, python_values, types = None):
       abstract_values.append(from_internal_repr(t, internal_value))
   
   key = (fn.name, tuple(abstract_values))
-  if key in _cache:
-    return _cache[key]
+  cached = _cache.get(key)
+  if cached is not None:
+    compile_profiler.cache_hit("stride_specialization", fn.name, fn)
+    return cached
   elif any(has_unit_stride(v) for v in abstract_values):
     specializer = StrideSpecializer(abstract_values)
     
     transforms = Phase([specializer, Simplify, DCE],
                         memoize = False, copy = True)
-    new_fn = transforms.apply(fn)
+    with compile_profiler.stage("stride_specialization", fn.name, fn,
+                                cache = True) as s:
+      new_fn = s.result(transforms.apply(fn))
   else:
     new_fn = fn
   _cache[key] = new_fn
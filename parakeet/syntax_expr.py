@@ -358,4 +358,49 @@ class Alloc(Expr):
     return (self.count,)
 
   def __hash__(self):
-    return hash((self.elt_type, self.count))
\ No newline at end of file
+    return hash((self.elt_type, self.count))
+
+class VectorSplat(Expr):
+  """Fills every lane of a SIMD vector with the same scalar"""
+
+  _members = ['value']
+
+  def __str__(self):
+    return "splat(%s) : %s" % (self.value, self.type)
+
+  def children(self):
+    return (self.value,)
+
+  def __hash__(self):
+    return hash(self.value)
+
+class VectorReduce(Expr):
+  """Combines the lanes of a SIMD vector with a binary primitive"""
+
+  _members = ['prim', 'vector']
+
+  def __str__(self):
+    return "reduce<%s>(%s)" % (self.prim.name, self.vector)
+
+  def children(self):
+    return (self.vector,)
+
+  def __hash__(self):
+    return hash((self.prim, self.vector))
+
+class BlasCall(Expr):
+  """
+  Calls a routine from the BLAS library, arrays get passed as a pointer to
+  their first element and everything else by reference (as Fortran expects)
+  """
+
+  _members = ['name', 'args']
+
+  def node_init(self):
+    self.args = tuple(self.args)
+
+  def __str__(self):
+    return "blas_%s(%s)" % (self.name, ", ".join(str(arg) for arg in self.args))
+
+  def children(self):
+    return self.args
@@ -2,8 +2,21 @@
 from  node import Node
 
 
+class SourceInfo(object):
+  """Where in the original Python source a statement came from"""
+
+  def __init__(self, filename, line, function_name):
+    self.filename = filename
+    self.line = line
+    self.function_name = function_name
+
+  def __str__(self):
+    return "%s:%s (%s)" % (self.filename, self.line, self.function_name)
+
 class Stmt(Node):
-  pass
+  # not a member, so it doesn't take part in comparisons
+  # and Transform copies it onto rewritten statements
+  source_info = None
 
 def block_to_str(stmts):
   body_str = '\n'
@@ -78,6 +78,10 @@ class SyntaxVisitor(object):
     self.visit_expr(expr.fn)
     self.visit_expr(expr.shape)
 
+  def visit_ParFor(self, expr):
+    self.visit_expr(expr.fn)
+    self.visit_expr(expr.shape)
+
   def visit_IndexReduce(self, expr):
     self.visit_expr(expr.fn)
     self.visit_expr(expr.combine)
@@ -119,6 +123,16 @@ class SyntaxVisitor(object):
   def visit_Cast(self, expr):
     return self.visit_expr(expr.value)
 
+  def visit_VectorSplat(self, expr):
+    return self.visit_expr(expr.value)
+
+  def visit_VectorReduce(self, expr):
+    return self.visit_expr(expr.vector)
+
+  def visit_BlasCall(self, expr):
+    for arg in expr.args:
+      self.visit_expr(arg)
+
   def visit_Range(self, expr):
     self.visit_expr(expr.start)
     self.visit_expr(expr.stop)
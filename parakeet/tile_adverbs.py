@@ -0,0 +1,88 @@
+import adverb_patterns
+import config
+import syntax_helpers
+
+from adverb_semantics import AdverbSemantics
+from array_type import ArrayT
+from syntax import AllPairs
+from transform import Transform
+
+class TileAdverbs(adverb_patterns.WholeArrayAdverbs, AdverbSemantics,
+                  Transform):
+  """
+  Block all-pairs computations over the rows of two matrices (an AllPairs or
+  a Map whose function maps over another array) into loops over tiles, so
+  that the rows of both tiles stay in cache while every pair of them gets
+  combined. Each tile is still an AllPairs, which LowerAdverbs then writes
+  straight into its part of the output.
+  """
+
+  def tileable(self, x, y, axis):
+    return syntax_helpers.unwrap_constant(axis) == 0 and \
+        isinstance(x.type, ArrayT) and x.type.rank > 1 and \
+        isinstance(y.type, ArrayT) and y.type.rank > 1
+
+  def tile_sizes(self, first_x, first_y):
+    """
+    Number of rows to take from x and y per tile, either fixed through
+    config.opt_tile_sizes or as many as fit into config.opt_tile_cache_bytes
+    """
+
+    if config.opt_tile_sizes is not None:
+      tile_x, tile_y = config.opt_tile_sizes
+      return self.int(tile_x), self.int(tile_y)
+
+    x_row_bytes = self.mul(self.nelts(first_x),
+                           self.int(first_x.type.elt_type.nbytes))
+    y_row_bytes = self.mul(self.nelts(first_y),
+                           self.int(first_y.type.elt_type.nbytes))
+    row_bytes = self.add(x_row_bytes, y_row_bytes, "row_bytes")
+    row_bytes = self.max(row_bytes, self.int(1), "row_bytes")
+    tile = self.div(self.int(config.opt_tile_cache_bytes), row_bytes)
+    tile = self.max(tile, self.int(1), "tile_size")
+    return tile, tile
+
+  def tile_allpairs(self, fn, x, y, axis, result_t):
+    nx = self.shape(x, 0)
+    ny = self.shape(y, 0)
+    zero = self.int(0)
+    one = self.int(1)
+    first_x = self.slice_along_axis(x, 0, zero)
+    first_y = self.slice_along_axis(y, 0, zero)
+    output = self.create_output_array(fn, [first_x, first_y],
+                                      self.tuple([nx, ny]))
+    tile_x, tile_y = self.tile_sizes(first_x, first_y)
+
+    def x_tile_loop(ii):
+      stop_i = self.min(self.add(ii, tile_x), nx, "tile_stop_x")
+      rows_i = self.slice_value(ii, stop_i, one)
+      x_tile = self.index(x, [rows_i], name = "x_tile")
+      def y_tile_loop(jj):
+        stop_j = self.min(self.add(jj, tile_y), ny, "tile_stop_y")
+        rows_j = self.slice_value(jj, stop_j, one)
+        y_tile = self.index(y, [rows_j], name = "y_tile")
+        out_tile = self.index(output, [rows_i, rows_j], temp = False)
+        self.assign(out_tile, AllPairs(fn = fn, args = (x_tile, y_tile),
+                                       axis = axis, type = result_t))
+      self.loop(zero, ny, y_tile_loop, step = tile_y)
+    self.loop(zero, nx, x_tile_loop, step = tile_x)
+    return output
+
+  def transform_Map(self, expr):
+    if syntax_helpers.unwrap_constant(expr.axis) != 0:
+      return expr
+    nested = adverb_patterns.nested_map(expr)
+    if nested is None:
+      return expr
+    inner_fn, elts, y = nested
+    fn = self.closure(inner_fn, elts)
+    x = expr.args[0]
+    if not self.tileable(x, y, expr.axis):
+      return expr
+    return self.tile_allpairs(fn, x, y, expr.axis, expr.type)
+
+  def transform_AllPairs(self, expr):
+    x, y = expr.args
+    if not self.tileable(x, y, expr.axis):
+      return expr
+    return self.tile_allpairs(expr.fn, x, y, expr.axis, expr.type)
@@ -1,5 +1,6 @@
 import time
 
+import compile_profiler
 import config
 import syntax
 import verify
@@ -115,6 +116,18 @@ class Transform(Codegen):
     expr.value = self.transform_expr(expr.value)
     return expr
 
+  def transform_VectorSplat(self, expr):
+    expr.value = self.transform_expr(expr.value)
+    return expr
+
+  def transform_VectorReduce(self, expr):
+    expr.vector = self.transform_expr(expr.vector)
+    return expr
+
+  def transform_BlasCall(self, expr):
+    expr.args = self.transform_expr_tuple(expr.args)
+    return expr
+
   def transform_TupleProj(self, expr):
     expr.tuple = self.transform_expr(expr.tuple)
     return expr
@@ -172,6 +185,11 @@ class Transform(Codegen):
     expr.shape = self.transform_expr(expr.shape)
     return expr 
   
+  def transform_ParFor(self, expr):
+    expr.fn = self.transform_expr(expr.fn)
+    expr.shape = self.transform_expr(expr.shape)
+    return expr
+
   def transform_IndexReduce(self, expr):
     expr.fn = self.transform_expr(expr.fn)
     expr.combine = self.transform_expr(expr.combine)
@@ -402,9 +420,18 @@ class Transform(Codegen):
     if self.reverse: 
       stmts = reversed(stmts)
     for old_stmt in  stmts:
+      source_info = old_stmt.source_info
+      if source_info is not None:
+        n_before = len(self.blocks.top())
       new_stmt = self.transform_stmt(old_stmt)
       if new_stmt is not None:
         self.blocks.append_to_current(new_stmt)
+      if source_info is not None:
+        # anything generated from a statement, such as the
+        # loops of a lowered adverb, points back to its source
+        for stmt in self.blocks.top()[n_before:]:
+          if stmt.source_info is None:
+            stmt.source_info = source_info
     new_block = self.blocks.pop()
     if self.reverse:
       new_block.reverse()
@@ -417,6 +444,10 @@ class Transform(Codegen):
     pass 
 
   def apply(self, fn):
+    with compile_profiler.stage("transform", self.__class__.__name__, fn) as s:
+      return s.result(self.apply_transform(fn))
+
+  def apply_transform(self, fn):
     if config.print_transform_timings:
       start_time = time.time()
 
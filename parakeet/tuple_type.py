@@ -19,8 +19,7 @@ class TupleT(StructT):
     self.elt_types = tuple(self.elt_types)
     self._fields_ = [("elt%d" % i, t) for (i,t) in enumerate(self.elt_types)]
 
-  def from_python(self, python_tuple, _keep_forever = []):
-    # _keep_forever.append(python_tuple)
+  def from_python(self, python_tuple):
     converted_elts = []
     for elt in python_tuple:
       parakeet_type = type_conv.typeof(elt)
@@ -31,14 +30,14 @@ class TupleT(StructT):
       converted_elts.append(c_elt)
     return self.ctypes_repr(*converted_elts)
 
-  def to_python(self, struct_obj):
+  def to_python(self, struct_obj, memory = None):
     elt_values = []
     for (field_name, field_type) in self._fields_:
       c_elt = getattr(struct_obj, field_name)
       if isinstance(field_type, StructT):
-        c_elt = c_elt.contents
-
-      py_elt = field_type.to_python(c_elt)
+        py_elt = field_type.to_python(c_elt.contents, memory)
+      else:
+        py_elt = field_type.to_python(c_elt)
 
       elt_values.append(py_elt)
     return tuple(elt_values)
@@ -24,13 +24,11 @@ def equiv_type(python_type):
   return _type_mapping[python_type]
 
 def typeof(python_value):
-  import decorators 
-  if isinstance(python_value, decorators.jit):
-    python_value = python_value.f 
-  python_type = type(python_value)
-  assert python_type in _typeof_functions, \
-      "Don't know how to convert value %s : %s" % (python_value, python_type)
-  return _typeof_functions[python_type](python_value)
+  typeof_fn = _typeof_functions.get(type(python_value))
+  assert typeof_fn is not None, \
+      "Don't know how to convert value %s : %s" % \
+      (python_value, type(python_value))
+  return typeof_fn(python_value)
 
 def from_python(python_value):
   """
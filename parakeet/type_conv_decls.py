@@ -26,11 +26,16 @@ def typeof_tuple(python_tuple):
 
 type_conv.register(types.TupleType, TupleT, typeof_tuple)
 
+_array_types = {}
 def typeof_array(x):
-  x = np.asarray(x)
-  elt_t = core_types.from_dtype(x.dtype)
-  rank = len(x.shape)
-  return make_array_type(elt_t, rank)
+  if x.__class__ is not np.ndarray:
+    x = np.asarray(x)
+  key = (x.dtype, x.ndim)
+  t = _array_types.get(key)
+  if t is None:
+    t = make_array_type(core_types.from_dtype(x.dtype), x.ndim)
+    _array_types[key] = t
+  return t
 
 type_conv.register((np.ndarray, list, xrange), ArrayT, typeof_array)
 
@@ -42,8 +47,9 @@ type_conv.register(prims.class_list, ClosureT, typeof_prim)
 
 def typeof_fn(f):
   import ast_conversion
+  import function_registry
   untyped_fn = ast_conversion.translate_function_value(f)
-  closure_args = untyped_fn.python_nonlocals()
+  closure_args = function_registry.python_nonlocals(f, untyped_fn)
   closure_arg_types = map(type_conv.typeof, closure_args)
   return make_closure_type(untyped_fn, closure_arg_types)
 
@@ -2,6 +2,8 @@ import adverb_helpers
 import array_type
 import ast_conversion
 import closure_type
+import compile_cache
+import compile_profiler
 import config
 import core_types 
 import names
@@ -141,7 +143,7 @@ def linearize_actual_args(fn, args):
     combined_args = untyped_fn.args.linearize_without_defaults(args, tuple_elts)
     return untyped_fn, combined_args, arg_types
 
-_invoke_type_cache = {}
+_invoke_type_cache = compile_cache.LRUCache("invoke_types")
 def invoke_result_type(fn, arg_types):
   if isinstance(fn, syntax.TypedFn):
     assert isinstance(arg_types, (list, tuple))
@@ -155,8 +157,9 @@ def invoke_result_type(fn, arg_types):
     arg_types = ActualArgs(arg_types)
 
   key = (fn, arg_types)
-  if key in _invoke_type_cache:
-    return _invoke_type_cache[key]
+  cached = _invoke_type_cache.get(key)
+  if cached is not None:
+    return cached
 
   if isinstance(fn, closure_type.ClosureT):
     closure_set = closure_type.ClosureSet(fn)
@@ -448,6 +451,24 @@ class Annotator(Transform):
                            fn = make_typed_closure(closure, typed_fn), 
                            type = result_type)
   
+  def transform_ParFor(self, expr):
+    shape = self.transform_expr(expr.shape)
+    if not isinstance(shape.type, TupleT):
+      assert isinstance(shape.type, ScalarT), \
+          "Invalid shape for ParFor: %s" % (shape,)
+      shape = self.tuple((shape,))
+    closure = self.transform_expr(expr.fn)
+    shape_t = shape.type
+    assert all(isinstance(t, ScalarT) for t in shape_t.elt_types)
+    n_indices = len(shape_t.elt_types)
+    if not all(t == Int64 for t in shape_t.elt_types):
+      elts = tuple(self.cast(elt, Int64) for elt in self.tuple_elts(shape))
+      shape = self.tuple(elts)
+    typed_fn = specialize_ParFor(closure.type, n_indices)
+    return syntax.ParFor(shape = shape,
+                         fn = make_typed_closure(closure, typed_fn),
+                         type = NoneType)
+
   def transform_IndexReduce(self, expr):
     shape = self.transform_expr(expr.shape)
     map_fn_closure = self.transform_expr(expr.fn)
@@ -967,12 +988,16 @@ def specialize(fn, arg_types, return_type = None):
     arg_types = ActualArgs(arg_types)
   closure_t = _get_closure_type(fn)
   key = arg_types, return_type
-  if key in closure_t.specializations:
-    return closure_t.specializations[key]
+  cached = closure_t.specializations.get(key)
+  if cached is not None:
+    compile_profiler.cache_hit("specialize", cached.name)
+    return cached
 
   full_arg_types = arg_types.prepend_positional(closure_t.arg_types)
   fundef = _get_fundef(closure_t.fn)
-  typed =  _specialize(fundef, full_arg_types, return_type)
+  with compile_profiler.stage("specialize", fundef.name, fundef,
+                              cache = True) as s:
+    typed = s.result(_specialize(fundef, full_arg_types, return_type))
   closure_t.specializations[key] = typed
 
   if config.print_specialized_function:
@@ -1004,6 +1029,10 @@ def specialize_IndexMap(fn, n_indices):
   result_type = array_type.increase_rank(typed_fn.return_type, n_indices)
   return result_type, typed_fn
 
+def specialize_ParFor(fn, n_indices):
+  idx_type = make_tuple_type( (Int64,) * n_indices) if n_indices > 1 else Int64
+  return specialize(fn, (idx_type,))
+
 def specialize_IndexReduce(fn, combine, n_indices, init = None):
   idx_type = make_tuple_type( (Int64,) * n_indices) if n_indices > 1 else Int64
   if init is None or isinstance(init.type, NoneT):
@@ -1,42 +1,458 @@
-from core_types import Int32, Int64, Float32, Float64
+import config
+import prims
+
+from clone_stmt import CloneStmt
+from core_types import Int32, Int64, Float32, Float64, FloatT, PtrT
+from core_types import vector_type
 from loop_transform import LoopTransform
+from syntax import Assign, Comment, Const, ForLoop, If, Index, PrimCall, Var
+from syntax import VectorReduce, VectorSplat
+from syntax_helpers import const_int, one, zero
+
+class NotVectorizable(Exception):
+  pass
+
+# how values computed inside of a loop vary across its iterations
+INVARIANT = 'invariant'
+LINEAR = 'linear'
+VECTOR = 'vector'
+ACCUMULATOR = 'accumulator'
+REDUCED = 'reduced'
+
+class LoopPlan(object):
+  """
+  What the analysis of a loop found out about the values in its body:
+    - linear: index values of the form base + coef * loop_var
+    - vectors: element type of every value which gets one lane per iteration
+    - copies: variables which are just another name for an outer value
+    - reductions: merge variable -> (prim, vector operand, updated name)
+    - reduced: updated accumulators (and their copies) -> merge variable
+  """
+
+  def __init__(self, stmt):
+    self.stmt = stmt
+    self.loop_var = stmt.var.name
+    self.bound = set(stmt.merge.keys())
+    self.bound.add(self.loop_var)
+    for body_stmt in stmt.body:
+      if body_stmt.__class__ is Assign and body_stmt.lhs.__class__ is Var:
+        self.bound.add(body_stmt.lhs.name)
+    self.linear = {}
+    self.vectors = {}
+    self.copies = {}
+    self.reductions = {}
+    self.reduced = {}
+    self.loads = []
+    self.stores = []
+    # strides which have to be 1 at runtime for the vector loop to be used
+    self.unit_checks = []
 
 class Vectorize(LoopTransform):
-  
-  def pre_apply(self, _):
-    # skip the may-alias analysis from LoopTransform
-    pass 
-  
-  vector_elt_types = (Int32, Int64, Float32, Float64) 
-  def vectorize_loop(self, stmt):
-     
-    candidate_names = set([])
-    before_values = {}
-    after_values = {}
-    for (k, (before, after)) in stmt.merge.iteritems():
-      t = before.type
-      if t in self.vector_elt_types:
-        candidate_names.add(k)
-        before_values[k] = before
-        after_values[k] = after
-      
-      
-      
-      
-      
-      
-      
-      
-      
-  
+  """
+  Rewrite innermost loops which step through arrays one element at a time
+  to use SIMD vectors, followed by a scalar loop over the leftover
+  iterations. Handles elementwise loops (like the ones produced from Map)
+  and loops which accumulate with +, *, min or max (like the ones produced
+  from Reduce). Strides are only known after lowering as variables, so
+  loops whose indices depend on them get split on a runtime check that the
+  strides are 1.
+  """
+
+  vector_elt_types = (Int32, Int64, Float32, Float64)
+  elementwise_prims = (prims.add, prims.subtract, prims.multiply,
+                       prims.maximum, prims.minimum)
+  float_prims = (prims.divide,)
+  reduction_prims = (prims.add, prims.multiply, prims.maximum, prims.minimum)
+
+  def pre_apply(self, fn):
+    LoopTransform.pre_apply(self, fn)
+    # arrays reachable from different inputs might still overlap
+    self.input_aliases = set([])
+    for name in fn.arg_names:
+      self.input_aliases.update(self.may_alias.get(name, ()))
+
   def transform_ForLoop(self, stmt):
-    # for now we only vectorize if 
-    # something is being accumulated, 
-    # otherwise you need more sophisticated
-    # cost-base heuristic to avoid lots of 
-    # redundant SIMD packing and unpacking
-    if self.is_simple_block(stmt.body) and len(stmt.merge) > 1:
-      return self.vectorize_loop(stmt)
+    stmt = LoopTransform.transform_ForLoop(self, stmt)
+    if stmt.step.__class__ is not Const or stmt.step.value != 1 or \
+       not self.is_simple_block(stmt.body, allow_branches = False):
+      return stmt
+    try:
+      plan = self.analyze(stmt)
+    except NotVectorizable:
+      return stmt
+    return self.vectorize_loop(plan)
+
+  ###################################
+  #
+  #  Analysis
+  #
+  ###################################
+
+  def kind(self, plan, expr):
+    if expr.__class__ is Const:
+      return INVARIANT
+    elif expr.__class__ is not Var:
+      raise NotVectorizable()
+    name = expr.name
+    if name == plan.loop_var or name in plan.linear:
+      return LINEAR
+    elif name in plan.vectors:
+      return VECTOR
+    elif name in plan.copies:
+      return INVARIANT
+    elif name in plan.stmt.merge:
+      return ACCUMULATOR
+    elif name in plan.reduced:
+      return REDUCED
+    elif name in plan.bound:
+      # assigned later in the loop or by a statement we skipped over
+      raise NotVectorizable()
+    return INVARIANT
+
+  def outer_value(self, plan, expr):
+    if expr.__class__ is Var:
+      return plan.copies.get(expr.name, expr)
+    return expr
+
+  def linear_form(self, plan, expr):
+    if self.kind(plan, expr) is not LINEAR:
+      raise NotVectorizable()
+    if expr.name == plan.loop_var:
+      return (None, one(expr.type))
+    return plan.linear[expr.name]
+
+  def check_elt_type(self, t):
+    if t not in self.vector_elt_types:
+      raise NotVectorizable()
+
+  def memory_access(self, plan, expr):
+    ptr = expr.value
+    if ptr.__class__ is not Var or not isinstance(ptr.type, PtrT) or \
+       self.kind(plan, ptr) is not INVARIANT:
+      raise NotVectorizable()
+    self.check_elt_type(ptr.type.elt_type)
+    ptr = self.outer_value(plan, ptr)
+    return (ptr.name, self.linear_form(plan, expr.index))
+
+  def analyze_linear(self, plan, name, expr):
+    """Index arithmetic: loop_var * coef and base + linear"""
+
+    if len(expr.args) != 2:
+      raise NotVectorizable()
+    x, y = expr.args
+    if self.kind(plan, x) is not LINEAR:
+      x, y = y, x
+    if self.kind(plan, x) is not LINEAR or \
+       self.kind(plan, y) is not INVARIANT:
+      raise NotVectorizable()
+    base, coef = self.linear_form(plan, x)
+    other = self.outer_value(plan, y)
+    if expr.prim == prims.add and base is None:
+      plan.linear[name] = (other, coef)
+    elif expr.prim == prims.multiply and base is None and \
+         coef.__class__ is Const and coef.value == 1:
+      plan.linear[name] = (None, other)
+    else:
+      raise NotVectorizable()
+
+  def analyze_reduction(self, plan, name, expr):
+    if len(expr.args) != 2 or expr.prim not in self.reduction_prims:
+      raise NotVectorizable()
+    acc, value = expr.args
+    if self.kind(plan, acc) is not ACCUMULATOR:
+      acc, value = value, acc
+    if self.kind(plan, acc) is not ACCUMULATOR or \
+       self.kind(plan, value) is not VECTOR or \
+       acc.name in plan.reductions:
+      raise NotVectorizable()
+    self.check_elt_type(expr.type)
+    plan.reductions[acc.name] = (expr.prim, value, name)
+    plan.reduced[name] = acc.name
+
+  def analyze_elementwise(self, plan, name, expr):
+    t = expr.type
+    self.check_elt_type(t)
+    if expr.prim not in self.elementwise_prims and \
+       (expr.prim not in self.float_prims or not isinstance(t, FloatT)):
+      raise NotVectorizable()
+    for arg in expr.args:
+      if arg.type != t or self.kind(plan, arg) not in (VECTOR, INVARIANT):
+        raise NotVectorizable()
+    plan.vectors[name] = t
+
+  def analyze_assign(self, plan, stmt):
+    lhs, rhs = stmt.lhs, stmt.rhs
+    if lhs.__class__ is Index:
+      access = self.memory_access(plan, lhs)
+      if rhs.type != lhs.value.type.elt_type or \
+         self.kind(plan, rhs) not in (VECTOR, INVARIANT):
+        raise NotVectorizable()
+      plan.stores.append(access)
+      return
+    elif lhs.__class__ is not Var:
+      raise NotVectorizable()
+
+    name = lhs.name
+    if rhs.__class__ in (Var, Const):
+      kind = self.kind(plan, rhs)
+      if kind is INVARIANT:
+        plan.copies[name] = self.outer_value(plan, rhs)
+      elif kind is LINEAR:
+        plan.linear[name] = self.linear_form(plan, rhs)
+      elif kind is VECTOR:
+        plan.vectors[name] = plan.vectors[rhs.name]
+      elif kind is REDUCED:
+        plan.reduced[name] = plan.reduced[rhs.name]
+      else:
+        raise NotVectorizable()
+    elif rhs.__class__ is Index:
+      plan.loads.append(self.memory_access(plan, rhs))
+      plan.vectors[name] = rhs.type
+    elif rhs.__class__ is PrimCall:
+      kinds = [self.kind(plan, arg) for arg in rhs.args]
+      if ACCUMULATOR in kinds:
+        self.analyze_reduction(plan, name, rhs)
+      elif VECTOR in kinds:
+        self.analyze_elementwise(plan, name, rhs)
+      elif LINEAR in kinds:
+        self.analyze_linear(plan, name, rhs)
+      else:
+        # invariant computations should have been hoisted by LICM
+        raise NotVectorizable()
     else:
-      return stmt 
-      
\ No newline at end of file
+      raise NotVectorizable()
+
+  def may_overlap(self, x, y):
+    return y in self.may_alias.get(x, ()) or \
+           x in self.may_alias.get(y, ()) or \
+           (x in self.input_aliases and y in self.input_aliases)
+
+  def check_dependences(self, plan):
+    """
+    Lanes of a vector read and write several iterations at once, so
+    a loop can only be vectorized if no iteration reads or writes
+    memory which another one writes
+    """
+
+    for (i, (ptr, index)) in enumerate(plan.stores):
+      for (other_ptr, _) in plan.stores[i+1:]:
+        if other_ptr == ptr or self.may_overlap(ptr, other_ptr):
+          raise NotVectorizable()
+      for (load_ptr, load_index) in plan.loads:
+        if load_ptr == ptr:
+          if load_index != index:
+            raise NotVectorizable()
+        elif self.may_overlap(ptr, load_ptr):
+          raise NotVectorizable()
+
+  def analyze(self, stmt):
+    plan = LoopPlan(stmt)
+    for (name, (init, _)) in stmt.merge.iteritems():
+      self.check_elt_type(init.type)
+      if init.__class__ not in (Var, Const):
+        raise NotVectorizable()
+
+    for body_stmt in stmt.body:
+      if body_stmt.__class__ is Comment:
+        continue
+      elif body_stmt.__class__ is not Assign:
+        raise NotVectorizable()
+      self.analyze_assign(plan, body_stmt)
+
+    # every value carried between iterations has to be a reduction
+    for (name, (_, update)) in stmt.merge.iteritems():
+      if name not in plan.reductions or update.__class__ is not Var or \
+         plan.reduced.get(update.name) != name:
+        raise NotVectorizable()
+    if len(plan.stores) == 0 and len(plan.reductions) == 0:
+      raise NotVectorizable()
+    self.check_dependences(plan)
+
+    elt_types = plan.vectors.values()
+    if len(elt_types) == 0:
+      raise NotVectorizable()
+    plan.width = config.opt_vector_bytes / \
+                 max(t.nbytes for t in elt_types)
+    if plan.width < 2:
+      raise NotVectorizable()
+
+    for (_, (_, coef)) in plan.loads + plan.stores:
+      if coef.__class__ is Const:
+        if coef.value != 1:
+          raise NotVectorizable()
+      elif coef not in plan.unit_checks:
+        plan.unit_checks.append(coef)
+    return plan
+
+  ###################################
+  #
+  #  Code generation
+  #
+  ###################################
+
+  def splat(self, expr, t, width, splats):
+    """
+    Vector filled with an outer value, the assignments of all the splats
+    get inserted before the vector loop
+    """
+
+    key = (expr, t)
+    if key not in splats:
+      vec_t = vector_type(t, width)
+      splats[key] = (self.fresh_var(vec_t, "splat"),
+                     VectorSplat(expr, type = vec_t))
+    return splats[key][0]
+
+  def vector_index(self, plan, linear_index, loop_var):
+    # the vector loop only runs when every coefficient is 1
+    base, _ = linear_index
+    if base is None:
+      return loop_var
+    return self.assign_temp(self.add(base, loop_var), "vec_offset")
+
+  def vector_loop_body(self, plan, loop_var, acc_vars, splats):
+    """
+    Vector versions of the loop's statements, returns the vectors which
+    get merged into each accumulator at the end of an iteration
+    """
+
+    width = plan.width
+    vec_values = {}
+    acc_updates = {}
+
+    def vector_value(expr):
+      if expr.__class__ is Var and expr.name in vec_values:
+        return vec_values[expr.name]
+      return self.splat(self.outer_value(plan, expr), expr.type,
+                        width, splats)
+
+    for stmt in plan.stmt.body:
+      if stmt.__class__ is not Assign:
+        continue
+      lhs, rhs = stmt.lhs, stmt.rhs
+      if lhs.__class__ is Index:
+        vec_t = vector_type(lhs.value.type.elt_type, width)
+        idx = self.vector_index(plan, self.linear_form(plan, lhs.index),
+                                loop_var)
+        ptr = self.outer_value(plan, lhs.value)
+        self.assign(Index(ptr, idx, type = vec_t), vector_value(rhs))
+      elif lhs.name in plan.vectors:
+        if rhs.__class__ is Var:
+          vec_values[lhs.name] = vec_values[rhs.name]
+          continue
+        vec_t = vector_type(plan.vectors[lhs.name], width)
+        if rhs.__class__ is Index:
+          idx = self.vector_index(plan, self.linear_form(plan, rhs.index),
+                                  loop_var)
+          vec_rhs = Index(self.outer_value(plan, rhs.value), idx,
+                          type = vec_t)
+        else:
+          vec_args = [vector_value(arg) for arg in rhs.args]
+          vec_rhs = PrimCall(rhs.prim, vec_args, type = vec_t)
+        vec_values[lhs.name] = self.assign_temp(vec_rhs, lhs.name)
+      elif lhs.name in plan.reduced:
+        acc_name = plan.reduced[lhs.name]
+        prim, value, update = plan.reductions[acc_name]
+        if update != lhs.name:
+          # copy of the updated accumulator
+          continue
+        acc_var = acc_vars[acc_name]
+        acc_updates[acc_name] = \
+            self.assign_temp(PrimCall(prim, [acc_var, vec_values[value.name]],
+                                      type = acc_var.type), acc_name)
+    return acc_updates
+
+  def vector_loop(self, plan):
+    """
+    Emit a loop over as many whole vectors as fit in the iteration range,
+    returns where the scalar loop should pick up and the value of each
+    accumulator so far
+    """
+
+    stmt = plan.stmt
+    width = plan.width
+    idx_t = stmt.var.type
+    vec_step = const_int(width, idx_t)
+    n_iters = self.prim(prims.maximum,
+                        [self.sub(stmt.stop, stmt.start), zero(idx_t)],
+                        "n_iters")
+    vec_stop = self.assign_temp(
+        self.add(stmt.start, self.mul(self.div(n_iters, vec_step), vec_step)),
+        "vec_stop")
+
+    splats = {}
+    acc_vars = {}
+    merge = {}
+    for (acc_name, (prim, _, _)) in plan.reductions.iteritems():
+      init = stmt.merge[acc_name][0]
+      t = init.type
+      if prim == prims.add:
+        identity = zero(t)
+      elif prim == prims.multiply:
+        identity = one(t)
+      else:
+        identity = init
+      acc_var = self.fresh_var(vector_type(t, width), acc_name)
+      acc_vars[acc_name] = acc_var
+      merge[acc_var.name] = (self.splat(identity, t, width, splats), None)
+
+    loop_var = self.fresh_var(idx_t, "vec_" + stmt.var.name)
+    self.blocks.push()
+    acc_updates = self.vector_loop_body(plan, loop_var, acc_vars, splats)
+    body = self.blocks.pop()
+    for (acc_name, acc_var) in acc_vars.iteritems():
+      merge[acc_var.name] = (merge[acc_var.name][0], acc_updates[acc_name])
+    for (splat_var, splat_expr) in splats.itervalues():
+      self.assign(splat_var, splat_expr)
+    self.insert_stmt(ForLoop(loop_var, stmt.start, vec_stop, vec_step,
+                             body, merge))
+
+    partial_results = {}
+    for (acc_name, acc_var) in acc_vars.iteritems():
+      prim = plan.reductions[acc_name][0]
+      init = stmt.merge[acc_name][0]
+      lanes = self.assign_temp(VectorReduce(prim, acc_var, type = init.type),
+                               acc_name + "_lanes")
+      partial_results[acc_name] = \
+          self.assign_temp(PrimCall(prim, [init, lanes], type = init.type),
+                           acc_name + "_partial")
+    return vec_stop, partial_results
+
+  def remainder_loop(self, loop, vec_stop, partial_results, rename = None):
+    """Scalar iterations past the last whole vector"""
+
+    loop.start = vec_stop
+    for (acc_name, partial) in partial_results.iteritems():
+      new_name = rename[acc_name].name if rename else acc_name
+      loop.merge[new_name] = (partial, loop.merge[new_name][1])
+    return loop
+
+  def vectorize_loop(self, plan):
+    stmt = plan.stmt
+    if len(plan.unit_checks) == 0:
+      vec_stop, partial_results = self.vector_loop(plan)
+      return self.remainder_loop(stmt, vec_stop, partial_results)
+
+    cond = None
+    for coef in plan.unit_checks:
+      is_unit = self.eq(coef, one(coef.type))
+      cond = is_unit if cond is None else \
+             self.prim(prims.logical_and, [cond, is_unit])
+    cond = self.assign_temp(cond, "unit_strides")
+
+    vector_cloner = CloneStmt(self.type_env)
+    scalar_cloner = CloneStmt(self.type_env)
+    remainder = vector_cloner.transform_ForLoop(stmt)
+    scalar_loop = scalar_cloner.transform_ForLoop(stmt)
+
+    self.blocks.push()
+    vec_stop, partial_results = self.vector_loop(plan)
+    self.insert_stmt(self.remainder_loop(remainder, vec_stop, partial_results,
+                                         vector_cloner.rename_dict))
+    vector_block = self.blocks.pop()
+
+    merge = {}
+    for acc_name in stmt.merge:
+      merge[acc_name] = (vector_cloner.rename_dict[acc_name],
+                         scalar_cloner.rename_dict[acc_name])
+    return If(cond, vector_block, [scalar_loop], merge)
@@ -61,7 +61,7 @@ class Verify(SyntaxVisitor):
     for arg in expr.args:
       assert arg.type is not None, \
           "Expected type annotation for %s" % (arg, )
-      assert isinstance(arg.type, core_types.ScalarT), \
+      assert isinstance(arg.type, (core_types.ScalarT, core_types.VectorT)), \
           "Can't call primitive %s with argument %s of non-scalar type %s" % \
           (expr.prim, arg, arg.type)
 
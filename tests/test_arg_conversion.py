@@ -0,0 +1,40 @@
+import numpy as np
+
+from parakeet import jit, run_function, type_conv
+from testing_helpers import eq, run_local_tests
+
+@jit
+def add(x, y):
+  return x + y
+
+def test_reused_structs():
+  # same types every call, so every call refills the same structs
+  x = np.arange(12).reshape((3,4))
+  y = np.ones((3,4), dtype = 'int64')
+  assert eq(add(x, y), x + y)
+  assert eq(add(x.T, y.T), x.T + y.T)
+  assert eq(add(x[::2], y[1:]), x[::2] + y[1:])
+  assert eq(add(x, y), x + y)
+
+def test_converter_fields():
+  x = np.arange(24, dtype = 'float32').reshape((2,3,4))[:, ::2, 1:]
+  t = type_conv.typeof(x)
+  struct = run_function.input_converter(t)(x)._obj
+  fresh = t.from_python(x)
+  for s in (struct, fresh):
+    assert s.size == x.size
+    assert t.shape_t.to_python(s.shape.contents) == x.shape
+    strides = tuple(stride * 4 for stride in t.strides_t.to_python(s.strides.contents))
+    assert strides == x.strides
+
+@jit
+def reverse(x):
+  return x[::-1]
+
+def test_negative_strides():
+  x = np.arange(10)
+  assert eq(reverse(x), x[::-1])
+  assert eq(reverse(reverse(x)), x)
+
+if __name__ == '__main__':
+  run_local_tests()
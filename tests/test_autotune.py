@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import parakeet
+
+from parakeet import autotune, compile_cache, compile_profiler, config
+from testing_helpers import eq, run_local_tests, with_config
+
+def scaled_sum(x, alpha):
+  total = 0.0
+  for i in range(len(x)):
+    total = total + x[i] * alpha
+  return total
+
+def with_tuning_db(test):
+  def wrapped():
+    directory = tempfile.mkdtemp()
+    try:
+      with with_config(autotune_db = os.path.join(directory, "tuning.db")):
+        test()
+    finally:
+      shutil.rmtree(directory)
+  wrapped.__name__ = test.__name__
+  return wrapped
+
+# two candidates are enough to exercise the search
+small_space = [[{'opt_loop_unrolling' : True, 'opt_unroll_factor' : 2}]]
+
+def test_settings_restored():
+  old_value = config.opt_unroll_factor
+  with autotune.Settings({'opt_unroll_factor' : old_value + 3}):
+    assert config.opt_unroll_factor == old_value + 3
+  assert config.opt_unroll_factor == old_value
+
+@with_tuning_db
+def test_tune_records_settings():
+  x = np.arange(100, dtype = 'float64')
+  settings = autotune.tune_space(scaled_sum, (x, 2.0), {}, small_space)
+  assert settings in ({}, small_space[0][0]), settings
+  assert autotune.recorded_settings(scaled_sum, (x, 2.0)) == settings
+  # the database persists across processes
+  assert len(autotune.load_database(config.autotune_db)) == 1
+  assert eq(parakeet.run(scaled_sum, x, 2.0), np.sum(x) * 2.0)
+
+@with_tuning_db
+def test_distinct_signatures():
+  x = np.arange(100, dtype = 'float64')
+  autotune.tune_space(scaled_sum, (x, 2.0), {}, small_space)
+  assert autotune.tuning_key(scaled_sum, (x, 2.0), {}) is not None
+  assert autotune.recorded_settings(scaled_sum, (x.astype('int32'), 2)) == {}
+
+@with_tuning_db
+def test_clear():
+  x = np.arange(10, dtype = 'float64')
+  autotune.tune_space(scaled_sum, (x, 2.0), {}, small_space)
+  assert autotune.clear() == 1
+  assert autotune.recorded_settings(scaled_sum, (x, 2.0)) == {}
+
+def unrolled_size(x, unroll_factor):
+  """
+  Size of scaled_sum after loop unrolling, when compiled with a recorded
+  unroll factor, or None if the loop unrolling didn't run
+  """
+
+  key = autotune.tuning_key(scaled_sum, (x, 2.0), {})
+  autotune.record(key, {'python_name' : 'scaled_sum',
+                        'settings' : {'opt_loop_unrolling' : True,
+                                      'opt_unroll_factor' : unroll_factor},
+                        'time' : 1.0, 'default_time' : 1.0, 'created' : 0})
+  compile_cache.clear()
+  with compile_profiler.profile() as prof:
+    assert eq(parakeet.run(scaled_sum, x, 2.0), np.sum(x) * 2.0)
+  sizes = [record.size_after for record in prof.records()
+           if record.kind == 'transform' and record.name == 'LoopUnrolling']
+  return max(sizes) if sizes else None
+
+@with_tuning_db
+def test_recorded_settings_used():
+  old_factor = config.opt_unroll_factor
+  # unrolling by 3 gives a remainder loop for 10 elements
+  x = np.arange(10, dtype = 'float64')
+  size_by_2 = unrolled_size(x, 2)
+  size_by_3 = unrolled_size(x, 3)
+  assert size_by_2 is not None, "Recorded opt_loop_unrolling wasn't used"
+  # three copies of the loop body rather than two
+  assert size_by_3 > size_by_2, (size_by_2, size_by_3)
+  # only the compilation saw the recorded settings
+  assert config.opt_loop_unrolling == False
+  assert config.opt_unroll_factor == old_factor
+
+if __name__ == '__main__':
+  run_local_tests()
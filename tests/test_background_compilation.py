@@ -0,0 +1,61 @@
+import gc
+import numpy as np
+import weakref
+
+from parakeet import jit
+from testing_helpers import eq, run_local_tests, with_config
+
+@jit
+def scale_and_shift(x, a, b):
+  return x * a + b
+
+@with_config(background_compilation = True)
+def test_interpreted_until_ready():
+  x = np.arange(10.0)
+  expected = x * 3.0 + 1.0
+  # first call may run through the interpreter
+  assert eq(scale_and_shift(x, 3.0, 1.0), expected)
+  future = scale_and_shift.compile_async(x, 3.0, 1.0)
+  assert future.wait(timeout = 60)
+  assert future.get() is not None
+  assert eq(scale_and_shift(x, 3.0, 1.0), expected)
+  assert len(scale_and_shift.dispatch_table.entries) >= 1
+
+@jit
+def add_rows(x):
+  return x + x[0]
+
+def test_prewarm():
+  x = np.arange(12).reshape(3,4)
+  future = add_rows.compile_async(x)
+  future.wait()
+  assert future.ready()
+  n_entries = len(add_rows.dispatch_table.entries)
+  assert eq(add_rows(x), x + x[0])
+  # the call used the specialization compiled in the background
+  assert len(add_rows.dispatch_table.entries) == n_entries
+
+@with_config(background_compilation = True)
+def test_output_arg():
+  x = np.arange(5.0)
+  out = np.zeros_like(x)
+  result = scale_and_shift(x, 2.0, 0.5, out = out)
+  assert result is out
+  assert eq(out, x * 2.0 + 0.5)
+
+@jit
+def negate(x):
+  return -x
+
+def test_releases_args():
+  x = np.arange(7.0)
+  ref = weakref.ref(x)
+  future = negate.compile_async(x)
+  assert future.wait(timeout = 60)
+  del x
+  gc.collect()
+  # the pending compilation doesn't keep the first call's arguments alive
+  assert ref() is None
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,107 @@
+import numpy as np
+
+import parakeet
+
+from parakeet import blas, compile_cache
+from parakeet.pipeline import loopify
+from parakeet.syntax_visitor import SyntaxVisitor
+from testing_helpers import expect, run_local_tests, with_config
+
+class FindBlasCalls(SyntaxVisitor):
+  def __init__(self):
+    self.names = []
+
+  def visit_BlasCall(self, expr):
+    self.names.append(expr.name)
+    SyntaxVisitor.visit_BlasCall(self, expr)
+
+def blas_calls(fn, args):
+  compile_cache.clear()
+  loopy = loopify.apply(parakeet.typed_repr(fn, args))
+  finder = FindBlasCalls()
+  finder.visit_fn(loopy)
+  return finder.names
+
+# call BLAS even for the tiny inputs below
+with_blas = with_config(opt_blas = True, opt_blas_min_work = 0)
+
+def dot(x, y):
+  return parakeet.sum(x * y)
+
+def matmult(X, Y):
+  return parakeet.allpairs(dot, X, Y)
+
+def nested_matmult(X, Y):
+  return parakeet.each(lambda x: parakeet.each(lambda y: dot(x, y), Y), X)
+
+def matvec(X, v):
+  return parakeet.each(lambda x: dot(x, v), X)
+
+# integer values keep float32 results exact whatever
+# order BLAS adds them up in
+def rand(dtype, *shape):
+  return np.random.randint(-5, 5, shape).astype(dtype)
+
+@with_blas
+def test_matmult():
+  for dtype in ('float32', 'float64'):
+    X = rand(dtype, 13, 7)
+    Y = rand(dtype, 9, 7)
+    expect(matmult, [X, Y], np.dot(X, Y.T))
+    expect(nested_matmult, [X, Y], np.dot(X, Y.T))
+
+@with_blas
+def test_matvec():
+  for dtype in ('float32', 'float64'):
+    X = rand(dtype, 13, 7)
+    v = rand(dtype, 7)
+    expect(matvec, [X, v], np.dot(X, v))
+    expect(matvec, [X, v[::-1]], np.dot(X, v[::-1]))
+
+@with_blas
+def test_dot():
+  for dtype in ('float32', 'float64'):
+    x = rand(dtype, 101)
+    y = rand(dtype, 101)
+    expect(dot, [x, y], np.dot(x, y))
+    expect(dot, [x[::2], y[1::2]], np.dot(x[::2], y[1::2]))
+
+@with_blas
+def test_strided_fallback():
+  X = rand('float64', 7, 13)
+  Y = rand('float64', 9, 7)
+  # columns of a transpose don't have unit stride
+  expect(matmult, [X.T, Y], np.dot(X.T, Y.T))
+  expect(matvec, [X.T, Y[0]], np.dot(X.T, Y[0]))
+  x = rand('float64', 20)
+  expect(dot, [x[::-1], x], np.dot(x[::-1], x))
+
+@with_blas
+def test_empty():
+  X = rand('float64', 0, 7)
+  Y = rand('float64', 9, 7)
+  expect(matmult, [X, Y], np.dot(X, Y.T))
+  expect(matvec, [X, Y[0]], np.dot(X, Y[0]))
+
+@with_blas
+def test_int_fallback():
+  X = rand('int64', 5, 4)
+  Y = rand('int64', 6, 4)
+  expect(matmult, [X, Y], np.dot(X, Y.T))
+  assert blas_calls(matmult, [X, Y]) == []
+
+@with_blas
+def test_calls_blas():
+  if not blas.available('dgemm'):
+    return
+  X = rand('float64', 4, 3)
+  # the fallbacks for strided inputs might still call dot
+  assert 'dgemm' in blas_calls(matmult, [X, X])
+  assert 'dgemm' in blas_calls(nested_matmult, [X, X])
+  assert 'dgemv' in blas_calls(matvec, [X, X[0]])
+  assert blas_calls(dot, [X[0], X[1]]) == ['ddot']
+  with with_config(opt_blas = False):
+    assert blas_calls(matmult, [X, X]) == []
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,62 @@
+import numpy as np
+
+from parakeet import compile_cache, jit, llvm_backend
+from parakeet.compile_cache import LRUCache
+from testing_helpers import eq, run_local_tests, with_config
+
+def test_lru_order():
+  evicted = []
+  cache = LRUCache("test", max_size = 2,
+                   on_evict = lambda k, v: evicted.append(k))
+  cache['a'] = 1
+  cache['b'] = 2
+  assert cache.get('a') == 1
+  cache['c'] = 3
+  # 'b' was the least recently used
+  assert evicted == ['b']
+  assert 'a' in cache and 'c' in cache and 'b' not in cache
+  assert cache.get('b') is None
+  assert (cache.hits, cache.misses, cache.evictions) == (1, 1, 1)
+
+def test_stats():
+  cache = LRUCache("test_stats")
+  cache['x'] = 1
+  cache.get('x')
+  cache.get('y')
+  counts = compile_cache.stats()['test_stats']
+  assert counts['hits'] >= 1 and counts['misses'] >= 1
+  assert counts['size'] >= 1
+
+@jit
+def add_one(x):
+  return x + 1
+
+@with_config(max_cache_entries = 2)
+def test_recompile_after_eviction():
+  # more specializations than fit in the caches
+  for dtype in ('int32', 'int64', 'float32', 'float64'):
+    x = np.arange(5, dtype = dtype)
+    assert eq(add_one(x), x + 1)
+  assert compile_cache.stats()['llvm']['evictions'] > 0
+  # evicted specializations still run correctly
+  for dtype in ('int32', 'int64', 'float32', 'float64'):
+    x = np.arange(5, dtype = dtype)
+    assert eq(add_one(x), x + 1)
+
+@jit
+def sqrt_plus_one(x):
+  return add_one(np.sqrt(x))
+
+def test_module_per_function():
+  x = np.arange(5.0)
+  assert eq(sqrt_plus_one(x), np.sqrt(x) + 1)
+  modules = {}
+  for ((llvm_fn, _, _), handle) in llvm_backend.compiled_functions.itervalues():
+    module = handle.llvm_context.module
+    assert module.get_function_named(llvm_fn.name) is not None
+    modules[llvm_fn.name] = module
+  # no two top-level functions share a module
+  assert len(set(map(str, modules.values()))) == len(modules)
+
+if __name__ == '__main__':
+  run_local_tests()
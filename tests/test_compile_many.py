@@ -0,0 +1,47 @@
+import numpy as np
+
+from parakeet import compile_many, jit
+from parakeet.array_type import make_array_type
+from parakeet.core_types import Float64, Int64
+from testing_helpers import eq, run_local_tests
+
+float64_vec = make_array_type(Float64, 1)
+int64_vec = make_array_type(Int64, 1)
+
+@jit
+def axpy(a, x, y):
+  return a * x + y
+
+@jit
+def norm1(x):
+  return sum(abs(x))
+
+def sub1(x):
+  return x - 1
+
+def test_compile_many():
+  jobs = [(axpy, (Float64, float64_vec, float64_vec)),
+          (axpy, (Int64, int64_vec, int64_vec)),
+          (norm1, (float64_vec,)),
+          (sub1, (Int64,))]
+  compiled = compile_many(jobs, processes = 2)
+  assert len(compiled) == len(jobs)
+  assert len(axpy.dispatch_table.entries) == 2
+  assert len(norm1.dispatch_table.entries) == 1
+  x = np.arange(5.0)
+  assert eq(axpy(2.0, x, x), 3 * x)
+  i = np.arange(5)
+  assert eq(axpy(2, i, i), 3 * i)
+  assert norm1(-x) == 10.0
+  # calls matched the entries linked in from the workers
+  assert len(axpy.dispatch_table.entries) == 2
+  assert len(norm1.dispatch_table.entries) == 1
+  assert compiled[3].parakeet_fn.input_types[-1] == Int64
+
+def test_serial():
+  compiled = compile_many([(norm1, (int64_vec,))], processes = 1)
+  assert len(compiled) == 1
+  assert norm1(np.arange(-3, 0)) == 6
+
+if __name__ == '__main__':
+  run_local_tests()
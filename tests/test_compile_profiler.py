@@ -0,0 +1,66 @@
+import json
+import numpy as np
+import threading
+
+from parakeet import compile_profiler, jit
+from testing_helpers import eq, run_local_tests
+
+@jit
+def saxpy(a, x, y):
+  return a * x + y
+
+def test_profile_stages():
+  x = np.arange(10.0)
+  y = np.ones(10)
+  with compile_profiler.profile() as prof:
+    assert eq(saxpy(2.0, x, y), 2.0 * x + y)
+  kinds = set(record.kind for record in prof.records())
+  for kind in ('specialize_and_compile', 'specialize', 'lowering', 'phase',
+               'transform', 'llvm_codegen', 'llvm_optimize'):
+    assert kind in kinds, "Missing %s in %s" % (kind, kinds)
+  assert prof.root.time > 0
+  report = json.loads(prof.to_json())
+  assert report['version'] == 1
+  assert len(report['stages']) > 0
+  assert 'specialize_and_compile:saxpy' in report['summary']
+
+@jit
+def count_positive(x):
+  return sum(x > 0)
+
+def test_cache_hits():
+  x = np.arange(-5, 5)
+  count_positive(x)
+  # same types but a new stride pattern, so only some stages are cached
+  with compile_profiler.profile() as prof:
+    count_positive(x[::2])
+  hits = [record for record in prof.records() if record.cache_hit]
+  assert len(hits) > 0
+
+def test_llvm_passes():
+  with compile_profiler.profile(llvm_passes = True) as prof:
+    assert saxpy(1, 2, 3) == 5
+  names = set(record.name for record in prof.records()
+              if record.kind == 'llvm_pass')
+  assert 'mem2reg' in names
+
+def test_inactive():
+  assert compile_profiler.active() is None
+  assert saxpy(1.0, 2.0, 3.0) == 5.0
+
+@jit
+def triple(x):
+  return x * 3
+
+def test_other_threads():
+  x = np.arange(7.0)
+  with compile_profiler.profile() as prof:
+    # compiled on a thread which isn't profiling
+    other = threading.Thread(target = lambda: triple(x))
+    other.start()
+    other.join()
+  assert len(list(prof.records())) == 0
+  assert compile_profiler.active() is None
+
+if __name__ == '__main__':
+  run_local_tests()
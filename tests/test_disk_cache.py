@@ -0,0 +1,56 @@
+import shutil
+import tempfile
+
+import numpy as np
+
+from parakeet import config, disk_cache, run_function
+from testing_helpers import eq, run_local_tests, with_config
+
+def scale_and_shift(x, alpha = 2.0):
+  return x * alpha + 1
+
+def with_cache_dir(test):
+  def wrapped():
+    directory = tempfile.mkdtemp()
+    try:
+      with with_config(disk_cache = True, disk_cache_dir = directory):
+        test()
+    finally:
+      shutil.rmtree(directory)
+  wrapped.__name__ = test.__name__
+  return wrapped
+
+@with_cache_dir
+def test_warm_and_load():
+  x = np.arange(10, dtype = 'float64')
+  disk_cache.warm(scale_and_shift, x)
+  entries = disk_cache.entries()
+  assert len(entries) == 1, "Expected one cache entry, got %s" % (entries,)
+  assert entries[0]['python_name'] == 'scale_and_shift'
+  # forget what this process already linked, forcing a load from disk
+  disk_cache._loaded.clear()
+  assert eq(run_function.run(scale_and_shift, x), x * 2.0 + 1)
+
+@with_cache_dir
+def test_distinct_types_distinct_entries():
+  disk_cache.warm(scale_and_shift, np.arange(10, dtype = 'float64'))
+  disk_cache.warm(scale_and_shift, np.arange(10, dtype = 'int32'))
+  disk_cache.warm(scale_and_shift, 3)
+  assert len(disk_cache.entries()) == 3
+
+@with_cache_dir
+def test_config_invalidates():
+  x = np.arange(10, dtype = 'float64')
+  disk_cache.warm(scale_and_shift, x)
+  with with_config(opt_licm = not config.opt_licm):
+    disk_cache.warm(scale_and_shift, x)
+  assert len(disk_cache.entries()) == 2
+
+@with_cache_dir
+def test_clear():
+  disk_cache.warm(scale_and_shift, 3)
+  assert disk_cache.clear() == 1
+  assert len(disk_cache.entries()) == 0
+
+if __name__ == '__main__':
+  run_local_tests()
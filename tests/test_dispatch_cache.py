@@ -0,0 +1,56 @@
+import numpy as np
+
+from parakeet import jit
+from testing_helpers import eq, run_local_tests
+
+@jit
+def add_defaults(x, y = 2):
+  return x + y
+
+def test_repeated_scalar_calls():
+  assert add_defaults(1, 2) == 3
+  n_entries = len(add_defaults.dispatch_table.entries)
+  assert add_defaults(3, 4) == 7
+  assert len(add_defaults.dispatch_table.entries) == n_entries
+
+def test_new_types_add_entries():
+  add_defaults(1, 2)
+  n_entries = len(add_defaults.dispatch_table.entries)
+  assert add_defaults(1.0, 2.5) == 3.5
+  assert len(add_defaults.dispatch_table.entries) == n_entries + 1
+
+def test_keywords_and_defaults():
+  assert add_defaults(1) == 3
+  assert add_defaults(1) == 3
+  assert add_defaults(y = 10, x = 1) == 11
+  assert add_defaults(y = 10, x = 1) == 11
+  assert add_defaults(1, y = 10) == 11
+
+@jit
+def first_col(x):
+  return x[:, 0]
+
+def test_strides_in_signature():
+  x = np.arange(12).reshape((3,4))
+  assert eq(first_col(x), x[:, 0])
+  n_entries = len(first_col.dispatch_table.entries)
+  # transposed array has a different stride pattern
+  assert eq(first_col(x.T), x.T[:, 0])
+  assert len(first_col.dispatch_table.entries) == n_entries + 1
+  assert eq(first_col(x.T), x.T[:, 0])
+  assert len(first_col.dispatch_table.entries) == n_entries + 1
+
+def call_add_defaults(x):
+  return add_defaults(x, 10)
+
+@jit
+def add_closure_arg(x):
+  return call_add_defaults(x)
+
+def test_nested_jit_call():
+  assert add_closure_arg(1) == 11
+  assert add_closure_arg(2) == 12
+  assert add_closure_arg(2.0) == 12.0
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -1,8 +1,10 @@
 import parakeet 
 
-from parakeet.core_types import Int64 
+from parakeet import escape_analysis as escape_analysis_module
+from parakeet.core_types import Int64, ptr_type
 from parakeet.escape_analysis import EscapeAnalysis
 from parakeet.syntax import Tuple, Var, TypedFn, Assign, Return, TupleProj 
+from parakeet.syntax import Alloc, ForLoop
 from parakeet.syntax_helpers import zero_i64, one_i64   
 from testing_helpers import run_local_tests
 from parakeet.tuple_type import make_tuple_type
@@ -47,5 +49,50 @@ def test_escape_analysis():
   assert "b" in escape_analysis.may_escape, "Nested tuples also escape!"
   assert "e" not in escape_analysis.may_escape
   
+ptr_t = ptr_type(Int64)
+n_var = Var("n", type = Int64)
+i_var = Var("i", type = Int64)
+def alloc():
+  return Alloc(elt_type = Int64, count = n_var, type = ptr_t)
+
+# function(n):
+#   tmp = alloc[n]
+#   result = alloc[n]
+#   for i in range(0, n):
+#     scratch = alloc[n]
+#     carried_after = alloc[n]
+#     carried = phi(result, carried_after)
+#   return carried
+loop = ForLoop(var = i_var, start = zero_i64, stop = n_var, step = one_i64,
+               body = [
+                 Assign(Var("scratch", type = ptr_t), alloc()),
+                 Assign(Var("carried_after", type = ptr_t), alloc()),
+               ],
+               merge = {"carried" : (Var("result", type = ptr_t),
+                                     Var("carried_after", type = ptr_t))})
+alloc_fn = TypedFn(name = "test_temporaries",
+                   type_env = {"n" : Int64, "i" : Int64,
+                               "tmp" : ptr_t, "result" : ptr_t,
+                               "scratch" : ptr_t, "carried" : ptr_t,
+                               "carried_after" : ptr_t},
+                   input_types = (Int64,),
+                   arg_names = ("n",),
+                   body = [Assign(Var("tmp", type = ptr_t), alloc()),
+                           Assign(Var("result", type = ptr_t), alloc()),
+                           loop,
+                           Return(Var("carried", type = ptr_t))],
+                   return_type = ptr_t)
+
+def test_temporaries():
+  temps = escape_analysis_module.temporaries(alloc_fn)
+  assert temps == set(["tmp", "scratch"]), \
+      "Expected only tmp and scratch to be temporaries, got %s" % temps
+
+def test_loop_temporaries():
+  temps = escape_analysis_module.temporaries(alloc_fn)
+  loop_temps = escape_analysis_module.loop_temporaries(alloc_fn, loop, temps)
+  assert loop_temps == set(["scratch"]), \
+      "Expected only scratch to be freed every iteration, got %s" % loop_temps
+
 if __name__ == '__main__':
   run_local_tests()
@@ -0,0 +1,116 @@
+import numpy as np
+
+import parakeet
+
+from parakeet import compile_cache, syntax
+from parakeet.array_type import ArrayT
+from parakeet.pipeline import high_level_optimizations, loopify
+from parakeet.syntax_visitor import SyntaxVisitor
+from testing_helpers import expect, run_local_tests, with_config
+
+class FindIntermediates(SyntaxVisitor):
+  """Arrays computed by one adverb and consumed by another"""
+
+  def __init__(self):
+    self.adverb_results = set([])
+    self.adverb_args = set([])
+
+  def visit_Assign(self, stmt):
+    if isinstance(stmt.rhs, syntax.Adverb):
+      if stmt.lhs.__class__ is syntax.Var and \
+         isinstance(stmt.lhs.type, ArrayT):
+        self.adverb_results.add(stmt.lhs.name)
+      for arg in getattr(stmt.rhs, 'args', ()):
+        if arg.__class__ is syntax.Var:
+          self.adverb_args.add(arg.name)
+    SyntaxVisitor.visit_Assign(self, stmt)
+
+def intermediates(fn, args):
+  compile_cache.clear()
+  fused = high_level_optimizations.apply(parakeet.typed_repr(fn, args))
+  finder = FindIntermediates()
+  finder.visit_fn(fused)
+  return finder.adverb_results & finder.adverb_args
+
+class CountLoops(SyntaxVisitor):
+  def __init__(self):
+    self.count = 0
+
+  def visit_ForLoop(self, stmt):
+    self.count += 1
+    SyntaxVisitor.visit_ForLoop(self, stmt)
+
+def count_loops(fn, args):
+  compile_cache.clear()
+  loopy = loopify.apply(parakeet.typed_repr(fn, args))
+  counter = CountLoops()
+  counter.visit_fn(loopy)
+  return counter.count
+
+x = np.random.randn(1000)
+
+def two_consumers(x):
+  y = parakeet.each(lambda xi: xi * 2.0 + 1.0, x)
+  total = parakeet.sum(y)
+  shifted = parakeet.each(lambda yi: yi - 3.0, y)
+  return shifted * total
+
+def np_two_consumers(x):
+  y = x * 2.0 + 1.0
+  return (y - 3.0) * np.sum(y)
+
+def test_multiple_consumers():
+  expect(two_consumers, [x], np_two_consumers(x))
+  assert len(intermediates(two_consumers, [x])) == 0
+
+def expensive_consumers(x):
+  y = parakeet.each(lambda xi: (xi / 3.0) / (xi + 7.0), x)
+  total = parakeet.sum(y)
+  shifted = parakeet.each(lambda yi: yi - 3.0, y)
+  return shifted * total
+
+def test_expensive_map_stays():
+  y = (x / 3.0) / (x + 7.0)
+  expect(expensive_consumers, [x], (y - 3.0) * np.sum(y))
+  # computing y twice costs more than storing it
+  assert len(intermediates(expensive_consumers, [x])) == 1
+
+def map_into_scan(x):
+  y = parakeet.each(lambda xi: xi * xi, x)
+  return parakeet.scan(parakeet.add, y)
+
+def test_map_into_scan():
+  expect(map_into_scan, [x], np.cumsum(x * x))
+  assert len(intermediates(map_into_scan, [x])) == 0
+
+def sum_and_shifted_sum(x):
+  return parakeet.sum(x) + parakeet.sum(x + 1.0)
+
+def test_fused_reduction_loops():
+  expect(sum_and_shifted_sum, [x], np.sum(x) + np.sum(x + 1.0))
+  fused = count_loops(sum_and_shifted_sum, [x])
+  with with_config(opt_loop_fusion = False):
+    assert count_loops(sum_and_shifted_sum, [x]) > fused
+
+def two_maps(x):
+  a = parakeet.each(lambda xi: xi + 1.0, x)
+  b = parakeet.each(lambda xi: xi * 2.0, x)
+  return a, b
+
+def test_horizontal_maps():
+  a, b = parakeet.jit(two_maps)(x)
+  assert np.allclose(a, x + 1.0)
+  assert np.allclose(b, x * 2.0)
+  assert count_loops(two_maps, [x]) == 1
+
+def dependent_maps(x):
+  a = parakeet.each(lambda xi: xi + 1.0, x)
+  # reads the elements of a in the opposite order they get written
+  return parakeet.each(lambda ai, xi: ai * xi, a[::-1], x)
+
+def test_dependent_loops_stay_apart():
+  expect(dependent_maps, [x], (x[::-1] + 1.0) * x)
+  assert count_loops(dependent_maps, [x]) == 2
+
+if __name__ == '__main__':
+  run_local_tests()
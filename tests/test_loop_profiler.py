@@ -0,0 +1,45 @@
+import numpy as np
+
+from parakeet import jit, loop_profiler
+from testing_helpers import eq, run_local_tests, with_config
+
+@jit
+def triangle_sum(n):
+  total = 0
+  for i in range(n):
+    for j in range(i):
+      total += j
+  return total
+
+@jit
+def add_one(x):
+  return x + 1
+
+@with_config(profile_loops = True)
+def test_loop_counts():
+  loop_profiler.reset()
+  assert triangle_sum(10) == sum(sum(range(i)) for i in range(10))
+  loops = [loop for kernel_loops in loop_profiler.stats().values()
+           for loop in kernel_loops if loop['fn'].startswith('triangle_sum')]
+  outer = [loop for loop in loops if loop['depth'] == 0]
+  inner = [loop for loop in loops if loop['depth'] == 1]
+  assert len(outer) == 1 and len(inner) == 1, loops
+  assert outer[0]['entries'] == 1 and outer[0]['iterations'] == 10
+  assert inner[0]['entries'] == 10 and inner[0]['iterations'] == 45
+  assert outer[0]['source'].startswith('for i in')
+  assert outer[0]['cycles'] >= inner[0]['cycles']
+
+# vector loops count one iteration per vector, not per element
+@with_config(profile_loops = True, opt_vectorize = False)
+def test_adverb_loops():
+  loop_profiler.reset()
+  x = np.arange(100.0)
+  assert eq(add_one(x), x + 1)
+  total_iterations = sum(loop['iterations']
+                         for loops in loop_profiler.stats().values()
+                         for loop in loops)
+  assert total_iterations >= 100
+  assert 'iterations' in loop_profiler.report()
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,90 @@
+import numpy as np
+
+import parakeet
+from parakeet import jit
+from testing_helpers import eq, run_local_tests
+
+@jit
+def add_one(x):
+  return x + 1
+
+def test_jit_out():
+  x = np.arange(10.0)
+  out = np.zeros_like(x)
+  result = add_one(x, out = out)
+  assert result is out
+  assert eq(out, x + 1)
+  # second call goes through the dispatch table
+  add_one(x * 2, out = out)
+  assert eq(out, x * 2 + 1)
+
+@jit
+def double_transpose(x):
+  return (x * 2).T
+
+def test_jit_out_copy():
+  x = np.arange(12.0).reshape((3,4))
+  out = np.zeros((4,3))
+  double_transpose(x, out = out)
+  assert eq(out, (x * 2).T)
+
+@jit
+def scale(x, out):
+  return x * out
+
+def test_own_out_param():
+  assert eq(scale(np.arange(3), out = 2), np.arange(3) * 2)
+
+def expect_value_error(fn, *args, **kwargs):
+  try:
+    fn(*args, **kwargs)
+  except ValueError:
+    pass
+  else:
+    assert False, "Expected ValueError"
+
+def test_wrong_output_shape():
+  x = np.arange(1000.0)
+  expect_value_error(add_one, x, out = np.empty(3))
+  expect_value_error(add_one, x, out = np.empty(2000))
+  # a matching output still works, through the dispatch table
+  # entry compiled by the failed calls
+  out = np.zeros_like(x)
+  add_one(x, out = out)
+  assert eq(out, x + 1)
+  expect_value_error(add_one, x, out = np.empty(3))
+
+def test_wrong_map_output_shape():
+  x = np.arange(10)
+  expect_value_error(parakeet.map, lambda xi: xi * 3, x,
+                     out = np.zeros(3, dtype = 'int64'))
+
+def test_map_out():
+  x = np.arange(10)
+  out = np.zeros_like(x)
+  parakeet.map(lambda xi: xi * 3, x, out = out)
+  assert eq(out, x * 3)
+
+def test_imap_out():
+  out = np.zeros((3, 4), dtype = 'int64')
+  parakeet.imap(lambda idx: idx[0] * 10 + idx[1], (3, 4), out = out)
+  expected = np.array([[i * 10 + j for j in xrange(4)] for i in xrange(3)])
+  assert eq(out, expected)
+
+def test_numpy_scalar_shape_out():
+  # the result's shape comes from NumPy integers rather than Python ints
+  out = np.zeros((3, 4), dtype = 'int64')
+  parakeet.imap(lambda idx: idx[0] * 10 + idx[1],
+                (np.int64(3), np.int64(4)), out = out)
+  expected = np.array([[i * 10 + j for j in xrange(4)] for i in xrange(3)])
+  assert eq(out, expected)
+
+def test_allpairs_out():
+  x = np.arange(3)
+  y = np.arange(4)
+  out = np.zeros((3, 4), dtype = 'int64')
+  parakeet.allpairs(lambda xi, yj: xi * yj, x, y, out = out)
+  assert eq(out, np.multiply.outer(x, y))
+
+if __name__ == '__main__':
+  run_local_tests()
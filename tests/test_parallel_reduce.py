@@ -0,0 +1,87 @@
+import numpy as np
+
+import parakeet
+from parakeet import ireduce, jit, reduce
+from parakeet import parallel_adverbs, run_function, type_inference
+from testing_helpers import expect, run_local_tests, with_config
+
+with_parallel = with_config(parallel_outer_adverbs = True, num_threads = 4,
+                            parallel_chunk_size = 7)
+
+def parakeet_sum(x):
+  return reduce(parakeet.add, x)
+
+def parakeet_max(x):
+  return reduce(parakeet.maximum, x)
+
+def sum_with_init(x):
+  return reduce(parakeet.add, x, init = 100)
+
+def sum_of_rows(x):
+  return reduce(lambda a, b: a + b, x, axis = 0)
+
+def difference(x):
+  return reduce(lambda a, b: a - b, x)
+
+def helpers_for(fn, args):
+  untyped, _, arg_types = run_function.prepare_args(fn, args, {})
+  typed = type_inference.specialize(untyped, arg_types)
+  return parallel_adverbs.parallel_helpers(typed)
+
+def test_associative_detection():
+  x = np.arange(10, dtype = 'float64')
+  assert 'combine' in helpers_for(parakeet_sum, [x])
+  assert 'combine' in helpers_for(parakeet_max, [x])
+  assert helpers_for(difference, [x]) is None
+
+@with_parallel
+def test_parallel_sum():
+  x = np.arange(1000, dtype = 'int64')
+  expect(parakeet_sum, [x], np.sum(x))
+  y = np.random.randn(501)
+  expect(parakeet_sum, [y], np.sum(y))
+
+@with_parallel
+def test_parallel_max():
+  x = np.random.randn(333)
+  expect(parakeet_max, [x], np.max(x))
+
+@with_parallel
+def test_parallel_init():
+  x = np.arange(100, dtype = 'int64')
+  expect(sum_with_init, [x], np.sum(x) + 100)
+
+@with_parallel
+def test_parallel_sum_of_rows():
+  x = np.random.randn(50, 3)
+  expect(sum_of_rows, [x], np.sum(x, axis = 0))
+
+@with_parallel
+def test_non_associative_stays_serial():
+  x = np.arange(20, dtype = 'int64')
+  expect(difference, [x], x[0] - np.sum(x[1:]))
+
+def sum_of_squares(n):
+  return ireduce(parakeet.add, n, lambda i: i * i)
+
+@with_parallel
+def test_parallel_ireduce():
+  expect(sum_of_squares, [100], np.sum(np.arange(100) ** 2))
+
+def sum_of_squares_with_init(n):
+  return ireduce(parakeet.add, n, lambda i: i * i, init = 7)
+
+@with_parallel
+def test_parallel_empty():
+  x = np.arange(0, dtype = 'int64')
+  assert run_function.run(sum_with_init, x) == 100
+  assert run_function.run(sum_of_squares_with_init, 0) == 7
+  try:
+    run_function.run(parakeet_sum, x)
+  except ValueError:
+    pass
+  else:
+    assert False, "Expected ValueError for an empty reduction without init"
+
+if __name__ == '__main__':
+  run_local_tests()
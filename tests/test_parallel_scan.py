@@ -0,0 +1,51 @@
+import numpy as np
+
+import parakeet
+from parakeet import scan
+from testing_helpers import expect, run_local_tests, with_config
+
+with_parallel_scan = with_config(parallel_outer_adverbs = True,
+                                 num_threads = 4, parallel_chunk_size = 9,
+                                 parallel_scan_min_iters = 10)
+
+def cumsum(x):
+  return scan(parakeet.add, x, axis = 0)
+
+def cumprod(x):
+  return scan(parakeet.multiply, x, axis = 0)
+
+def running_max(x):
+  return scan(parakeet.maximum, x, axis = 0)
+
+def cumsum_with_init(x):
+  return scan(parakeet.add, x, axis = 0, init = 10)
+
+@with_parallel_scan
+def test_parallel_cumsum():
+  x = np.arange(1000, dtype = 'int64')
+  expect(cumsum, [x], np.cumsum(x))
+  y = np.random.randn(77)
+  expect(cumsum, [y], np.cumsum(y))
+
+@with_parallel_scan
+def test_parallel_cumprod():
+  x = np.ones(100, dtype = 'float64') * 1.01
+  expect(cumprod, [x], np.cumprod(x))
+
+@with_parallel_scan
+def test_parallel_running_max():
+  x = np.random.randn(200)
+  expect(running_max, [x], np.maximum.accumulate(x))
+
+@with_parallel_scan
+def test_parallel_scan_init():
+  x = np.arange(100, dtype = 'int64')
+  expect(cumsum_with_init, [x], np.cumsum(x) + 10)
+
+@with_parallel_scan
+def test_short_scan_stays_serial():
+  x = np.arange(5, dtype = 'int64')
+  expect(cumsum, [x], np.cumsum(x))
+
+if __name__ == '__main__':
+  run_local_tests()
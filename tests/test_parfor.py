@@ -0,0 +1,67 @@
+import numpy as np
+
+import parakeet
+from parakeet import jit, parfor
+from testing_helpers import eq, expect, run_local_tests, with_config
+
+with_parallel = with_config(parallel_outer_adverbs = True, num_threads = 4,
+                            parallel_chunk_size = 3)
+
+def double_into(x, y):
+  def body(i):
+    y[i] = x[i] * 2
+  parfor(x.shape[0], body)
+
+def test_parfor_serial():
+  x = np.arange(100, dtype = 'float64')
+  y = np.zeros_like(x)
+  parakeet.run(double_into, x, y)
+  assert eq(y, x * 2)
+
+@with_parallel
+def test_parfor_parallel():
+  x = np.arange(1000, dtype = 'float64')
+  y = np.zeros_like(x)
+  parakeet.run(double_into, x, y)
+  assert eq(y, x * 2)
+
+def add_rows(x, y):
+  def body(idx):
+    x[idx] = x[idx] + y[idx]
+  parfor(x.shape, body)
+
+@with_parallel
+def test_parfor_2d():
+  x = np.arange(200, dtype = 'int64').reshape((20, 10))
+  y = x.copy()
+  expected = x * 2
+  parakeet.run(add_rows, x, y)
+  assert eq(x, expected)
+
+def add_rows_map(x, y):
+  return parakeet.each(lambda xi, yi: xi + yi, x, y)
+
+@with_parallel
+def test_map_parallel():
+  x = np.random.randn(101, 7)
+  y = np.random.randn(101, 7)
+  expect(add_rows_map, [x, y], x + y)
+
+def scaled_indices(n, k):
+  return parakeet.imap(lambda i: i * k, n)
+
+@with_parallel
+def test_imap_parallel():
+  expect(scaled_indices, [50, 3], np.arange(50) * 3)
+
+def prelude_then_map(x):
+  m = x.shape[0] + 1
+  return parakeet.each(lambda xi: xi * m, x)
+
+@with_parallel
+def test_map_with_prelude():
+  x = np.arange(33, dtype = 'float32')
+  expect(prelude_then_map, [x], x * 34)
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,75 @@
+import numpy as np
+
+from parakeet import run, specialize_and_compile
+from parakeet.clone_function import CloneFunction
+from parakeet.core_types import Int64
+from parakeet.dead_code_elim import DCE
+from parakeet.pipeline_phase import apply_transforms, fingerprint
+from parakeet.transform import Transform
+from testing_helpers import eq, run_local_tests
+
+class CountingTransform(Transform):
+  """Leaves the function alone, only counts how often it ran"""
+
+  count = 0
+
+  def pre_apply(self, fn):
+    CountingTransform.count += 1
+
+def dead_temps(x):
+  a = x + 1
+  b = a * 2
+  c = b - 3
+  return x * 2
+
+def typed_fn():
+  _, typed, _, _ = specialize_and_compile(dead_temps, [1.0])
+  # don't modify the cached specialization
+  return CloneFunction().apply(typed)
+
+def test_skip_repeated_no_op():
+  fn = typed_fn()
+  CountingTransform.count = 0
+  apply_transforms(fn, [CountingTransform, CountingTransform,
+                        CountingTransform])
+  # the later runs saw the same function the first one left unchanged
+  assert CountingTransform.count == 1
+
+class NoOp(Transform):
+  pass
+
+def test_no_cleanup_after_no_op():
+  CountingTransform.count = 0
+  apply_transforms(typed_fn(), [NoOp], cleanup = [CountingTransform])
+  assert CountingTransform.count == 0
+
+def test_cleanup_after_change():
+  CountingTransform.count = 0
+  fn = apply_transforms(typed_fn(), [DCE], cleanup = [CountingTransform])
+  # dead temporaries got removed, so the cleanup ran (once, since
+  # the first round of cleanup left the function unchanged)
+  assert CountingTransform.count == 1
+  assert len(fn.body) < len(typed_fn().body)
+
+def test_fingerprint_tracks_changes():
+  fn = typed_fn()
+  before = fingerprint(fn)
+  assert fingerprint(fn) == before
+  fn.body = fn.body[-1:]
+  assert fingerprint(fn) != before
+
+def test_fingerprint_tracks_types():
+  fn = typed_fn()
+  before = fingerprint(fn)
+  # same statements printed the same way, but with a different type
+  name = fn.arg_names[0]
+  fn.type_env = dict(fn.type_env)
+  fn.type_env[name] = Int64
+  assert fingerprint(fn) != before
+
+def test_results_unchanged():
+  x = np.arange(10.0)
+  assert eq(run(dead_temps, x), x * 2)
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,46 @@
+import numpy as np
+
+from parakeet import jit, precompile
+from parakeet.array_type import make_array_type
+from parakeet.core_types import Float64, Int64
+from testing_helpers import eq, run_local_tests
+
+float64_vec = make_array_type(Float64, 1)
+float64_mat = make_array_type(Float64, 2)
+
+@jit(signatures = [(float64_vec, Float64), (float64_mat, Float64)])
+def scale(x, alpha):
+  return x * alpha
+
+def test_jit_signatures():
+  n_entries = len(scale.dispatch_table.entries)
+  assert n_entries == 2
+  x = np.arange(10.0)
+  assert eq(scale(x, 2.0), x * 2.0)
+  m = np.arange(12.0).reshape(3,4)
+  assert eq(scale(m, 0.5), m * 0.5)
+  # both calls hit the precompiled entries
+  assert len(scale.dispatch_table.entries) == n_entries
+
+@jit
+def total(x):
+  return sum(x)
+
+def test_precompile_values_and_types():
+  example = np.arange(5, dtype = np.int32)
+  compiled = precompile(total, [(example,), (float64_vec,)])
+  assert len(compiled) == 2
+  n_entries = len(total.dispatch_table.entries)
+  assert total(np.arange(7, dtype = np.int32)) == 21
+  assert total(np.arange(4.0)) == 6.0
+  assert len(total.dispatch_table.entries) == n_entries
+
+def count_up(n):
+  return np.arange(n) + 1
+
+def test_precompile_python_fn():
+  compiled = precompile(count_up, [(Int64,)])
+  assert compiled[0].parakeet_fn.input_types[-1] == Int64
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,58 @@
+import numpy as np
+
+from parakeet import serialization, specialize_and_compile
+from parakeet.array_type import make_array_type
+from parakeet.ast_conversion import translate_function_value
+from parakeet.core_types import Float64
+from parakeet.run_function import compile_typed
+from testing_helpers import eq, run_local_tests
+
+def clipped_sum(x, bound = 10.0):
+  total = 0.0
+  for i in range(len(x)):
+    if x[i] < bound:
+      total += x[i]
+  return total
+
+def test_untyped_roundtrip():
+  untyped = translate_function_value(clipped_sum)
+  loaded = serialization.loads(serialization.dumps(untyped))
+  assert loaded is not untyped
+  assert loaded.name != untyped.name
+  assert loaded.args.positional == untyped.args.positional
+  assert len(loaded.body) == len(untyped.body)
+  assert repr(loaded.body) == repr(untyped.body)
+
+def test_typed_roundtrip():
+  x = np.arange(20.0)
+  _, typed, _, _ = specialize_and_compile(clipped_sum, [x, 10.0])
+  loaded = serialization.loads(serialization.dumps(typed))
+  assert loaded.name != typed.name
+  # types are rebuilt through the memoized constructors
+  assert loaded.input_types[0] is make_array_type(Float64, 1)
+  assert loaded.return_type is Float64
+  compiled = compile_typed(loaded)
+  assert eq(compiled(x, 10.0), clipped_sum(x))
+
+def make_adverb_fn(x, y):
+  return np.sum(x * y + 1)
+
+def test_nested_functions():
+  x = np.arange(12.0).reshape(3, 4)
+  _, typed, _, _ = specialize_and_compile(make_adverb_fn, [x, x])
+  loaded = serialization.loads(serialization.dumps(typed))
+  compiled = compile_typed(loaded)
+  assert eq(compiled(x, x), make_adverb_fn(x, x))
+
+def test_version_check():
+  data = serialization.dumps(translate_function_value(clipped_sum))
+  data = data.replace(serialization._magic, "not-parakeet")
+  try:
+    serialization.loads(data)
+  except serialization.IncompatibleFormat:
+    pass
+  else:
+    assert False, "Expected loads to reject foreign data"
+
+if __name__ == '__main__':
+  run_local_tests()
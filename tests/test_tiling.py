@@ -0,0 +1,88 @@
+import numpy as np
+
+import parakeet
+
+from parakeet import compile_cache
+from parakeet.pipeline import loopify
+from parakeet.syntax_visitor import SyntaxVisitor
+from testing_helpers import expect, run_local_tests, with_config
+
+class CountLoops(SyntaxVisitor):
+  def __init__(self):
+    self.count = 0
+
+  def visit_ForLoop(self, stmt):
+    self.count += 1
+    SyntaxVisitor.visit_ForLoop(self, stmt)
+
+def count_loops(fn, args):
+  compile_cache.clear()
+  loopy = loopify.apply(parakeet.typed_repr(fn, args))
+  counter = CountLoops()
+  counter.visit_fn(loopy)
+  return counter.count
+
+def dot(x, y):
+  return parakeet.sum(x * y)
+
+def matmult(X, Y):
+  return parakeet.allpairs(dot, X, Y)
+
+def nested_matmult(X, Y):
+  return parakeet.each(lambda x: parakeet.each(lambda y: dot(x, y), Y), X)
+
+def sqr_dist(x, y):
+  return parakeet.sum((x - y) ** 2)
+
+def dists(X, Y):
+  return parakeet.allpairs(sqr_dist, X, Y)
+
+def np_dists(X, Y):
+  return ((X[:, np.newaxis, :] - Y[np.newaxis, :, :]) ** 2).sum(axis = 2)
+
+tiled = with_config(opt_tiling = True)
+
+X = np.random.randn(13, 7)
+Y = np.random.randn(9, 7)
+
+def check_all():
+  expect(matmult, [X, Y], np.dot(X, Y.T))
+  expect(nested_matmult, [X, Y], np.dot(X, Y.T))
+  expect(dists, [X, Y], np_dists(X, Y))
+  expect(matmult, [X[:1], Y], np.dot(X[:1], Y.T))
+
+@tiled
+def test_cache_heuristic():
+  check_all()
+
+@tiled
+def test_tiles_smaller_than_inputs():
+  with with_config(opt_tile_sizes = (4, 3)):
+    check_all()
+
+@tiled
+def test_single_row_tiles():
+  with with_config(opt_tile_sizes = (1, 1)):
+    check_all()
+
+@tiled
+def test_tiles_larger_than_inputs():
+  with with_config(opt_tile_sizes = (100, 100)):
+    check_all()
+
+@tiled
+def test_int_matrices():
+  A = np.arange(35).reshape(5, 7)
+  B = np.arange(42).reshape(6, 7)
+  with with_config(opt_tile_sizes = (2, 4)):
+    expect(matmult, [A, B], np.dot(A, B.T))
+
+@tiled
+def test_tiled_loops():
+  # loops over the tiles surround the loops within each tile
+  n_tiled = count_loops(matmult, [X, Y])
+  with with_config(opt_tiling = False):
+    assert count_loops(matmult, [X, Y]) < n_tiled
+
+if __name__ == '__main__':
+  run_local_tests()
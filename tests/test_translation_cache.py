@@ -0,0 +1,54 @@
+import numpy as np
+
+from parakeet import compile_profiler, jit, run
+from parakeet.ast_conversion import translate_function_value
+from testing_helpers import eq, run_local_tests
+
+def make_scaler(factor):
+  def scale(x):
+    return x * factor
+  return scale
+
+def test_same_closure_values():
+  f = make_scaler(3)
+  g = make_scaler(3)
+  assert translate_function_value(f) is translate_function_value(g)
+  with compile_profiler.profile() as prof:
+    assert eq(run(make_scaler(3), np.arange(5)), np.arange(5) * 3)
+  # neither parsed nor translated again
+  kinds = set(record.kind for record in prof.records()
+              if not record.cache_hit)
+  assert 'translate' not in kinds, kinds
+
+def test_different_closure_values():
+  f = make_scaler(2.0)
+  g = make_scaler(5.0)
+  assert translate_function_value(f) is not translate_function_value(g)
+  x = np.arange(5.0)
+  assert eq(run(f, x), x * 2.0)
+  assert eq(run(g, x), x * 5.0)
+
+def test_equal_closure_values():
+  x = np.ones(3)
+  # 0.0 == -0.0, so both functions share a translation,
+  # but each one still has to compute with its own value
+  assert not np.any(np.signbit(run(make_scaler(0.0), x)))
+  assert np.all(np.signbit(run(make_scaler(-0.0), x)))
+  assert not np.any(np.signbit(jit(make_scaler(0.0))(x)))
+  assert np.all(np.signbit(jit(make_scaler(-0.0))(x)))
+
+def make_offset(offset):
+  def add_offset(x):
+    return x + offset
+  return add_offset
+
+def test_unhashable_closure_values():
+  a = np.ones(3)
+  b = np.zeros(3)
+  x = np.arange(3.0)
+  assert eq(run(make_offset(a), x), x + 1)
+  assert eq(run(make_offset(b), x), x)
+  assert eq(run(make_offset(a), x), x + 1)
+
+if __name__ == '__main__':
+  run_local_tests()
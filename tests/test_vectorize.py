@@ -0,0 +1,139 @@
+import numpy as np
+
+import parakeet
+
+from parakeet.core_types import VectorT
+from parakeet.pipeline import lowering
+from testing_helpers import expect, run_local_tests, with_config
+
+vectorized = with_config(opt_vectorize = True)
+
+def uses_vectors(fn, args):
+  typed_fn = parakeet.typed_repr(fn, args)
+  lowered = lowering.apply(typed_fn)
+  return any(isinstance(t, VectorT) for t in lowered.type_env.itervalues())
+
+sizes = [0, 1, 3, 4, 5, 8, 17, 100, 1001]
+
+def sum_loop(x):
+  total = 0.0
+  for i in range(len(x)):
+    total = total + x[i]
+  return total
+
+@vectorized
+def test_sum_loop():
+  for n in sizes:
+    x = np.arange(n, dtype = 'float64')
+    expect(sum_loop, [x], np.sum(x))
+  assert uses_vectors(sum_loop, [np.arange(10.0)])
+
+def dot_loop(x, y):
+  total = 0.0
+  for i in range(len(x)):
+    total = total + x[i] * y[i]
+  return total
+
+@vectorized
+def test_dot_loop():
+  for n in sizes:
+    x = np.random.randn(n)
+    y = np.random.randn(n)
+    expect(dot_loop, [x, y], np.dot(x, y))
+
+def adverb_sum(x):
+  return parakeet.sum(x)
+
+@vectorized
+def test_adverb_sum():
+  for dtype in ('int32', 'int64', 'float32', 'float64'):
+    for n in sizes[1:]:
+      x = np.arange(n, dtype = dtype)
+      expect(adverb_sum, [x], np.sum(x))
+
+def adverb_dot(x, y):
+  return parakeet.sum(x * y)
+
+@vectorized
+def test_adverb_dot():
+  for n in sizes[1:]:
+    x = np.random.randn(n)
+    y = np.random.randn(n)
+    expect(adverb_dot, [x, y], np.dot(x, y))
+
+def max_loop(x, init):
+  best = init
+  for i in range(len(x)):
+    best = np.maximum(best, x[i])
+  return best
+
+def min_loop(x, init):
+  best = init
+  for i in range(len(x)):
+    best = np.minimum(best, x[i])
+  return best
+
+@vectorized
+def test_min_max_loops():
+  for n in sizes:
+    x = np.random.randn(n) * 10
+    # every vector lane starts out from the initial value, so try
+    # ones on either side of all the elements and one in between
+    for init in (-1000.0, 1000.0, 0.5):
+      expect(max_loop, [x, init], max([init] + list(x)))
+      expect(min_loop, [x, init], min([init] + list(x)))
+  assert uses_vectors(max_loop, [np.arange(10.0), 0.0])
+  assert uses_vectors(min_loop, [np.arange(10.0), 0.0])
+
+def adverb_max(x):
+  return parakeet.max(x)
+
+def adverb_min(x):
+  return parakeet.min(x)
+
+@vectorized
+def test_adverb_min_max():
+  for dtype in ('int32', 'int64', 'float32', 'float64'):
+    for n in sizes[1:]:
+      x = (np.random.randn(n) * 100).astype(dtype)
+      expect(adverb_max, [x], np.max(x))
+      expect(adverb_min, [x], np.min(x))
+
+def saxpy(a, x, y):
+  return a * x + y
+
+@vectorized
+def test_map():
+  for dtype in ('int32', 'int64', 'float32', 'float64'):
+    for n in sizes[1:]:
+      x = np.arange(n, dtype = dtype)
+      y = np.arange(n, dtype = dtype)[::-1].copy()
+      a = x.dtype.type(3)
+      expect(saxpy, [a, x, y], a * x + y)
+
+@vectorized
+def test_map_2d():
+  x = np.random.randn(7, 13)
+  y = np.random.randn(7, 13)
+  expect(saxpy, [2.0, x, y], 2.0 * x + y)
+
+@vectorized
+def test_strided():
+  # non-unit strides have to take the scalar loops
+  x = np.arange(101.0)
+  expect(sum_loop, [x[::2]], np.sum(x[::2]))
+  expect(adverb_sum, [x[::3]], np.sum(x[::3]))
+  expect(saxpy, [2.0, x[::2], x[1::2]], 2.0 * x[::2] + x[1::2])
+
+def running_sum(x):
+  for i in range(1, len(x)):
+    x[i] = x[i] + x[i-1]
+  return x
+
+@vectorized
+def test_loop_carried_dependence():
+  x = np.arange(20.0)
+  expect(running_sum, [x.copy()], np.cumsum(x))
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,59 @@
+import numpy as np
+
+from parakeet import jit
+from testing_helpers import eq, run_local_tests
+
+@jit
+def add_one(x):
+  return x + 1
+
+def test_fresh_result_owns_memory():
+  x = np.arange(100, dtype = 'float64')
+  y = add_one(x)
+  assert eq(y, x + 1)
+  assert not np.may_share_memory(x, y)
+  # result's data lives as long as any view of it
+  z = y[10:20]
+  del y
+  assert eq(z, np.arange(11, 21))
+
+@jit
+def identity(x):
+  return x
+
+@jit
+def tail(x):
+  return x[1:]
+
+def test_result_aliases_input():
+  x = np.arange(10)
+  y = identity(x)
+  assert eq(y, x)
+  assert np.may_share_memory(x, y)
+  z = tail(x)
+  assert eq(z, x[1:])
+  x[5] = 100
+  assert z[4] == 100
+
+def test_list_input():
+  assert eq(tail([1, 2, 3]), [2, 3])
+
+@jit
+def with_copy(x):
+  return x, x + 1
+
+def test_tuple_result():
+  x = np.ones(5)
+  y, z = with_copy(x)
+  assert np.may_share_memory(x, y)
+  assert not np.may_share_memory(x, z)
+  assert eq(z, x + 1)
+
+def test_roundtrip():
+  x = np.arange(20)
+  y = add_one(x)
+  assert eq(tail(y), x[1:] + 1)
+  assert np.may_share_memory(tail(y), y)
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -5,7 +5,8 @@ import numpy as np
 from nose.tools import nottest
 
 import parakeet
-from parakeet import ast_conversion, interp, type_conv, type_inference
+from parakeet import ast_conversion, autotune, compile_cache, config
+from parakeet import function_registry, interp, type_conv, type_inference
 from parakeet.run_function import specialize_and_compile
 
 def run_local_functions(prefix, locals_dict = None):
@@ -34,6 +35,46 @@ def run_local_tests(locals_dict = None):
     locals_dict = last_frame.f_back.f_locals
   return run_local_functions("test_", locals_dict)
 
+class with_config(object):
+  """
+  Change some config settings for the duration of a test, restoring their
+  previous values afterwards. Works both as a decorator and around a block:
+
+    @with_config(num_threads = 4)
+    def test_threads(): ...
+
+    with with_config(opt_tiling = True): ...
+
+  This is autotune.Settings, plus clearing the compile caches on the way in
+  and out, since code compiled with one setting shouldn't be reused with
+  another.
+  """
+
+  def __init__(self, **settings):
+    for name in settings:
+      assert hasattr(config, name), "Unknown config setting %s" % name
+    self.settings = settings
+    self.active = []
+
+  def __enter__(self):
+    settings = autotune.Settings(self.settings)
+    settings.__enter__()
+    self.active.append(settings)
+    compile_cache.clear()
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    self.active.pop().__exit__(exc_type, exc_value, tb)
+    compile_cache.clear()
+    return False
+
+  def __call__(self, test):
+    def wrapper(*args, **kwargs):
+      with self:
+        return test(*args, **kwargs)
+    wrapper.__name__ = test.__name__
+    return wrapper
+
 def eq(x,y):
   if isinstance(x, np.ndarray) and not isinstance(y, np.ndarray):
     return False
@@ -101,7 +142,7 @@ def expect_allpairs(parakeet_fn, python_fn, inputs):
 
 def return_type(fn, input_types):
   untyped_fundef = ast_conversion.translate_function_value(fn)
-  closure_args = untyped_fundef.python_nonlocals()
+  closure_args = function_registry.python_nonlocals(fn, untyped_fundef)
   closure_arg_types = map(type_conv.typeof, closure_args)
   return type_inference.infer_return_type(untyped_fundef,
                                           closure_arg_types + input_types)